@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 """
 autocoder.py — Autonomous multi-file coding agent (Ollama) with:
-- Preflight pip installs + auto-install missing imports
+- Preflight pip installs + auto-install missing imports (one batched pip call from a static import scan)
+- Per-project virtualenvs (--venv) pooled by requirements hash, with a shared offline wheelhouse
 - Visual Studio Code handoff (open/focus + live edits)
 - Scriptable CLI Agents (single agent, fleets, delegation, IDE<->CLI handoff)
 - Minimal MCP-style integration (databases/APIs/docs via YAML connectors)
 - Exec runner with colored streaming output and basic Python error surfacing
+- Pluggable LLM backends: Ollama HTTP API (pooled keep-alive, model pinning) or `ollama run`
+- Warm runner (--warm): a forkserver with the project's dependencies pre-imported runs each iteration
+- Run-result cache: an unchanged tree/entry/environment replays its last result (--no-run-cache to force)
+- Ignore-aware project walker: .gitignore/.autocoderignore, virtualenvs, binaries and huge files stay out of prompts
+- Streaming generation (--stream): files are written as soon as each one completes
+- Patch edit format (--edit-format diff): search/replace or unified-diff edits instead of whole files
+- Daemon mode (serve): commands forward over a Unix socket to a process with hot clients, indexes and caches
 
 Quick examples
 --------------
@@ -16,15 +24,18 @@ Create + open in VS Code + auto-fix:
 Extend later (edits files, reinstalls requirements if changed), keep VS Code open:
   python autocoder.py edit --dir projects/api "Add /multiply and unit tests" --vscode
 
-Run once (no LLM), stream output:
-  python autocoder.py run --dir projects/api
+Speculative repair: 4 candidate fixes per iteration, first one that runs wins:
+  python autocoder.py fix --dir projects/api --candidates 4
+
+Run once (no LLM), stream output (--sandbox: in a throwaway copy-on-write clone):
+  python autocoder.py run --dir projects/api --sandbox
 
 Agent run (scriptable):
   python autocoder.py agent run --dir projects/api --name builder \
     --goal "Add pagination to /items and write tests"
 
 Fleet run (parallel agents):
-  python autocoder.py fleet run --dir projects/api plan.json
+  python autocoder.py fleet run --dir projects/api plan.json --workers 4 --on-conflict merge
 
 Delegate sub-task between agents:
   python autocoder.py delegate --dir projects/api --from builder --to fixer \
@@ -37,22 +48,73 @@ MCP call (connectors in mcp_config.yaml):
 Execute shell in project (stream output; stderr is red):
   python autocoder.py exec --dir projects/api "pytest -q"
 
+Project history (a checkpoint is recorded after every fix iteration, edit and agent):
+  python autocoder.py checkpoints list --dir projects/api
+  python autocoder.py checkpoints diff --dir projects/api 0003
+  python autocoder.py checkpoints restore --dir projects/api 0003
+
+Benchmark autocoder's own overhead offline (mock model server), compare with a baseline:
+  python autocoder.py bench --sizes 10,1000 --out base.json
+  python autocoder.py bench --sizes 10,1000 --compare base.json
+
+Where does the time go? (every run appends spans to .autocoder/trace.jsonl)
+  python autocoder.py fix --dir projects/api --trace-chrome fix.trace.json
+  python autocoder.py stats --dir projects/api --runs 10
+
+Snapshots are sized to the model's context window (sent to Ollama as num_ctx); files that don't
+fit are sent as outlines.
+Override/add windows in ./autocoder_models.json (or $AUTOCODER_MODELS): {"my-model:7b": 65536}
+
+Keep a daemon with hot caches; every other invocation forwards to it while it runs
+(AUTOCODER_NO_DAEMON=1 to bypass, AUTOCODER_SOCKET to pick the socket):
+  python autocoder.py serve --idle-timeout 3600 &
+  python autocoder.py run --dir projects/api
+  python autocoder.py serve --stop
+
+Batch: one JSON job per line ({"op": "new|edit|fix|run", "dir", "task"/"instruction", "model", ...});
+one result line per job, --resume picks up after an interruption:
+  python autocoder.py batch jobs.jsonl --workers 8 --out results.jsonl
+  python autocoder.py batch jobs.jsonl --workers 8 --out results.jsonl --resume
+
+Inspect / prune the on-disk LLM response cache (replay offline with --cache-only):
+  python autocoder.py cache stats
+  python autocoder.py cache prune --max-mb 200
+
+Pick the LLM backend (default: auto = HTTP API if reachable, else `ollama run`):
+  python autocoder.py fix --dir projects/api --backend http --keep-alive 1h --llm-timeout 300
+
+Unit tests (parser, patches, ignore rules, checkpoints):
+  python -m pytest -q tests
+
 Build an .exe (Windows):
   pip install pyinstaller
   pyinstaller --onefile autocoder.py
 """
 import argparse
+import atexit
+import difflib
+import filecmp
+import fnmatch
+import functools
+import hashlib
+import http.client
 import json
+import math
 import os
+import queue
 import re
 import shlex
+import shutil
 import subprocess
 import sys
+import tempfile
 import textwrap
 import threading
 import time
+import urllib.parse
+import zlib
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional, Union
 
 # ----------------------------
 # Config
@@ -60,7 +122,34 @@ from typing import Dict, List, Tuple, Optional
 DEFAULT_MODEL = "qwen3-coder:480b-cloud"
 DEFAULT_ENTRY = "main.py"
 MANIFEST_NAME = ".autocoder_manifest.json"
-MAX_SNAPSHOT_BYTES = 200_000
+INDEX_NAME = ".autocoder_index.json"    # per-project file index (size/mtime/hash/text), see snapshot_blocks
+FLEET_STATE_NAME = ".autocoder_fleet_state.json"   # per-agent progress of the last fleet plan (for --resume)
+RUNS_NAME = ".autocoder_runs.json"       # cached run results keyed by tree/entry/interpreter/environment
+HANDOFF_NAME = ".autocoder_handoff.md"   # append-only log of changes for the IDE side
+STATE_FILES = {MANIFEST_NAME, INDEX_NAME, FLEET_STATE_NAME, RUNS_NAME, HANDOFF_NAME}
+MAX_CACHED_RUNS = 32
+STATE_DIR = ".autocoder"                 # per-project state directory (checkpoints, ...); never part of the tree
+INDEX_TEXT_LIMIT = 64_000               # decoded text is persisted in the index file only for files up to this size
+BYTES_PER_TOKEN = 4            # rough size of a token in source text, for budgeting prompts
+SNAPSHOT_CONTEXT_SHARE = 0.6   # part of the model's context window a snapshot may fill (rest: prompt, error, reply)
+DEFAULT_CONTEXT_TOKENS = 32_768
+OLLAMA_DEFAULT_CONTEXT = 4_096  # num_ctx Ollama uses when a request sets none ($OLLAMA_CONTEXT_LENGTH overrides)
+MODEL_CONTEXT = {              # context window (tokens) by model name, name without tag, or name prefix
+    "qwen3-coder": 262_144,
+    "qwen2.5-coder": 32_768,
+    "deepseek-coder-v2": 163_840,
+    "deepseek-coder": 16_384,
+    "codellama": 16_384,
+    "codestral": 32_768,
+    "llama3.1": 131_072,
+    "llama3.2": 131_072,
+    "llama3": 8_192,
+    "mistral": 32_768,
+    "gpt-oss": 131_072,
+    "gemma3": 131_072,
+}
+MODELS_CONFIG_FILE = "autocoder_models.json"   # optional overrides {"model": tokens}; see model_context_tokens
+MAX_ERROR_CHARS = 8_000        # error text sent to FIX_PROMPT is tail-truncated to this
 AUTO_PIP_DEFAULT = True
 MCP_CONFIG_FILE = "mcp_config.yaml"  # optional; per-project
 
@@ -72,78 +161,1235 @@ ANSI_BLUE = "\033[34m"
 ANSI_YELLOW = "\033[33m"
 ANSI_DIM = "\033[2m"
 
+# ----------------------------
+# Tracing (per-phase spans)
+# ----------------------------
+# Each traced phase appends one JSON line to <project>/.autocoder/trace.jsonl:
+# {"run", "phase", "start", "dur", "thread", <context: iteration/agent/candidate>, <phase fields>}.
+# With --trace-chrome the same spans are also written in Chrome trace format
+# (load in chrome://tracing or Perfetto). `stats` aggregates the log.
+TRACE_NAME = "trace.jsonl"
+TRACE_MAX_BYTES = 20_000_000   # the log is rotated to trace.jsonl.1 past this size
+_TRACE: Dict = {"file": None, "chrome": None, "events": [], "run": "", "command": "", "start": 0.0, "seq": 0}
+_TRACE_LOCK = threading.Lock()
+_TRACE_LOCAL = threading.local()   # .ctx: context fields, .spans: open spans, .usage: last model token counts
+
+def configure_tracing(root: Optional[Path], chrome: Optional[str] = None, enabled: bool = True, command: str = ""):
+    with _TRACE_LOCK:
+        if _TRACE["file"] is not None:
+            _TRACE["file"].close()
+        # serve configures tracing per command in one process: the sequence number keeps run ids unique.
+        _TRACE["seq"] += 1
+        _TRACE.update(file=None, chrome=chrome, events=[], command=command, start=time.time(),
+                      run=f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{_TRACE['seq']}")
+        if not enabled or root is None:
+            return
+        path = root / STATE_DIR / TRACE_NAME
+        try:
+            ensure_dir(path.parent)
+            if path.exists() and path.stat().st_size > TRACE_MAX_BYTES:
+                os.replace(path, path.with_name(TRACE_NAME + ".1"))
+            _TRACE["file"] = open(path, "a", encoding="utf-8")
+        except OSError as e:
+            print(f"{ANSI_YELLOW}[!] Tracing disabled: {e}{ANSI_RESET}")
+
+def tracing_enabled() -> bool:
+    return _TRACE["file"] is not None or _TRACE["chrome"] is not None
+
+def trace_context() -> Dict:
+    return dict(getattr(_TRACE_LOCAL, "ctx", None) or {})
+
+def set_trace_context(**fields):
+    """Attach fields (iteration=, agent=, ...) to every span this thread records from now on."""
+    ctx = trace_context()
+    ctx.update(fields)
+    _TRACE_LOCAL.ctx = {k: v for k, v in ctx.items() if v is not None}
+
+def in_trace_context(ctx: Dict, fn, *args, **kwargs):
+    """Call fn with the given trace context (for work handed to pool threads)."""
+    prev = getattr(_TRACE_LOCAL, "ctx", None)
+    _TRACE_LOCAL.ctx = dict(ctx)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _TRACE_LOCAL.ctx = prev
+
+def trace_note(**fields):
+    """Add fields to the innermost open span of this thread."""
+    spans = getattr(_TRACE_LOCAL, "spans", None)
+    if spans:
+        spans[-1].fields.update(fields)
+
+def note_usage(result: Dict):
+    """Remember token counts from an Ollama response for the enclosing "llm" span."""
+    usage = {"prompt_tokens": result.get("prompt_eval_count"), "response_tokens": result.get("eval_count")}
+    _TRACE_LOCAL.usage = {k: v for k, v in usage.items() if v is not None}
+
+def take_usage() -> Dict:
+    usage = getattr(_TRACE_LOCAL, "usage", None) or {}
+    _TRACE_LOCAL.usage = None
+    return usage
+
+def _emit_span(record: Dict):
+    with _TRACE_LOCK:
+        f = _TRACE["file"]
+        if f is not None:
+            try:
+                f.write(json.dumps(record, default=str) + "\n")
+                f.flush()
+            except (OSError, ValueError):
+                pass
+        if _TRACE["chrome"] is not None:
+            args = {k: v for k, v in record.items() if k not in ("phase", "start", "dur", "run")}
+            _TRACE["events"].append({"name": record["phase"], "cat": "autocoder", "ph": "X",
+                                     "ts": int(record["start"] * 1e6), "dur": int(record["dur"] * 1e6),
+                                     "pid": os.getpid(), "tid": threading.get_native_id(), "args": args})
+
+class Span:
+    """
+    Times one phase; use as a context manager. Fields can be added until it
+    closes (see trace_note). A span that must stay open while control leaves
+    the code that opened it (a generator between yields) uses begin()/end()
+    instead, so it never sits on the thread's stack of open spans.
+    """
+
+    def __init__(self, phase: str, **fields):
+        self.phase = phase
+        self.fields = fields
+
+    def begin(self) -> "Span":
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        self.ctx = trace_context()
+        return self
+
+    def end(self, exc_type=None):
+        if not tracing_enabled():
+            return
+        record = {"run": _TRACE["run"], "phase": self.phase, "start": round(self.start, 6),
+                  "dur": round(time.perf_counter() - self.t0, 6), "thread": threading.current_thread().name}
+        record.update(self.ctx)
+        record.update(self.fields)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            record["error"] = exc_type.__name__
+        _emit_span(record)
+
+    def __enter__(self) -> "Span":
+        self.begin()
+        spans = getattr(_TRACE_LOCAL, "spans", None)
+        if spans is None:
+            spans = _TRACE_LOCAL.spans = []
+        spans.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _TRACE_LOCAL.spans.pop()
+        self.ctx = trace_context()      # include context set while the span was open
+        self.end(exc_type)
+        return False
+
+def traced(phase: str, result_fields=None):
+    """Decorator: record a span per call; context fields set inside the call don't leak out of it."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            prev = getattr(_TRACE_LOCAL, "ctx", None)
+            try:
+                with Span(phase) as sp:
+                    result = fn(*args, **kwargs)
+                    if result_fields is not None:
+                        sp.fields.update(result_fields(result))
+                    return result
+            finally:
+                _TRACE_LOCAL.ctx = prev
+        return inner
+    return wrap
+
+def finish_tracing():
+    """Emit the whole-command span, write the Chrome trace and close the log (at exit, or per command in serve)."""
+    if _TRACE["command"] and tracing_enabled():
+        _emit_span({"run": _TRACE["run"], "phase": f"command:{_TRACE['command']}", "start": round(_TRACE["start"], 6),
+                    "dur": round(time.time() - _TRACE["start"], 6), "thread": threading.current_thread().name})
+    with _TRACE_LOCK:
+        if _TRACE["chrome"]:
+            try:
+                Path(_TRACE["chrome"]).write_text(json.dumps({"traceEvents": _TRACE["events"]}), encoding="utf-8")
+            except OSError:
+                pass
+        if _TRACE["file"] is not None:
+            _TRACE["file"].close()
+        _TRACE.update(file=None, chrome=None, command="")
+
+atexit.register(finish_tracing)
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+def trace_stats(root: Path, runs: Optional[int] = None) -> Dict[str, Dict]:
+    """Per-phase aggregates (model calls split by prompt template) over the last `runs` runs."""
+    path = root / STATE_DIR / TRACE_NAME
+    records = []
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    if runs:
+        keep = list(dict.fromkeys(r.get("run") for r in records))[-runs:]
+        records = [r for r in records if r.get("run") in set(keep)]
+    groups: Dict[str, Dict] = {}
+    for r in records:
+        key = r.get("phase", "?")
+        if key == "llm" and r.get("template"):
+            key = f"llm:{r['template']}"
+        g = groups.setdefault(key, {"durs": [], "prompt_tokens": 0, "response_tokens": 0, "errors": 0, "runs": set()})
+        g["durs"].append(float(r.get("dur", 0)))
+        g["prompt_tokens"] += r.get("prompt_tokens") or 0
+        g["response_tokens"] += r.get("response_tokens") or 0
+        g["errors"] += 1 if r.get("error") else 0
+        g["runs"].add(r.get("run"))
+    stats = {}
+    for key, g in groups.items():
+        d = sorted(g["durs"])
+        stats[key] = {"count": len(d), "runs": len(g["runs"]), "total": sum(d), "p50": _percentile(d, 50),
+                      "p95": _percentile(d, 95), "max": d[-1], "prompt_tokens": g["prompt_tokens"],
+                      "response_tokens": g["response_tokens"], "errors": g["errors"]}
+    return stats
+
+def stats_command(root: Path, runs: Optional[int] = None, as_json: bool = False):
+    stats = trace_stats(root, runs)
+    if as_json:
+        print(json.dumps(stats, indent=2))
+        return
+    if not stats:
+        print(f"{ANSI_DIM}No trace data in {root / STATE_DIR / TRACE_NAME}.{ANSI_RESET}")
+        return
+    print(f"{'phase':<24} {'count':>6} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'tok in':>9} {'tok out':>9}")
+    for key, s in sorted(stats.items(), key=lambda kv: -kv[1]["total"]):
+        err = f" {ANSI_RED}({s['errors']} failed){ANSI_RESET}" if s["errors"] else ""
+        print(f"{key:<24} {s['count']:>6} {s['total']:>9.2f} {s['p50'] * 1000:>9.1f} {s['p95'] * 1000:>9.1f} "
+              f"{s['max'] * 1000:>9.1f} {s['prompt_tokens']:>9} {s['response_tokens']:>9}{err}")
+
 # ----------------------------
 # Ollama helpers
 # ----------------------------
-def ollama_run(model: str, prompt: str) -> str:
-    proc = subprocess.run(
-        ["ollama", "run", model],
-        input=prompt,
-        text=True,
-        capture_output=True
-    )
-    if proc.returncode != 0:
-        raise RuntimeError(f"Ollama error: {proc.stderr.strip() or proc.stdout.strip()}")
-    return proc.stdout
+OLLAMA_HOST_DEFAULT = "http://127.0.0.1:11434"
+BACKEND_CHOICES = ("auto", "http", "subprocess")
+DEFAULT_BACKEND = "auto"
+DEFAULT_KEEP_ALIVE = "30m"     # how long the server keeps the model loaded between calls
+DEFAULT_LLM_TIMEOUT = 600.0    # seconds per request
+DEFAULT_LLM_RETRIES = 2
+HTTP_POOL_SIZE = 8
+
+class SubprocessBackend:
+    """Spawns `ollama run <model>` per call (no keep-alive/options control)."""
+    name = "subprocess"
+
+    def __init__(self, timeout: Optional[float] = DEFAULT_LLM_TIMEOUT):
+        self.timeout = timeout
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict] = None) -> str:
+        try:
+            proc = subprocess.run(
+                ["ollama", "run", model],
+                input=prompt,
+                text=True,
+                capture_output=True,
+                timeout=self.timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"Ollama error: `ollama run {model}` timed out after {self.timeout}s")
+        if proc.returncode != 0:
+            raise RuntimeError(f"Ollama error: {proc.stderr.strip() or proc.stdout.strip()}")
+        return proc.stdout
+
+    def stream(self, model: str, prompt: str, options: Optional[Dict] = None) -> Iterator[str]:
+        proc = subprocess.Popen(["ollama", "run", model], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+        err_parts: List[str] = []
+
+        def feed():
+            try:
+                proc.stdin.write(prompt)
+                proc.stdin.close()
+            except OSError:
+                pass
+        threads = [threading.Thread(target=feed, daemon=True),
+                   threading.Thread(target=lambda: err_parts.append(proc.stderr.read()), daemon=True)]
+        for t in threads:
+            t.start()
+        try:
+            for line in iter(proc.stdout.readline, ""):
+                yield line
+            proc.wait(timeout=self.timeout)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            for t in threads:
+                t.join()
+        if proc.returncode != 0:
+            raise RuntimeError(f"Ollama error: {''.join(err_parts).strip()}")
+
+class HttpBackend:
+    """
+    Ollama HTTP API client (/api/generate or /api/chat) over a pool of
+    keep-alive connections. The model stays pinned for `keep_alive`.
+    """
+    name = "http"
+
+    def __init__(self, host: Optional[str] = None, keep_alive: str = DEFAULT_KEEP_ALIVE,
+                 timeout: Optional[float] = DEFAULT_LLM_TIMEOUT, retries: int = DEFAULT_LLM_RETRIES,
+                 endpoint: str = "generate", pool_size: int = HTTP_POOL_SIZE):
+        host = host or os.environ.get("OLLAMA_HOST") or OLLAMA_HOST_DEFAULT
+        if "://" not in host:
+            host = "http://" + host
+        url = urllib.parse.urlsplit(host)
+        self.scheme = url.scheme or "http"
+        self.hostname = url.hostname or "127.0.0.1"
+        if self.hostname == "0.0.0.0":
+            self.hostname = "127.0.0.1"
+        self.port = url.port or (443 if self.scheme == "https" else 11434)
+        self.base_path = url.path.rstrip("/")
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.endpoint = endpoint
+        self._pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+
+    @property
+    def url(self) -> str:
+        return f"{self.scheme}://{self.hostname}:{self.port}{self.base_path}"
+
+    def _acquire(self, timeout: Optional[float] = None) -> http.client.HTTPConnection:
+        timeout = timeout or self.timeout
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            return cls(self.hostname, self.port, timeout=timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _release(self, conn: http.client.HTTPConnection):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _open(self, method: str, path: str, payload: Optional[Dict] = None,
+              timeout: Optional[float] = None, retries: Optional[int] = None
+              ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """Send a request (retrying connection errors and 5xx) and return the unread response."""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        attempts = (self.retries if retries is None else retries) + 1
+        last_err: Optional[Exception] = None
+        for attempt in range(attempts):
+            conn = self._acquire(timeout)
+            try:
+                conn.request(method, self.base_path + path, body=body, headers=headers)
+                resp = conn.getresponse()
+                if resp.status < 500:
+                    return conn, resp
+                last_err = RuntimeError(f"HTTP {resp.status}: {resp.read()[:200].decode('utf-8', 'replace')}")
+                self._finish(conn, resp)
+            except (OSError, http.client.HTTPException) as e:
+                # Stale keep-alive socket, refused connection or timeout: drop the connection and retry.
+                conn.close()
+                last_err = e
+            if attempt + 1 < attempts:
+                time.sleep(0.5 * (2 ** attempt))
+        raise ConnectionError(f"Ollama HTTP request to {self.url}{path} failed: {last_err}")
+
+    def _finish(self, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse):
+        if resp.will_close or not resp.isclosed():
+            conn.close()
+        else:
+            self._release(conn)
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None,
+                 timeout: Optional[float] = None, retries: Optional[int] = None) -> Tuple[int, bytes]:
+        conn, resp = self._open(method, path, payload, timeout, retries)
+        try:
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise ConnectionError(f"Ollama HTTP response from {self.url}{path} failed: {e}")
+        self._finish(conn, resp)
+        return resp.status, data
+
+    def ping(self) -> bool:
+        try:
+            status, _ = self._request("GET", "/api/version", timeout=2.0, retries=0)
+            return status == 200
+        except ConnectionError:
+            return False
+
+    def _payload(self, model: str, prompt: str, options: Optional[Dict], stream: bool) -> Tuple[str, Dict]:
+        payload: Dict = {"model": model, "stream": stream}
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        if options:
+            payload["options"] = options
+        if self.endpoint == "chat":
+            payload["messages"] = [{"role": "user", "content": prompt}]
+            return "/api/chat", payload
+        payload["prompt"] = prompt
+        return "/api/generate", payload
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict] = None) -> str:
+        path, payload = self._payload(model, prompt, options, stream=False)
+        status, data = self._request("POST", path, payload)
+        try:
+            result = json.loads(data.decode("utf-8"))
+        except ValueError:
+            raise RuntimeError(f"Ollama error: invalid JSON response (HTTP {status})")
+        if status != 200 or "error" in result:
+            raise RuntimeError(f"Ollama error: {result.get('error') or f'HTTP {status}'}")
+        note_usage(result)
+        if self.endpoint == "chat":
+            return (result.get("message") or {}).get("content", "")
+        return result.get("response", "")
+
+    def stream(self, model: str, prompt: str, options: Optional[Dict] = None) -> Iterator[str]:
+        path, payload = self._payload(model, prompt, options, stream=True)
+        conn, resp = self._open("POST", path, payload)
+        try:
+            if resp.status != 200:
+                data = resp.read().decode("utf-8", "replace")
+                try:
+                    msg = json.loads(data).get("error") or data
+                except ValueError:
+                    msg = data
+                raise RuntimeError(f"Ollama error: {msg or f'HTTP {resp.status}'}")
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    # Not Ollama's NDJSON (a proxy page, a cut-off line): treat like a broken connection.
+                    conn.close()
+                    raise ConnectionError(f"Ollama stream from {self.url}{path} returned malformed data: "
+                                          f"{line[:200].decode('utf-8', 'replace').strip()!r}")
+                if "error" in event:
+                    raise RuntimeError(f"Ollama error: {event['error']}")
+                if self.endpoint == "chat":
+                    piece = (event.get("message") or {}).get("content", "")
+                else:
+                    piece = event.get("response", "")
+                if piece:
+                    yield piece
+                if event.get("done"):
+                    note_usage(event)
+                    resp.read()
+                    break
+        except ConnectionError:
+            raise
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise ConnectionError(f"Ollama stream from {self.url}{path} failed: {e}")
+        finally:
+            self._finish(conn, resp)
+
+class AutoBackend:
+    """HTTP when the Ollama server answers, otherwise (or on connection failure) `ollama run`."""
+    name = "auto"
+
+    def __init__(self, http_backend: HttpBackend, fallback: SubprocessBackend):
+        self.http = http_backend
+        self.fallback = fallback
+        self._use_http: Optional[bool] = None
+
+    def _primary(self):
+        if self._use_http is None:
+            self._use_http = self.http.ping()
+            if not self._use_http:
+                print(f"{ANSI_YELLOW}[!] Ollama API not reachable at {self.http.url}; "
+                      f"falling back to `ollama run`.{ANSI_RESET}")
+        return self.http if self._use_http else self.fallback
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict] = None) -> str:
+        backend = self._primary()
+        try:
+            return backend.generate(model, prompt, options)
+        except ConnectionError as e:
+            if backend is self.fallback:
+                raise
+            print(f"{ANSI_YELLOW}[!] {e}; retrying via `ollama run`.{ANSI_RESET}")
+            return self.fallback.generate(model, prompt, options)
+
+    def stream(self, model: str, prompt: str, options: Optional[Dict] = None) -> Iterator[str]:
+        backend = self._primary()
+        started = False
+        try:
+            for piece in backend.stream(model, prompt, options):
+                started = True
+                yield piece
+        except ConnectionError as e:
+            # Only fall back if nothing was emitted yet; a half-delivered stream can't be replayed.
+            if backend is self.fallback or started:
+                raise
+            print(f"{ANSI_YELLOW}[!] {e}; retrying via `ollama run`.{ANSI_RESET}")
+            yield from self.fallback.stream(model, prompt, options)
+
+_BACKEND = None
+_BACKEND_SETTINGS: Dict = {}
+_BACKEND_LOCK = threading.Lock()
+
+def configure_backend(kind: str = DEFAULT_BACKEND, host: Optional[str] = None,
+                      keep_alive: str = DEFAULT_KEEP_ALIVE, timeout: Optional[float] = DEFAULT_LLM_TIMEOUT,
+                      retries: int = DEFAULT_LLM_RETRIES, endpoint: str = "generate"):
+    """Select the LLM backend; it is built lazily on first use."""
+    global _BACKEND
+    if kind not in BACKEND_CHOICES:
+        raise ValueError(f"Unknown backend: {kind}")
+    # $OLLAMA_HOST is part of the settings: under serve each command brings its client's environment.
+    settings = dict(kind=kind, host=host, keep_alive=keep_alive, timeout=timeout, retries=retries, endpoint=endpoint,
+                    env_host=os.environ.get("OLLAMA_HOST"))
+    with _BACKEND_LOCK:
+        if settings == _BACKEND_SETTINGS:
+            return   # keep the pooled connections (serve runs many commands in one process)
+        _BACKEND = None
+        _BACKEND_SETTINGS.clear()
+        _BACKEND_SETTINGS.update(settings)
+
+def get_backend():
+    global _BACKEND
+    with _BACKEND_LOCK:
+        if _BACKEND is None:
+            s = _BACKEND_SETTINGS or {"kind": DEFAULT_BACKEND}
+            fallback = SubprocessBackend(timeout=s.get("timeout", DEFAULT_LLM_TIMEOUT))
+            if s["kind"] == "subprocess":
+                _BACKEND = fallback
+            else:
+                http_backend = HttpBackend(host=s.get("host"), keep_alive=s.get("keep_alive", DEFAULT_KEEP_ALIVE),
+                                           timeout=s.get("timeout", DEFAULT_LLM_TIMEOUT),
+                                           retries=s.get("retries", DEFAULT_LLM_RETRIES),
+                                           endpoint=s.get("endpoint", "generate"))
+                _BACKEND = http_backend if s["kind"] == "http" else AutoBackend(http_backend, fallback)
+        return _BACKEND
+
+def llm_options(model: str, options: Optional[Dict] = None) -> Dict:
+    """Generation options for a request: num_ctx set to the window prompts are sized for, then `options`."""
+    return dict({"num_ctx": model_context_tokens(model)}, **(options or {}))
+
+def ollama_run(model: str, prompt: str, options: Optional[Dict] = None, template: str = "") -> str:
+    options = llm_options(model, options)
+    with Span("llm", model=model, template=template, prompt_bytes=len(prompt.encode("utf-8"))) as sp:
+        cache = get_llm_cache()
+        key = cache.key(model, template, prompt, options) if cache else ""
+        if cache:
+            hit = cache.get(key)
+            if hit is not None:
+                sp.fields.update(cached=True, response_bytes=len(hit.encode("utf-8")))
+                return hit
+        take_usage()
+        resp = get_backend().generate(model, prompt, options)
+        sp.fields.update(response_bytes=len(resp.encode("utf-8")), **take_usage())
+        if cache:
+            cache.put(key, model, template, resp)
+        return resp
+
+def ollama_stream(model: str, prompt: str, options: Optional[Dict] = None, template: str = "") -> Iterator[str]:
+    """Yield response text chunks as the model produces them."""
+    options = llm_options(model, options)
+    # The caller runs (and opens its own spans) between chunks, so this span is kept off the stack.
+    sp = Span("llm", model=model, template=template, prompt_bytes=len(prompt.encode("utf-8")), stream=True).begin()
+    exc_type = None
+    try:
+        cache = get_llm_cache()
+        key = cache.key(model, template, prompt, options) if cache else ""
+        hit = cache.get(key) if cache else None
+        if hit is not None:
+            sp.fields.update(cached=True, response_bytes=len(hit.encode("utf-8")))
+            yield hit
+            return
+        take_usage()
+        parts: List[str] = []
+        for piece in get_backend().stream(model, prompt, options):
+            parts.append(piece)
+            yield piece
+        text = "".join(parts)
+        sp.fields.update(response_bytes=len(text.encode("utf-8")), **take_usage())
+        if cache:
+            cache.put(key, model, template, text)
+    except BaseException as e:
+        exc_type = type(e)
+        raise
+    finally:
+        sp.end(exc_type)
+
+# ----------------------------
+# LLM response cache
+# ----------------------------
+CACHE_MODES = ("on", "off", "only")
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+def user_cache_dir() -> Path:
+    env = os.environ.get("AUTOCODER_CACHE_DIR")
+    if env:
+        return Path(env)
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local")
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return base / "autocoder"
+
+class LLMCache:
+    """
+    Content-addressed store of model responses keyed by
+    sha256(model, prompt template id, rendered prompt, generation options).
+    Backed by SQLite so concurrent runs can share it; evicts least recently
+    used entries once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_CACHE_MAX_BYTES, cache_only: bool = False):
+        import sqlite3
+        ensure_dir(path.parent)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._con.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, model TEXT, template TEXT, response TEXT,
+                size INTEGER, created REAL, last_access REAL, hits INTEGER DEFAULT 0);
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER);
+        """)
+        self._con.commit()
+
+    @staticmethod
+    def key(model: str, template: str, prompt: str, options: Optional[Dict] = None) -> str:
+        blob = json.dumps([model, template, prompt, options or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _bump(self, name: str):
+        self._con.execute("INSERT INTO stats(name, value) VALUES (?, 1) "
+                          "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._con.execute("SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._con.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                                  (time.time(), key))
+            self._bump("hits" if row else "misses")
+            self._con.commit()
+        if row:
+            return row[0]
+        if self.cache_only:
+            raise RuntimeError("LLM cache miss in --cache-only mode.")
+        return None
+
+    def put(self, key: str, model: str, template: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO entries(key, model, template, response, size, created, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, model, template, response, len(response.encode("utf-8")), now, now))
+            self._con.commit()
+        self.prune()
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """Evict LRU entries until the cache fits; returns (entries removed, bytes freed)."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed = freed = 0
+        with self._lock:
+            total = self._con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= limit:
+                return 0, 0
+            victims = []
+            for key, size in self._con.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if total <= limit:
+                    break
+                victims.append((key,))
+                total -= size
+                freed += size
+            self._con.executemany("DELETE FROM entries WHERE key = ?", victims)
+            self._con.commit()
+            removed = len(victims)
+        return removed, freed
+
+    def clear(self) -> int:
+        with self._lock:
+            n = self._con.execute("DELETE FROM entries").rowcount
+            self._con.execute("DELETE FROM stats")
+            self._con.commit()
+        return n
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, size = self._con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = dict(self._con.execute("SELECT name, value FROM stats").fetchall())
+        return {"path": str(self.path), "entries": count, "bytes": size, "max_bytes": self.max_bytes,
+                "hits": counters.get("hits", 0), "misses": counters.get("misses", 0)}
+
+    def entries(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            rows = self._con.execute("SELECT key, model, template, size, last_access, hits FROM entries "
+                                     "ORDER BY last_access DESC LIMIT ?", (limit,)).fetchall()
+        return [{"key": k, "model": m, "template": t, "bytes": sz, "last_access": la, "hits": h}
+                for k, m, t, sz, la, h in rows]
+
+_LLM_CACHE: Optional[LLMCache] = None
+_LLM_CACHE_SETTINGS: Dict = {"mode": "on", "max_bytes": DEFAULT_CACHE_MAX_BYTES, "dir": None}
+
+def configure_llm_cache(mode: str = "on", max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+    global _LLM_CACHE
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode: {mode}")
+    settings = {"mode": mode, "max_bytes": max_bytes, "dir": str(user_cache_dir())}
+    with _BACKEND_LOCK:
+        if settings == _LLM_CACHE_SETTINGS:
+            return
+        _LLM_CACHE = None
+        _LLM_CACHE_SETTINGS.update(settings)
+
+def get_llm_cache() -> Optional[LLMCache]:
+    global _LLM_CACHE
+    if _LLM_CACHE_SETTINGS["mode"] == "off":
+        return None
+    with _BACKEND_LOCK:
+        if _LLM_CACHE is None:
+            try:
+                _LLM_CACHE = LLMCache(Path(_LLM_CACHE_SETTINGS["dir"] or user_cache_dir()) / "llm_cache.sqlite3",
+                                      _LLM_CACHE_SETTINGS["max_bytes"],
+                                      cache_only=(_LLM_CACHE_SETTINGS["mode"] == "only"))
+            except Exception as e:
+                if _LLM_CACHE_SETTINGS["mode"] == "only":
+                    raise
+                print(f"{ANSI_YELLOW}[!] LLM cache unavailable ({e}); continuing without it.{ANSI_RESET}")
+                _LLM_CACHE_SETTINGS["mode"] = "off"
+                return None
+        return _LLM_CACHE
+
+def cache_command(action: str, limit: int = 20, max_mb: Optional[float] = None):
+    cache = LLMCache(user_cache_dir() / "llm_cache.sqlite3")
+    if action == "stats":
+        st = cache.stats()
+        lookups = st["hits"] + st["misses"]
+        rate = (100.0 * st["hits"] / lookups) if lookups else 0.0
+        print(f"{ANSI_BLUE}[*] {st['path']}{ANSI_RESET}")
+        print(f"entries: {st['entries']}  size: {st['bytes'] / 1e6:.1f} MB / {st['max_bytes'] / 1e6:.0f} MB")
+        print(f"hits: {st['hits']}  misses: {st['misses']}  hit rate: {rate:.1f}%")
+    elif action == "list":
+        for e in cache.entries(limit):
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e["last_access"]))
+            print(f"{e['key'][:12]}  {ts}  {e['bytes']:>9}B  hits={e['hits']:<4} {e['model']}  {e['template'] or '-'}")
+    elif action == "prune":
+        limit_bytes = int(max_mb * 1e6) if max_mb is not None else cache.max_bytes
+        removed, freed = cache.prune(limit_bytes)
+        print(f"{ANSI_GREEN}[+] Pruned {removed} entries ({freed / 1e6:.1f} MB).{ANSI_RESET}")
+    elif action == "clear":
+        n = cache.clear()
+        print(f"{ANSI_GREEN}[+] Cleared {n} cached responses.{ANSI_RESET}")
 
 # ----------------------------
 # Pip helpers
 # ----------------------------
-def pip_install_packages(pkgs: List[str]) -> bool:
+def run_relayed(cmd: List[str]) -> int:
+    """subprocess.run(cmd).returncode, but when sys.stdout isn't the real one (serve) output goes through it."""
+    if sys.stdout is sys.__stdout__ and sys.stderr is sys.__stderr__:
+        return subprocess.run(cmd).returncode
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+    for line in proc.stdout:
+        sys.stdout.write(line)
+    return proc.wait()
+
+_PIP_LOCK = threading.RLock()   # one pip/venv operation at a time (batch runs projects concurrently)
+
+@traced("pip")
+def pip_install_packages(pkgs: List[str], python: str = sys.executable) -> bool:
     pkgs = [p.strip() for p in pkgs if p and p.strip()]
     if not pkgs:
         return True
-    print(f"{ANSI_BLUE}[+] pip install {' '.join(pkgs)}{ANSI_RESET}")
-    proc = subprocess.run([sys.executable, "-m", "pip", "install", *pkgs])
-    return proc.returncode == 0
+    with _PIP_LOCK:
+        print(f"{ANSI_BLUE}[+] pip install {' '.join(pkgs)}{ANSI_RESET}")
+        return run_relayed([python, "-m", "pip", "install", *pkgs]) == 0
 
-def pip_install_requirements(requirements_path: Path) -> bool:
+@traced("pip")
+def pip_install_requirements(requirements_path: Path, python: str = sys.executable) -> bool:
     if not requirements_path.exists():
         return True
-    print(f"{ANSI_BLUE}[+] pip install -r {requirements_path}{ANSI_RESET}")
-    proc = subprocess.run([sys.executable, "-m", "pip", "install", "-r", str(requirements_path)])
-    return proc.returncode == 0
+    with _PIP_LOCK:
+        print(f"{ANSI_BLUE}[+] pip install -r {requirements_path}{ANSI_RESET}")
+        return run_relayed([python, "-m", "pip", "install", "-r", str(requirements_path)]) == 0
+
+# Import names whose distribution on PyPI is called something else.
+IMPORT_TO_DIST = {
+    "Crypto": "pycryptodome",
+    "OpenSSL": "pyOpenSSL",
+    "PIL": "Pillow",
+    "attr": "attrs",
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "discord": "discord.py",
+    "docx": "python-docx",
+    "dotenv": "python-dotenv",
+    "fitz": "PyMuPDF",
+    "git": "GitPython",
+    "google.protobuf": "protobuf",
+    "jose": "python-jose",
+    "jwt": "PyJWT",
+    "magic": "python-magic",
+    "multipart": "python-multipart",
+    "pptx": "python-pptx",
+    "psycopg2": "psycopg2-binary",
+    "serial": "pyserial",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "slugify": "python-slugify",
+    "telegram": "python-telegram-bot",
+    "usb": "pyusb",
+    "win32api": "pywin32",
+    "yaml": "PyYAML",
+    "zmq": "pyzmq",
+}
+
+def dist_for_import(mod: str) -> str:
+    """Best-guess PyPI distribution for an import name."""
+    if mod in IMPORT_TO_DIST:
+        return IMPORT_TO_DIST[mod]
+    root = mod.split(".")[0]
+    return IMPORT_TO_DIST.get(root, root.replace("_", "-"))
+
+def module_available(mod: str) -> bool:
+    import importlib.util
+    try:
+        return importlib.util.find_spec(mod) is not None
+    except (ImportError, ValueError):
+        return False
+
+def missing_modules(mods: List[str], python: str = sys.executable) -> List[str]:
+    """The subset of `mods` that `python` cannot import."""
+    if python == sys.executable or not mods:
+        return [m for m in mods if not module_available(m)]
+    probe = ("import importlib.util, json, sys\n"
+             "def ok(m):\n"
+             "    try: return importlib.util.find_spec(m) is not None\n"
+             "    except Exception: return False\n"
+             "print(json.dumps([m for m in sys.argv[1:] if not ok(m)]))")
+    proc = subprocess.run([python, "-c", probe, *mods], capture_output=True, text=True)
+    try:
+        return json.loads(proc.stdout)
+    except ValueError:
+        return list(mods)
+
+@traced("import_scan")
+def install_missing_imports(root: Path, auto_pip: bool) -> List[str]:
+    """
+    Statically scan the project's imports and pip-install every third-party
+    module that is not importable, in a single pip invocation. Optional
+    (try/except-guarded) and function-level imports are not installed up
+    front; if one turns out to be needed, the run's ModuleNotFoundError
+    installs it. Returns the distributions that were installed.
+    """
+    if not auto_pip:
+        return []
+    import importlib
+    python = project_python(root)
+    missing = missing_modules(scan_third_party_imports(root, required_only=True), python)
+    if not missing:
+        return []
+    dists = sorted({dist_for_import(m) for m in missing}, key=str.lower)
+    print(f"{ANSI_BLUE}[+] Missing imports: {', '.join(missing)}{ANSI_RESET}")
+    if python != sys.executable:
+        return dists if add_env_requirements(root, dists) else []
+    if not pip_install_packages(dists, python):
+        print(f"{ANSI_YELLOW}[!] Batched install failed; missing modules will be retried one at a time.{ANSI_RESET}")
+        return []
+    importlib.invalidate_caches()
+    return dists
 
 _MISSING_IMPORT_RE = re.compile(r"ModuleNotFoundError:\s+No module named '([^']+)'")
 _IMPORT_ERROR_RE = re.compile(r"ImportError:\s+No module named '([^']+)'")
 
-def maybe_install_missing_from_error(stderr_or_stdout: str, auto_pip: bool) -> Optional[str]:
+def maybe_install_missing_from_error(stderr_or_stdout: str, auto_pip: bool,
+                                     root: Optional[Path] = None) -> Optional[str]:
     if not auto_pip:
         return None
     for rx in (_MISSING_IMPORT_RE, _IMPORT_ERROR_RE):
         m = rx.search(stderr_or_stdout)
         if m:
             mod = m.group(1)
-            candidate = mod.replace("_", "-")
+            candidate = dist_for_import(mod)
             print(f"{ANSI_BLUE}[+] Missing module '{mod}' → trying pip install {candidate}{ANSI_RESET}")
-            ok = pip_install_packages([candidate])
+            if root is not None and project_python(root) != sys.executable:
+                ok = add_env_requirements(root, [candidate])
+            else:
+                ok = pip_install_packages([candidate])
             return candidate if ok else None
     return None
 
+# ----------------------------
+# Project environments (venv pool)
+# ----------------------------
+# With "venv": true in the manifest (set by --venv) a project runs in a
+# virtualenv taken from a pool under the user cache dir. Pool entries are
+# keyed by the hash of the project's normalized requirements: requirements.txt
+# plus the distributions autocoder installed for missing imports (manifest
+# "extra_requirements"). Projects with identical requirements share one env,
+# and nothing is ever installed into a pooled env beyond its own key: an extra
+# distribution moves the project to the env for the extended set. Wheels are
+# kept in a shared wheelhouse so a new or rebuilt env installs offline.
+ENV_MARKER = ".autocoder_env.json"
+ENV_REQUIREMENTS = "requirements.pool.txt"   # the env's full requirement set, written into the env dir
+
+def venv_pool_dir() -> Path:
+    return user_cache_dir() / "venvs"
+
+def wheelhouse_dir() -> Path:
+    return user_cache_dir() / "wheelhouse"
+
+def normalize_requirements(text: str) -> List[str]:
+    """Requirement lines without comments/whitespace, names canonicalized (PEP 503), sorted and deduplicated."""
+    reqs = set()
+    for line in text.splitlines():
+        line = re.sub(r"(^|\s)#.*$", "", line).strip()
+        if not line:
+            continue
+        line = re.sub(r"\s+", "", line)
+        m = re.match(r"([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$", line)
+        if m:
+            line = re.sub(r"[-_.]+", "-", m.group(1).lower()) + m.group(2)
+        reqs.add(line)
+    return sorted(reqs)
+
+def project_requirements(root: Path) -> List[str]:
+    """Normalized requirements.txt lines plus, for pooled envs, the auto-installed extras."""
+    req = root / "requirements.txt"
+    text = req.read_text(encoding="utf-8", errors="replace") if req.exists() else ""
+    manifest = load_manifest(root)
+    if manifest.get("venv"):
+        text += "\n" + "\n".join(manifest.get("extra_requirements", []))
+    return normalize_requirements(text)
+
+def requirements_hash(root: Path) -> str:
+    return hashlib.sha256("\n".join(project_requirements(root)).encode("utf-8")).hexdigest()
+
+def _venv_python(env: Path) -> Path:
+    return env / ("Scripts/python.exe" if sys.platform == "win32" else "bin/python")
+
+def _env_dir(req_hash: str) -> Path:
+    tag = f"{sys.implementation.name}{sys.version_info[0]}{sys.version_info[1]}"
+    return venv_pool_dir() / f"{tag}-{req_hash[:16]}"
+
+def project_python(root: Path) -> str:
+    """Interpreter used to run (and pip-install into) the project."""
+    if not load_manifest(root).get("venv"):
+        return sys.executable
+    env = _env_dir(requirements_hash(root))
+    python = _venv_python(env)
+    with _PIP_LOCK:
+        if not python.exists():
+            import venv
+            print(f"{ANSI_BLUE}[+] Creating project env {env}{ANSI_RESET}")
+            try:
+                venv.create(env, with_pip=True, clear=True)
+            except Exception as e:
+                print(f"{ANSI_YELLOW}[!] Could not create venv ({e}); using {sys.executable}.{ANSI_RESET}")
+                return sys.executable
+    return str(python)
+
+def _install_into_env(python: str, requirements_path: Path) -> bool:
+    """Install from the wheelhouse offline; on a miss, build/download the wheels first."""
+    with _PIP_LOCK:
+        return _install_from_wheelhouse(python, requirements_path)
+
+def _install_from_wheelhouse(python: str, requirements_path: Path) -> bool:
+    wh = wheelhouse_dir()
+    ensure_dir(wh)
+    offline = [python, "-m", "pip", "install", "--no-index", "--find-links", str(wh), "-r", str(requirements_path)]
+    if subprocess.run(offline, capture_output=True).returncode == 0:
+        print(f"{ANSI_BLUE}[+] Installed {requirements_path.name} from wheelhouse{ANSI_RESET}")
+        return True
+    print(f"{ANSI_BLUE}[+] pip wheel -r {requirements_path} (into {wh}){ANSI_RESET}")
+    wheel = [python, "-m", "pip", "wheel", "--wheel-dir", str(wh), "--find-links", str(wh), "-r", str(requirements_path)]
+    if run_relayed(wheel) == 0 and run_relayed(offline) == 0:
+        return True
+    return pip_install_requirements(requirements_path, python)
+
+def add_env_requirements(root: Path, dists: List[str]) -> bool:
+    """Add auto-installed distributions to a pooled-env project's requirements and switch it to that env."""
+    manifest = load_manifest(root)
+    extras = sorted(set(manifest.get("extra_requirements", [])) | set(dists), key=str.lower)
+    if extras == manifest.get("extra_requirements"):
+        return True
+    manifest["extra_requirements"] = extras
+    save_manifest(root, manifest)
+    return sync_requirements(root, auto_pip=True)
+
+@traced("requirements")
+def sync_requirements(root: Path, auto_pip: bool) -> bool:
+    """
+    Install requirements.txt into the project's interpreter unless the
+    normalized requirements hash matches the one recorded in the manifest.
+    A pooled env gets its full requirement set (including auto-installed
+    extras) once, checked against the env's own marker.
+    """
+    req = root / "requirements.txt"
+    manifest = load_manifest(root)
+    if not auto_pip or not (req.exists() or manifest.get("extra_requirements")):
+        return True
+    h = requirements_hash(root)
+    python = project_python(root)
+    if manifest.get("venv") and python != sys.executable:
+        env = Path(python).parent.parent
+        marker = env / ENV_MARKER
+        try:
+            ready = json.loads(marker.read_text(encoding="utf-8")).get("requirements_hash") == h
+        except (OSError, ValueError):
+            ready = False
+        if not ready:
+            pool_req = env / ENV_REQUIREMENTS
+            pool_req.write_text("\n".join(project_requirements(root)) + "\n", encoding="utf-8")
+            if not _install_into_env(python, pool_req):
+                return False
+            marker.write_text(json.dumps({"requirements_hash": h, "created": time.time()}), encoding="utf-8")
+    elif manifest.get("requirements_hash") == h:
+        print(f"{ANSI_DIM}[=] requirements.txt unchanged; skipping pip.{ANSI_RESET}")
+        return True
+    elif not pip_install_requirements(req, python):
+        return False
+    manifest["requirements_hash"] = h
+    save_manifest(root, manifest)
+    return True
+
 # ----------------------------
 # Project helpers
 # ----------------------------
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
-def write_file(root: Path, relpath: str, content: str):
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+def project_path(root: Path, relpath: str) -> Path:
+    """Absolute path of `relpath` inside `root`; raises ValueError if it escapes the project."""
     rel = Path(relpath).as_posix().lstrip("/")
     outpath = (root / rel).resolve()
     root_abs = root.resolve()
-    if not str(outpath).startswith(str(root_abs)):
+    if outpath != root_abs and root_abs not in outpath.parents:
         raise ValueError(f"Refusing to write outside project: {outpath}")
-    ensure_dir(outpath.parent)
-    outpath.write_text(content, encoding="utf-8")
+    return outpath
+
+def write_file(root: Path, relpath: str, content: Union[str, bytes], make_dirs: bool = True,
+               txn: Optional["Transaction"] = None) -> bool:
+    """
+    Atomically replace a project file (temp file + rename). Returns False
+    without touching the file when its content is already identical.
+    """
+    outpath = project_path(root, relpath)
+    if isinstance(content, bytes):
+        data = content
+    else:
+        data = (content if os.linesep == "\n" else content.replace("\n", os.linesep)).encode("utf-8")
+    try:
+        st = outpath.stat()
+        if st.st_size == len(data) and outpath.read_bytes() == data:
+            return False
+        mode = st.st_mode & 0o7777
+    except (FileNotFoundError, NotADirectoryError):
+        mode = 0o666 & ~_UMASK
+    if make_dirs:
+        ensure_dir(outpath.parent)
+    if txn is not None:
+        txn.record(outpath)
+    # The rename also breaks hardlinks into workspace clones instead of writing through them.
+    fd, tmp = tempfile.mkstemp(prefix=f".{outpath.name}.", suffix=".tmp", dir=str(outpath.parent))
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, outpath)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return True
 
 def read_file(root: Path, relpath: str) -> str:
     p = (root / relpath).resolve()
     return p.read_text(encoding="utf-8")
 
-def discover_files(root: Path) -> List[str]:
-    files = []
-    for p in root.rglob("*"):
-        if p.is_file() and p.name != MANIFEST_NAME:
-            files.append(str(p.relative_to(root).as_posix()))
+# ----------------------------
+# Project walker (ignore-aware)
+# ----------------------------
+# discover_files walks the tree with os.scandir, pruning ignored directories
+# instead of descending into them. Patterns follow .gitignore syntax (`!`
+# negation, trailing `/` for directories, `/` anchoring, `*`, `?`, `**`,
+# `[...]`); .gitignore and .autocoderignore files apply to their directory
+# and below, later rules win, so .autocoderignore can re-include with `!`.
+IGNORE_FILES = (".gitignore", ".autocoderignore")
+DEFAULT_IGNORES = (".git/", ".hg/", ".svn/", "__pycache__/", "*.py[cod]", ".venv/", "venv/", "node_modules/",
+                   ".mypy_cache/", ".pytest_cache/", ".ruff_cache/", ".tox/", ".nox/", "*.egg-info/",
+                   ".ipynb_checkpoints/", ".DS_Store", STATE_DIR + "/")
+MAX_FILE_BYTES = 1_000_000     # larger files are left out of snapshots and checkpoints
+SNIFF_BYTES = 8192             # a NUL byte in this prefix marks a file as binary
+TEXT_EXTS = {".py", ".pyi", ".txt", ".md", ".rst", ".json", ".yaml", ".yml", ".toml", ".cfg", ".ini", ".env",
+             ".html", ".htm", ".css", ".js", ".jsx", ".ts", ".tsx", ".sh", ".bat", ".ps1", ".sql", ".csv",
+             ".xml", ".svg", ".in", ".lock", ".c", ".h", ".cpp", ".go", ".rs", ".java", ".kt", ".rb"}
+BINARY_EXTS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".pdf", ".zip", ".gz", ".tgz", ".bz2",
+               ".xz", ".7z", ".tar", ".whl", ".so", ".dll", ".dylib", ".exe", ".bin", ".o", ".a", ".class",
+               ".jar", ".db", ".sqlite", ".sqlite3", ".pkl", ".pickle", ".npy", ".npz", ".parquet", ".woff",
+               ".woff2", ".ttf", ".otf", ".mp3", ".mp4", ".wav", ".ogg", ".mov", ".avi"}
+_IGNORE_MEMO: Dict[str, Tuple[int, List[Tuple]]] = {}   # ignore file -> (mtime_ns, rules)
+_SNIFF_MEMO: Dict[str, Tuple[int, int, bool]] = {}      # path -> (size, mtime_ns, is_binary)
+
+def _glob_regex(pattern: str) -> str:
+    out, i, n = [], 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and "]" in pattern[i + 2:]:
+            j = pattern.index("]", i + 2)
+            body = pattern[i + 1:j]
+            out.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+            i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+def compile_ignore(line: str, base: str = "") -> Optional[Tuple]:
+    """One ignore-file line as (base dir, regex, negated, dirs only); None for blanks and comments."""
+    line = line.rstrip("\r\n")
+    if not line.endswith("\\ "):
+        line = line.rstrip(" ")
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    rx = _glob_regex(line.lstrip("/"))
+    return base, re.compile(rx if anchored else "(?:.*/)?" + rx), negate, dir_only
+
+def _load_ignore_file(path: str, base: str) -> List[Tuple]:
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        hit = _IGNORE_MEMO.get(path)
+        if hit and hit[0] == mtime:
+            return hit[1]
+        with open(path, encoding="utf-8", errors="replace") as f:
+            rules = [r for r in (compile_ignore(line, base) for line in f) if r]
+    except OSError:
+        return []
+    _IGNORE_MEMO[path] = (mtime, rules)
+    return rules
+
+_DEFAULT_RULES = [compile_ignore(p) for p in DEFAULT_IGNORES]
+
+def is_ignored(rules: List[Tuple], rel: str, is_dir: bool) -> bool:
+    ignored = False
+    for base, rx, negate, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if base:
+            if not rel.startswith(base + "/"):
+                continue
+            sub = rel[len(base) + 1:]
+        else:
+            sub = rel
+        if rx.fullmatch(sub):
+            ignored = not negate
+    return ignored
+
+def is_binary_file(path: str, size: int, mtime_ns: int) -> bool:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TEXT_EXTS:
+        return False
+    if ext in BINARY_EXTS:
+        return True
+    hit = _SNIFF_MEMO.get(path)
+    if hit and hit[:2] == (size, mtime_ns):
+        return hit[2]
+    try:
+        with open(path, "rb") as f:
+            binary = b"\0" in f.read(SNIFF_BYTES)
+    except OSError:
+        binary = False
+    _SNIFF_MEMO[path] = (size, mtime_ns, binary)
+    return binary
+
+def discover_files(root: Path, skipped: Optional[List[Tuple[str, int, int]]] = None) -> List[str]:
+    """
+    Project files autocoder reads, sorted: ignored paths, virtualenvs
+    (dirs with pyvenv.cfg), binaries, files over MAX_FILE_BYTES and
+    autocoder's state files are left out. Files skipped individually (not
+    those under pruned dirs) are appended to `skipped` as (path, size, mtime_ns).
+    """
+    files: List[str] = []
+
+    def walk(dirpath: str, rel_dir: str, rules: List[Tuple]):
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError:
+            return
+        names = {e.name for e in entries}
+        if rel_dir and "pyvenv.cfg" in names:
+            return
+        for name in IGNORE_FILES:
+            if name in names:
+                rules = rules + _load_ignore_file(os.path.join(dirpath, name), rel_dir)
+        for e in entries:
+            rel = f"{rel_dir}/{e.name}" if rel_dir else e.name
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    if not is_ignored(rules, rel, True):
+                        walk(e.path, rel, rules)
+                    continue
+                if not e.is_file() or e.name in STATE_FILES:
+                    continue
+                st = e.stat()
+            except OSError:
+                continue
+            if (is_ignored(rules, rel, False) or st.st_size > MAX_FILE_BYTES
+                    or is_binary_file(e.path, st.st_size, st.st_mtime_ns)):
+                if skipped is not None:
+                    skipped.append((rel, st.st_size, st.st_mtime_ns))
+                continue
+            files.append(rel)
+
+    walk(str(root), "", list(_DEFAULT_RULES))
     return sorted(files)
 
 def load_manifest(root: Path) -> Dict:
@@ -156,95 +1402,816 @@ def load_manifest(root: Path) -> Dict:
     return {}
 
 def save_manifest(root: Path, manifest: Dict):
-    (root / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    write_file(root, MANIFEST_NAME, json.dumps(manifest, indent=2))
 
-def snapshot_project(root: Path, truncate_bytes: int = MAX_SNAPSHOT_BYTES) -> str:
-    files = discover_files(root)
-    parts = []
-    parts.append("PROJECT TREE:\n" + "\n".join(files) + "\n")
-    parts.append("FILES:\n")
-    total = 0
-    for f in files:
+_INDEX_MEMO: Dict[str, Dict] = {}
+_INDEX_LOCK = threading.Lock()
+
+def load_file_index(root: Path) -> Dict:
+    key = str(root.resolve())
+    with _INDEX_LOCK:
+        if key in _INDEX_MEMO:
+            return _INDEX_MEMO[key]
+    index: Dict = {"version": 1, "files": {}}
+    p = root / INDEX_NAME
+    if p.exists():
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+            if data.get("version") == 1 and isinstance(data.get("files"), dict):
+                index = data
+        except Exception:
+            pass
+    with _INDEX_LOCK:
+        return _INDEX_MEMO.setdefault(key, index)
+
+def save_file_index(root: Path, index: Dict):
+    """
+    Memoize `index` and write it atomically. The in-memory copy keeps the
+    text of every file; on disk only files up to INDEX_TEXT_LIMIT carry it.
+    """
+    files = {rel: e if "text" not in e or e["size"] <= INDEX_TEXT_LIMIT else
+             {k: v for k, v in e.items() if k != "text"} for rel, e in index["files"].items()}
+    data = json.dumps(dict(index, files=files), separators=(",", ":"))
+    with _INDEX_LOCK:
+        _INDEX_MEMO[str(root.resolve())] = index
+        try:
+            write_file(root, INDEX_NAME, data)
+        except OSError:
+            pass
+
+def _index_entry(path: Path, st: os.stat_result) -> Tuple[Dict, str]:
+    data = path.read_bytes()
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        text = None
+        err = f"<<unable to read: {e}>>"
+    mtime_ns = st.st_mtime_ns
+    if time.time_ns() - mtime_ns < 1_000_000_000:
+        # Modified within the last second: a further write could keep the same
+        # size and mtime, so force a re-read next time ("racy" entry).
+        mtime_ns = -1
+    entry = {"size": len(data), "mtime_ns": mtime_ns, "sha256": hashlib.sha256(data).hexdigest()}
+    if text is not None:
+        entry["text"] = text    # persisted only up to INDEX_TEXT_LIMIT, see save_file_index
+    return entry, (text if text is not None else err)
+
+def snapshot_blocks(root: Path) -> List[Dict]:
+    """
+    Snapshot the project as a list of blocks {"path", "content", "sha256", "bytes"}.
+    Unchanged files (same size and mtime as in the index) are served from
+    the index; only new or modified files are read and hashed.
+    """
+    index = load_file_index(root)
+    old = index["files"]
+    fresh: Dict[str, Dict] = {}
+    blocks: List[Dict] = []
+    changed = refilled = False
+    for rel in discover_files(root):
+        p = root / rel
         try:
-            content = read_file(root, f)
+            st = p.stat()
+            entry = old.get(rel)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                content = entry.get("text")
+                if content is None:
+                    # Large file from the on-disk index: read it once, then keep the text in the memo.
+                    entry, content = _index_entry(p, st)
+                    refilled = True
+            else:
+                entry, content = _index_entry(p, st)
+                changed = True
+        except FileNotFoundError:
+            continue
         except Exception as e:
-            content = f"<<unable to read: {e}>>"
-        block = f"\n===== {f} =====\n{content}\n"
-        total += len(block.encode("utf-8"))
-        if total > truncate_bytes:
-            parts.append("\n<<SNAPSHOT TRUNCATED>>\n")
-            break
-        parts.append(block)
-    return "".join(parts)
+            entry, content = {"size": 0, "mtime_ns": -1, "sha256": ""}, f"<<unable to read: {e}>>"
+            changed = True
+        fresh[rel] = entry
+        blocks.append({"path": rel, "content": content, "sha256": entry["sha256"], "bytes": entry["size"]})
+    if changed or fresh.keys() != old.keys():
+        save_file_index(root, {"version": 1, "files": fresh})
+    elif refilled:
+        with _INDEX_LOCK:
+            _INDEX_MEMO[str(root.resolve())] = {"version": 1, "files": fresh}
+    return blocks
 
 # ----------------------------
-# LLM output parsing
+# Relevance ranking (BM25 over paths, identifiers and content)
 # ----------------------------
-def try_parse_json_manifest(text: str) -> Tuple[str, List[Dict], List[str]]:
-    text = text.strip()
-    if text.startswith("```"):
-        text = text.strip("`")
-        text = text.split("\n", 1)[1] if "\n" in text else text
-    data = json.loads(text)
-    entry = data.get("entrypoint", "")
-    files = data.get("files", [])
-    delete = data.get("delete", [])
-    if not isinstance(files, list):
-        raise ValueError("files must be a list")
-    return entry, files, delete
+BM25_K1 = 1.2
+BM25_B = 0.75
+PATH_TOKEN_WEIGHT = 3      # path tokens count this many times in a file's term frequencies
 
-FENCE_RE = re.compile(
-    r"```(?:(?:\w+)\s*)?(?:filename\s*=\s*)?([^\n`]+?)\s*\n(.*?)```",
-    re.DOTALL | re.IGNORECASE
-)
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_TERMS_MEMO: Dict[str, Dict[str, int]] = {}   # content sha256 -> term frequencies
 
-def parse_code_fences(text: str) -> List[Dict]:
-    results = []
-    for m in FENCE_RE.finditer(text):
-        filename = m.group(1).strip()
-        content = m.group(2).strip()
-        results.append({"path": filename, "content": content})
-    return results
+def tokenize(text: str) -> List[str]:
+    """Lowercased identifier tokens; snake_case and camelCase words are also split into parts."""
+    out: List[str] = []
+    for word in _WORD_RE.findall(text):
+        low = word.lower()
+        if len(low) > 1:
+            out.append(low)
+        parts = [p.lower() for chunk in word.split("_") for p in _CAMEL_RE.findall(chunk)]
+        if len(parts) > 1:
+            out.extend(p for p in parts if len(p) > 1)
+    return out
 
-def parse_llm_files(text: str) -> Tuple[str, List[Dict], List[str]]:
-    try:
-        entry, files, delete = try_parse_json_manifest(text)
-        return entry, files, delete
-    except Exception:
-        pass
-    files = parse_code_fences(text)
-    entry = ""
-    candidates = [f["path"] for f in files if f["path"].endswith((".py", ".sh", ".bat"))]
-    if candidates:
-        entry = "main.py" if "main.py" in {Path(c).name for c in candidates} else candidates[0]
-    return entry, files, []
+def _term_counts(block: Dict) -> Dict[str, int]:
+    key = block.get("sha256") or ""
+    counts = _TERMS_MEMO.get(key) if key else None
+    if counts is None:
+        counts = {}
+        for t in tokenize(block["content"]):
+            counts[t] = counts.get(t, 0) + 1
+        if key:
+            _TERMS_MEMO[key] = counts
+    counts = dict(counts)
+    for t in tokenize(block["path"].replace("/", " ").replace(".", " ")):
+        counts[t] = counts.get(t, 0) + PATH_TOKEN_WEIGHT
+    return counts
+
+def rank_blocks(blocks: List[Dict], query: str) -> List[Tuple[float, Dict]]:
+    """Score blocks against `query` with BM25; returns (score, block) sorted best first."""
+    q_terms = set(tokenize(query))
+    if not blocks or not q_terms:
+        return [(0.0, b) for b in blocks]
+    docs = [_term_counts(b) for b in blocks]
+    lengths = [sum(d.values()) for d in docs]
+    avgdl = (sum(lengths) / len(lengths)) or 1.0
+    n = len(docs)
+    df = {t: sum(1 for d in docs if t in d) for t in q_terms}
+    idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in q_terms if df[t]}
+    # Paths mentioned verbatim in the query (e.g. traceback frames) always win.
+    q_low = query.lower()
+    scored = []
+    for b, d, dl in zip(blocks, docs, lengths):
+        score = 0.0
+        for t, w in idf.items():
+            tf = d.get(t, 0)
+            if tf:
+                score += w * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+        path_low = b["path"].lower()
+        if path_low in q_low and re.search(r"(?<![\w.-])" + re.escape(path_low) + r"(?![\w])", q_low):
+            score += 100.0
+        scored.append((score, b))
+    scored.sort(key=lambda x: (-x[0], x[1]["path"]))
+    return scored
 
 # ----------------------------
-# Prompts
+# Snapshot budget (model context window)
 # ----------------------------
-DEP_PLAN_PROMPT = """You are a build planner.
-From the TASK below, output ONLY a compact JSON object with a single key "packages"
-listing the minimal pip packages (names as they would be installed via pip) required to implement it.
-Do not include stdlib modules. Do not include dev tools.
+_MODEL_CONFIG: Dict[str, Dict] = {}   # config path -> {"mtime_ns", "models"}
+_OUTLINE_MEMO: Dict[str, Optional[str]] = {}   # content sha256 -> outline_python result
 
-TASK:
-{task}
-"""
+def load_model_config() -> Dict[str, int]:
+    """Context windows from $AUTOCODER_MODELS or ./autocoder_models.json ({"model": tokens} or {"model": {"context": tokens}})."""
+    path = Path(os.environ.get("AUTOCODER_MODELS") or MODELS_CONFIG_FILE)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return {}
+    cached = _MODEL_CONFIG.get(str(path))
+    if cached and cached["mtime_ns"] == mtime:
+        return cached["models"]
+    models: Dict[str, int] = {}
+    try:
+        raw = json.loads(path.read_text(encoding="utf-8"))
+        for name, value in raw.items():
+            tokens = value.get("context") if isinstance(value, dict) else value
+            if isinstance(tokens, int) and tokens > 0:
+                models[name] = tokens
+            else:
+                print(f"{ANSI_YELLOW}[!] {path}: ignoring '{name}' (context must be a positive integer){ANSI_RESET}")
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"{ANSI_YELLOW}[!] Could not read {path}: {e}{ANSI_RESET}")
+    _MODEL_CONFIG[str(path)] = {"mtime_ns": mtime, "models": models}
+    return models
 
-CREATE_PROMPT = """You are a senior software engineer generating a COMPLETE multi-file project.
+def model_context_tokens(model: str) -> int:
+    """Context window of `model`: exact name, then name without its tag, then the longest matching prefix."""
+    table = dict(MODEL_CONTEXT)
+    table.update(load_model_config())
+    base = model.split(":", 1)[0]
+    for name in (model, base):
+        if name in table:
+            return table[name]
+    prefixes = [name for name in table if base.startswith(name)]
+    return table[max(prefixes, key=len)] if prefixes else DEFAULT_CONTEXT_TOKENS
 
-TASK:
-{task}
+def snapshot_budget(model: Optional[str] = None) -> int:
+    """Tokens a project snapshot may use in a prompt for `model`."""
+    window = model_context_tokens(model) if model else DEFAULT_CONTEXT_TOKENS
+    if _BACKEND_SETTINGS.get("kind") == "subprocess":
+        # `ollama run` can't pass num_ctx, so the server's default window is all there is.
+        window = min(window, int(os.environ.get("OLLAMA_CONTEXT_LENGTH") or OLLAMA_DEFAULT_CONTEXT))
+    return int(window * SNAPSHOT_CONTEXT_SHARE)
 
-OUTPUT FORMAT (STRICT):
-Return a single JSON object with keys:
-- "entrypoint": string (e.g., "main.py" or "src/app.py")
-- "files": a list of objects with fields:
-    - "path": string (relative path)
-    - "content": string (entire file content)
-Do NOT include any commentary. Do NOT use backticks. Do NOT abbreviate code.
+def estimate_tokens(text: str) -> int:
+    return (len(text.encode("utf-8")) + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN
 
-QUALITY RULES:
+def outline_block(b: Dict) -> Optional[str]:
+    """OUTLINE section for a Python file (memoized per content hash); None for other files or unparsable source."""
+    if not b["path"].endswith(".py"):
+        return None
+    key = b.get("sha256") or ""
+    if key and key in _OUTLINE_MEMO:
+        outline = _OUTLINE_MEMO[key]
+    else:
+        outline = outline_python(b["content"])
+        if key:
+            _OUTLINE_MEMO[key] = outline
+    if outline is None:
+        return None
+    return f"\n===== {b['path']} (OUTLINE) =====\n{outline or '(no top-level definitions)'}\n"
+
+PARTIAL_VIEWS_NOTE = ("NOTE: files under FILES are complete. EXCERPT and OUTLINE sections are partial views "
+                      "for reference; only return such a file if you reproduce it in full.\n")
+
+def render_snapshot(blocks: List[Dict], budget: Optional[int] = None, query: str = "") -> str:
+    """
+    Render blocks as the prompt snapshot within `budget` tokens (default:
+    snapshot_budget()). The full tree listing is always kept; with a `query`,
+    files are added most-relevant first. A file that doesn't fit in full (or
+    would take more than half the budget) is sent as an outline instead, and
+    only dropped when even that doesn't fit.
+    """
+    budget = budget or snapshot_budget()
+    parts = []
+    parts.append("PROJECT TREE:\n" + "\n".join(b["path"] for b in blocks) + "\n")
+    parts.append("FILES:\n")
+    total = sum(estimate_tokens(p) for p in parts) + estimate_tokens(PARTIAL_VIEWS_NOTE)
+    ordered = [b for _, b in rank_blocks(blocks, query)] if query else blocks
+    outlined = omitted = 0
+    for b in ordered:
+        block = f"\n===== {b['path']} =====\n{b['content']}\n"
+        size = estimate_tokens(block)
+        if total + size > budget or size > budget // 2:
+            block = outline_block(b)
+            size = estimate_tokens(block) if block else 0
+            if not block or total + size > budget:
+                omitted += 1
+                continue
+            outlined += 1
+        total += size
+        parts.append(block)
+    if outlined:
+        parts.insert(1, PARTIAL_VIEWS_NOTE)
+    if omitted:
+        parts.append(f"\n<<SNAPSHOT TRUNCATED: {omitted} less relevant file(s) omitted>>\n")
+    trace_note(budget=budget, tokens=total, outlined=outlined, omitted=omitted)
+    return "".join(parts)
+
+@traced("snapshot")
+def snapshot_project(root: Path, budget: Optional[int] = None, query: str = "") -> str:
+    return render_snapshot(snapshot_blocks(root), budget, query)
+
+# ----------------------------
+# Fix context (traceback-directed)
+# ----------------------------
+_FRAME_RE = re.compile(r'^\s*File "([^"]+)", line (\d+)(?:, in (.+))?\s*$', re.MULTILINE)
+EXCERPT_CONTEXT_LINES = 8      # lines around a frame when no enclosing def/class is found
+SMALL_FILE_BYTES = 1_000       # non-Python files this small are always sent in full
+
+def parse_traceback(text: str, root: Path) -> List[Dict]:
+    """Frames {"path", "line", "func"} of a Python traceback that point into the project, innermost last."""
+    root_abs = root.resolve()
+    frames = []
+    for m in _FRAME_RE.finditer(text):
+        raw = m.group(1)
+        if raw.startswith("<"):
+            continue
+        p = Path(raw)
+        p = p if p.is_absolute() else root_abs / p
+        try:
+            rel = p.resolve().relative_to(root_abs).as_posix()
+        except (ValueError, OSError):
+            continue
+        frames.append({"path": rel, "line": int(m.group(2)), "func": (m.group(3) or "").strip()})
+    return frames
+
+def condense_error(text: str, max_chars: int = MAX_ERROR_CHARS) -> str:
+    """Collapse repeated lines/frame groups and duplicated blocks, then keep the tail."""
+    lines = text.strip("\n").splitlines()
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        collapsed = False
+        for size in (1, 2, 3, 4):
+            group = lines[i:i + size]
+            if len(group) < size:
+                break
+            reps = 1
+            while lines[i + reps * size:i + (reps + 1) * size] == group:
+                reps += 1
+            if reps >= 3:
+                out.extend(group)
+                out.append(f"  [previous {size} line(s) repeated {reps - 1} more times]")
+                i += reps * size
+                collapsed = True
+                break
+        if not collapsed:
+            out.append(lines[i])
+            i += 1
+    # stderr and stdout often carry the same traceback; keep the first copy of each blank-line separated block.
+    seen = set()
+    blocks = []
+    for block in "\n".join(out).split("\n\n"):
+        key = block.strip()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        blocks.append(block)
+    result = "\n\n".join(blocks).strip()
+    if len(result) > max_chars:
+        cut = len(result) - max_chars
+        result = f"<<{cut} earlier characters truncated>>\n" + result[cut:]
+    return result
+
+def outline_python(text: str) -> Optional[str]:
+    """Imports, class/def signatures and first docstring lines; None if the source doesn't parse."""
+    import ast
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    out: List[str] = []
+
+    def doc_line(node) -> str:
+        doc = ast.get_docstring(node)
+        return f"  # {doc.strip().splitlines()[0]}" if doc and doc.strip() else ""
+
+    def visit(node, indent: str):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.Import, ast.ImportFrom)) and not indent:
+                out.append(f"{child.lineno}: {ast.unparse(child)}")
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                prefix = "async def" if isinstance(child, ast.AsyncFunctionDef) else "def"
+                ret = f" -> {ast.unparse(child.returns)}" if child.returns else ""
+                out.append(f"{child.lineno}: {indent}{prefix} {child.name}({ast.unparse(child.args)}){ret}:"
+                           f"{doc_line(child)}")
+            elif isinstance(child, ast.ClassDef):
+                bases = ", ".join(ast.unparse(b) for b in child.bases)
+                out.append(f"{child.lineno}: {indent}class {child.name}({bases}):{doc_line(child)}")
+                visit(child, indent + "    ")
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and not indent:
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                names = [ast.unparse(t) for t in targets]
+                out.append(f"{child.lineno}: {', '.join(names)} = ...")
+    visit(tree, "")
+    return "\n".join(out)
+
+def _frame_windows(text: str, lines_wanted: List[int]) -> List[Tuple[int, int]]:
+    """Line ranges (1-based, inclusive) covering each wanted line's enclosing def/class, merged."""
+    import ast
+    spans: List[Tuple[int, int]] = []
+    try:
+        tree = ast.parse(text)
+        defs = [n for n in ast.walk(tree)
+                if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+    except (SyntaxError, ValueError):
+        defs = []
+    for ln in lines_wanted:
+        enclosing = [n for n in defs if n.lineno <= ln <= (n.end_lineno or n.lineno)]
+        if enclosing:
+            inner = max(enclosing, key=lambda n: n.lineno)
+            start = min([d.lineno for d in inner.decorator_list] + [inner.lineno])
+            spans.append((start, inner.end_lineno or inner.lineno))
+        else:
+            spans.append((max(1, ln - EXCERPT_CONTEXT_LINES), ln + EXCERPT_CONTEXT_LINES))
+    spans.sort()
+    merged: List[Tuple[int, int]] = []
+    for a, b in spans:
+        if merged and a <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+def _excerpt(text: str, spans: List[Tuple[int, int]]) -> str:
+    lines = text.splitlines()
+    parts = []
+    for a, b in spans:
+        parts.append("\n".join(f"{n:>5}| {lines[n - 1]}" for n in range(a, min(b, len(lines)) + 1)))
+    return "\n   ...\n".join(parts)
+
+@traced("fix_context")
+def build_fix_context(root: Path, error: str, budget: Optional[int] = None) -> str:
+    """
+    Snapshot for FIX_PROMPT within `budget` tokens: files named in the
+    traceback at full fidelity (or as excerpts around the failing frames
+    when too large), everything else as an outline. Traceback files count
+    against the budget too, innermost first: one that doesn't fit is
+    outlined, or left out with a note saying so. Falls back to a
+    relevance-ranked snapshot when the error has no frames inside the project.
+    """
+    budget = budget or snapshot_budget()
+    blocks = snapshot_blocks(root)
+    frames = parse_traceback(error, root)
+    by_path = {b["path"]: b for b in blocks}
+    hot: Dict[str, List[int]] = {}
+    for f in reversed(frames):          # innermost frame first
+        if f["path"] in by_path and f["line"] not in hot.get(f["path"], []):
+            hot.setdefault(f["path"], []).append(f["line"])
+    if not hot:
+        return snapshot_project(root, budget, query=error)
+
+    parts = ["PROJECT TREE:\n" + "\n".join(b["path"] for b in blocks) + "\n", PARTIAL_VIEWS_NOTE, "FILES:\n"]
+    total = sum(estimate_tokens(p) for p in parts)
+    per_file = max(budget // (2 * len(hot)), 1_000)
+    left_out: List[str] = []
+    for path, wanted in hot.items():
+        content = by_path[path]["content"]
+        full = f"\n===== {path} =====\n{content}\n"
+        views = [full] if estimate_tokens(full) <= per_file else []
+        views.append(f"\n===== {path} (EXCERPT around lines {', '.join(map(str, wanted))}) =====\n"
+                     f"{_excerpt(content, _frame_windows(content, wanted))}\n")
+        views.append(outline_block(by_path[path]))
+        block = next((v for v in views if v is not None and total + estimate_tokens(v) <= budget), None)
+        if block is None:
+            left_out.append(path)
+            continue
+        total += estimate_tokens(block)
+        parts.append(block)
+
+    rest = [b for _, b in rank_blocks([b for b in blocks if b["path"] not in hot], error)]
+    omitted, unshown = 0, []
+    for b in rest:
+        block = outline_block(b)
+        if block is None and (b["path"].endswith(".py") or b["bytes"] <= SMALL_FILE_BYTES):
+            block = f"\n===== {b['path']} =====\n{b['content']}\n"
+        if block is None:
+            unshown.append(b["path"])      # a larger non-Python file: no outline to send
+            continue
+        size = estimate_tokens(block)
+        if total + size > budget:
+            omitted += 1
+            continue
+        total += size
+        parts.append(block)
+    if left_out:
+        parts.append(f"\n<<LEFT OUT to fit the context budget, although the traceback references them: "
+                     f"{', '.join(left_out)}>>\n")
+    if unshown:
+        more = f" and {len(unshown) - 10} more" if len(unshown) > 10 else ""
+        parts.append(f"\n<<NOT SHOWN (non-Python files over {SMALL_FILE_BYTES} bytes): "
+                     f"{', '.join(unshown[:10])}{more}>>\n")
+    if omitted:
+        parts.append(f"\n<<SNAPSHOT TRUNCATED: {omitted} less relevant file(s) omitted>>\n")
+    trace_note(budget=budget, tokens=total, omitted=omitted, hot_left_out=len(left_out))
+    return "".join(parts)
+
+# ----------------------------
+# LLM output parsing
+# ----------------------------
+def try_parse_json_manifest(text: str) -> Tuple[str, List[Dict], List[str]]:
+    """Parse a JSON file manifest, tolerating a fence or prose around it; raises ValueError if there is none."""
+    parser = IncrementalFileParser()
+    emitted = parser.feed(text)
+    entry, rest, delete = parser.close()
+    if parser.mode != "json" or not parser.complete:
+        raise ValueError("no complete JSON manifest in text")
+    return entry, emitted + rest, delete
+
+def parse_code_fences(text: str) -> List[Dict]:
+    parser = IncrementalFileParser(mode="fence")
+    files = parser.feed(text)
+    return files + parser.close()[1]
+
+PARSE_CHUNK_CHARS = 1 << 16    # parse_llm_files feeds whole responses in pieces this size
+
+@traced("parse", lambda r: {"files": len(r[1]), "deletes": len(r[2])})
+def parse_llm_files(text: str) -> Tuple[str, List[Dict], List[str]]:
+    """
+    Files from a complete LLM response: a JSON manifest (possibly fenced,
+    wrapped in chatter or truncated) or ```path fences. Single pass; complete
+    files are kept even when the response is cut off, with a warning.
+    """
+    parser = IncrementalFileParser()
+    files: List[Dict] = []
+    for i in range(0, len(text), PARSE_CHUNK_CHARS):
+        files.extend(parser.feed(text[i:i + PARSE_CHUNK_CHARS]))
+    entry, rest, delete = parser.close()
+    report_parse_recovery(parser)
+    return entry, files + rest, delete
+
+def report_parse_recovery(parser: "IncrementalFileParser"):
+    if parser.notes:
+        shown = ", ".join(parser.paths[:10]) + (", ..." if len(parser.paths) > 10 else "")
+        print(f"{ANSI_YELLOW}[!] LLM output was malformed: {'; '.join(parser.notes)}. "
+              f"Recovered {len(parser.paths)} file(s){': ' + shown if shown else ''}{ANSI_RESET}")
+
+def guess_entrypoint(paths: List[str]) -> str:
+    candidates = [p for p in paths if p.endswith((".py", ".sh", ".bat"))]
+    if not candidates:
+        return ""
+    return "main.py" if "main.py" in {Path(c).name for c in candidates} else candidates[0]
+
+_JSON_TOKEN_RE = re.compile(r'[{}\[\]"]')
+_JSON_STRING_END_RE = re.compile(r'["\\]')
+_FENCE_OPEN_RE = re.compile(r"^[ \t]*(`{3,})([^\n`]*)\n", re.MULTILINE)
+_PAYLOAD_START_RE = re.compile(r"^[ \t]*(?:(`{3,})([^\n`]*)\n|([{\[]))", re.MULTILINE)
+_NON_SPACE_RE = re.compile(r"\S")
+_LINE_LEAD_RE = re.compile(r"[ \t]*`*")
+_ONLY_NULLS_RE = re.compile(r"\s*(?:null\s*,\s*)*")
+_PATH_FIELD_RE = re.compile(r'"path"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_TOP_FIELD_RE = re.compile(r'"(entrypoint|delete)"\s*:\s*("(?:[^"\\]|\\.)*"|\[[^\[\]]*\])')
+RAW_KEEP_CHARS = 4_000_000     # raw text kept for a fence-mode retry while JSON mode has produced nothing
+
+class IncrementalFileParser:
+    """
+    Consumes LLM output chunk by chunk and returns each file as soon as its
+    `{"path", "content"}` object (or ```path fence) is complete. Emitted file
+    objects are cut out of the buffer, so memory stays bounded by the largest
+    single file rather than the whole response, and total work is linear.
+
+    The payload is JSON when a line starts with `{"`/`[{` (so after a line of
+    chatter too) or with a ```json (or bare ```) fence, and ```path fences
+    when a fence with a filename comes first. Mode detection only looks at
+    text it hasn't scanned yet. Prose with neither keeps the mode open until
+    close(), which scans for fences and then for a JSON manifest inside it. If the JSON is
+    cut off, the files completed so far are kept and `notes` says what was
+    lost; if a "JSON" start turns out to be prose, the text is rescanned for fences.
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode: Optional[str] = mode   # "json" | "fence"
+        self.buf = ""
+        self.pos = 0
+        self.scan = 0                            # mode detection resumes here (always at a line start)
+        self.scanned = 0                         # buffer length at the last detection attempt
+        self.pending = False                     # the unfinished last line may still open a payload
+        self.in_str = False
+        self.stack: List[Tuple[str, int]] = []   # (opening char, offset in buf)
+        self.top: Optional[object] = None        # parsed top-level JSON value once it closes
+        self.complete = False
+        self.fence_path: Optional[str] = None
+        self.fence_lines: List[str] = []
+        self.fence_ticks = 0                     # backticks of the open fence (closing run must be at least as long)
+        self.fence_depth = 0                     # nested ```lang blocks inside the open fence
+        self.in_fence = False
+        self.paths: List[str] = []
+        self.notes: List[str] = []
+        self.raw: Optional[List[str]] = []       # dropped after the first emitted file (or past RAW_KEEP_CHARS)
+        self.raw_len = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        if self.complete:
+            return []
+        if self.raw is not None:
+            self.raw.append(chunk)
+            self.raw_len += len(chunk)
+            if self.raw_len > RAW_KEEP_CHARS:
+                self.raw = None
+        self.buf += chunk
+        if self.mode is None:
+            self._detect_mode()
+        if self.mode == "json":
+            out = self._scan_json()
+        elif self.mode == "fence":
+            out = self._scan_fences(final=False)
+        else:
+            out = []
+        if out:
+            self.raw = None
+        return out
+
+    def close(self) -> Tuple[str, List[Dict], List[str]]:
+        """Flush and return (entrypoint, files not yet emitted, delete)."""
+        files: List[Dict] = []
+        if self.mode == "json" and not self.complete and not self.paths and self.raw is not None:
+            # Never found a JSON manifest; the brace was probably prose. Rescan as fences.
+            retry = IncrementalFileParser(mode="fence")
+            files = retry.feed("".join(self.raw))
+            entry, rest, delete = retry.close()
+            if files or rest:
+                self.__dict__.update(retry.__dict__)
+                return entry, files + rest, delete
+        if self.mode is None and self.buf.strip():
+            # Prose without any fence: try ```path fences, then a JSON manifest wrapped in the chatter.
+            fenced = IncrementalFileParser(mode="fence")
+            files = fenced.feed(self.buf)
+            entry, rest, delete = fenced.close()
+            if not files and not rest:
+                wrapped = IncrementalFileParser(mode="json")
+                emitted = wrapped.feed(self.buf)
+                w_entry, w_rest, w_delete = wrapped.close()
+                if emitted or w_rest or w_delete:
+                    self.__dict__.update(wrapped.__dict__)
+                    return w_entry, emitted + w_rest, w_delete
+            self.__dict__.update(fenced.__dict__)
+            return entry, files + rest, delete
+        if self.mode == "fence":
+            files = self._scan_fences(final=True)
+            return guess_entrypoint(self.paths), files, []
+        entry, delete = "", []
+        if isinstance(self.top, dict):
+            entry = self.top.get("entrypoint", "") or ""
+            delete = self.top.get("delete", []) or []
+            rest = self.top.get("files", [])
+        elif isinstance(self.top, list):
+            rest = self.top
+        else:
+            rest = []
+            if self.stack:
+                entry, delete = self._recover_truncated()
+        for f in rest:
+            if isinstance(f, dict) and isinstance(f.get("path"), str):
+                files.append(f)
+                self.paths.append(f["path"])
+        return entry or guess_entrypoint(self.paths), files, list(delete)
+
+    def _recover_truncated(self) -> Tuple[str, List[str]]:
+        """Top-level fields that made it before the cut, plus a note naming the file that didn't."""
+        start = self.stack[0][1]
+        entry, delete = "", []
+        for m in _TOP_FIELD_RE.finditer(self.buf, start):
+            try:
+                value = json.loads(m.group(2))
+            except ValueError:
+                continue
+            if m.group(1) == "entrypoint" and isinstance(value, str):
+                entry = value
+            elif m.group(1) == "delete" and isinstance(value, list):
+                delete = [d for d in value if isinstance(d, str)]
+        note = "JSON cut off"
+        if len(self.stack) > 1:
+            m = _PATH_FIELD_RE.search(self.buf, self.stack[-1][1])
+            if m:
+                note += f" inside {m.group(1)} (dropped)"
+        self.notes.append(note)
+        return entry, delete
+
+    def _detect_mode(self):
+        buf = self.buf
+        seen, self.scanned = self.scanned, len(buf)
+        if seen > self.scan and not self.pending and buf.find("\n", seen) < 0:
+            return      # still inside a line already ruled out; only a newline can change that
+        while True:
+            m = _PAYLOAD_START_RE.search(buf, self.scan)
+            if not m:
+                # Nothing decided; next time only the last (possibly incomplete) line needs rescanning.
+                self.scan = max(self.scan, buf.rfind("\n", self.scan) + 1)
+                self.pending = _LINE_LEAD_RE.match(buf, self.scan).end() == len(buf)
+                return
+            if m.group(3):
+                # A bracket opening a line is JSON only if what follows looks like it. A brace
+                # inside prose ("the config {see below}") or "[1] first step" decides nothing.
+                nxt = _NON_SPACE_RE.search(buf, m.end())
+                if not nxt:
+                    self.scan, self.pending = m.start(), True    # wait for the next character
+                    return
+                self.pending = False
+                if nxt.group(0) in ('"}' if m.group(3) == "{" else "{]"):
+                    self.mode = "json"
+                    self.pos = m.start(3)
+                    return
+                self.scan = m.end()
+                continue
+            info = m.group(2).strip().lower()
+            if info in ("", "json"):
+                # JSON wrapped in a fence: skip the fence line, scan the object inside.
+                self.mode = "json"
+                self.pos = m.end()
+            else:
+                self.mode = "fence"
+            return
+
+    def _scan_json(self) -> List[Dict]:
+        out: List[Dict] = []
+        buf = self.buf
+        while not self.complete:
+            if self.in_str:
+                m = _JSON_STRING_END_RE.search(buf, self.pos)
+                if not m:
+                    self.pos = len(buf)
+                    break
+                if m.group(0) == "\\":
+                    if m.end() >= len(buf):
+                        self.pos = m.start()   # escape split across chunks; wait for more
+                        break
+                    self.pos = m.end() + 1
+                    continue
+                self.in_str = False
+                self.pos = m.end()
+                continue
+            m = _JSON_TOKEN_RE.search(buf, self.pos)
+            if not m:
+                # Nothing open: everything scanned so far is chatter and can go.
+                if not self.stack:
+                    buf, self.pos = "", 0
+                else:
+                    self.pos = len(buf)
+                break
+            ch, i = m.group(0), m.start()
+            self.pos = m.end()
+            if ch == '"':
+                if self.stack:
+                    self.in_str = True
+            elif ch in "{[":
+                if not self.stack and i > 0:
+                    buf, self.pos, i = buf[i:], self.pos - i, 0   # drop chatter before the payload
+                self.stack.append((ch, i))
+            elif self.stack:
+                opener, start = self.stack.pop()
+                if not self.stack:
+                    try:
+                        self.top = json.loads(buf[start:self.pos])
+                    except ValueError:
+                        continue    # bracketed prose such as "[see below]"; keep looking
+                    self.complete = True
+                    break
+                if ch == "}" and len(self.stack) <= 2 and self.stack[-1][0] == "[":
+                    m = _PATH_FIELD_RE.search(buf, start, self.pos)
+                    if not m:
+                        continue
+                    try:
+                        obj = json.loads(buf[start:self.pos])
+                    except ValueError:
+                        continue
+                    if isinstance(obj, dict) and isinstance(obj.get("path"), str):
+                        out.append(obj)
+                        self.paths.append(obj["path"])
+                        # Keep a single null placeholder per array so the buffer doesn't grow with the file count.
+                        arr = self.stack[-1][1] + 1
+                        if _ONLY_NULLS_RE.fullmatch(buf, arr, start):
+                            buf = buf[:arr] + "null" + buf[self.pos:]
+                            self.pos = arr + 4
+                        else:
+                            buf = buf[:start] + "null" + buf[self.pos:]
+                            self.pos = start + 4
+        self.buf = buf
+        return out
+
+    def _scan_fences(self, final: bool) -> List[Dict]:
+        out: List[Dict] = []
+        lines = self.buf.split("\n")
+        self.buf = "" if final else lines.pop()
+        for line in lines:
+            stripped = line.strip()
+            ticks = len(stripped) - len(stripped.lstrip("`"))
+            if ticks >= 3:
+                if not self.in_fence:
+                    self.in_fence, self.fence_ticks, self.fence_depth = True, ticks, 0
+                    self.fence_path = _fence_path(stripped[ticks:])
+                    continue
+                if ticks >= self.fence_ticks and stripped == "`" * ticks:
+                    if self.fence_depth and self.fence_ticks == 3:
+                        self.fence_depth -= 1     # closes a nested ```lang block inside the file
+                    else:
+                        self._emit_fence(out)
+                        continue
+                elif stripped[ticks:].strip() and self.fence_ticks == 3:
+                    self.fence_depth += 1
+            if self.in_fence:
+                self.fence_lines.append(line)
+        if final and self.in_fence and self.fence_path and self.fence_lines:
+            self.notes.append(f"unterminated fence for {self.fence_path} (kept)")
+            self._emit_fence(out)
+        return out
+
+    def _emit_fence(self, out: List[Dict]):
+        if self.fence_path:
+            out.append({"path": self.fence_path, "content": "\n".join(self.fence_lines).strip()})
+            self.paths.append(self.fence_path)
+        self.in_fence, self.fence_path, self.fence_lines = False, None, []
+
+def _fence_path(info: str) -> Optional[str]:
+    tokens = re.sub(r"filename\s*=\s*", "", info, flags=re.IGNORECASE).split()
+    if not tokens:
+        return None
+    if len(tokens) == 1:
+        # A lone token is a filename only if it looks like one (```python is just a language tag).
+        return tokens[0] if ("." in tokens[0] or "/" in tokens[0]) else None
+    return tokens[-1]
+
+# ----------------------------
+# Prompts
+# ----------------------------
+DEP_PLAN_PROMPT = """You are a build planner.
+From the TASK below, output ONLY a compact JSON object with a single key "packages"
+listing the minimal pip packages (names as they would be installed via pip) required to implement it.
+Do not include stdlib modules. Do not include dev tools.
+
+TASK:
+{task}
+"""
+
+CREATE_PROMPT = """You are a senior software engineer generating a COMPLETE multi-file project.
+
+TASK:
+{task}
+
+OUTPUT FORMAT (STRICT):
+Return a single JSON object with keys:
+- "entrypoint": string (e.g., "main.py" or "src/app.py")
+- "files": a list of objects with fields:
+    - "path": string (relative path)
+    - "content": string (entire file content)
+Do NOT include any commentary. Do NOT use backticks. Do NOT abbreviate code.
+
+QUALITY RULES:
 - Provide all files required to run immediately (requirements.txt if needed).
 - Keep paths POSIX-like (use forward slashes).
 - Ensure imports match the provided file paths.
@@ -290,76 +2257,1333 @@ GOAL:
 CONTEXT (trimmed project snapshot):
 {snapshot}
 
-REQUIREMENTS:
-- Modify or add only the necessary files.
-- Respect current layout and imports.
-- Return ONLY a JSON object with "files" and optional "delete".
-"""
+REQUIREMENTS:
+- Modify or add only the necessary files.
+- Respect current layout and imports.
+- Return ONLY a JSON object with "files" and optional "delete".
+"""
+
+MERGE_PROMPT = """You are a merge agent. Two agents changed the same file independently, starting from the same BASE.
+
+FILE: {path}
+
+BASE:
+{base}
+
+VERSION A (agent {a_name}, already applied):
+{a}
+
+VERSION B (agent {b_name}, goal: {b_goal}):
+{b}
+
+REQUIREMENT:
+Return ONLY a JSON object with "files": [{{"path": "{path}", "content": <entire merged file>}}]
+that keeps the changes of both versions. Do NOT include backticks or commentary.
+"""
+
+PATCH_FORMAT_RULES = """
+EDIT FORMAT (existing files):
+Do NOT resend whole existing files. For each existing file you change, return
+{"path": "<path>", "edits": [{"search": "<exact current lines>", "replace": "<new lines>"}]}
+- "search" must be copied verbatim from the current file (including indentation) and match exactly once;
+  keep it to the few lines around the change.
+- Alternatively give {"path": "<path>", "diff": "<unified diff of that file>"}.
+New files still use {"path": ..., "content": <entire file>}.
+"""
+
+FULL_FILE_FALLBACK_PROMPT = """Some edits could not be applied because their search text did not match the files.
+
+FAILED EDITS:
+{failures}
+
+CURRENT CONTENT OF THOSE FILES:
+{files}
+
+REQUIREMENT:
+Apply the intent of the failed edits and return ONLY a JSON object with
+"files": a list of {{"path", "content"}} giving the ENTIRE new content of each of those files.
+Do NOT include backticks or commentary.
+"""
+
+# ----------------------------
+# Patch protocol (search/replace blocks and unified diffs)
+# ----------------------------
+EDIT_FORMATS = ("whole", "diff")
+FUZZY_MATCH_RATIO = 0.92    # minimum similarity for a fuzzy (non-exact) hunk match
+
+class PatchError(ValueError):
+    pass
+
+def _find_lines(lines: List[str], old: List[str], hint: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Locate `old` in `lines`; returns (start, indent shift) or None. Tries an
+    exact match nearest to `hint`, then trailing-whitespace and indentation
+    insensitive matches, then a unique difflib match above FUZZY_MATCH_RATIO.
+    """
+    n, m = len(lines), len(old)
+    if m == 0 or m > n:
+        return None
+
+    def nearest(cands: List[int]) -> Optional[int]:
+        return min(cands, key=lambda i: abs(i - hint)) if cands else None
+
+    for norm in (lambda x: x, str.rstrip):
+        target = [norm(x) for x in old]
+        first = target[0]
+        cands = [i for i in range(n - m + 1) if norm(lines[i]) == first and
+                 [norm(x) for x in lines[i:i + m]] == target]
+        if cands:
+            return nearest(cands), 0
+    stripped = [x.strip() for x in old]
+    cands = [i for i in range(n - m + 1) if [x.strip() for x in lines[i:i + m]] == stripped]
+    if cands:
+        i = nearest(cands)
+        ref = next((k for k in range(m) if old[k].strip()), 0)
+        shift = (len(lines[i + ref]) - len(lines[i + ref].lstrip())) - (len(old[ref]) - len(old[ref].lstrip()))
+        return i, shift
+    want = "\n".join(stripped)
+    sm = difflib.SequenceMatcher(autojunk=False)
+    sm.set_seq2(want)
+    best, best_i, runner_up = 0.0, -1, 0.0
+    for i in range(n - m + 1):
+        sm.set_seq1("\n".join(x.strip() for x in lines[i:i + m]))
+        if sm.real_quick_ratio() < FUZZY_MATCH_RATIO or sm.quick_ratio() < FUZZY_MATCH_RATIO:
+            continue
+        r = sm.ratio()
+        if r > best:
+            best, best_i, runner_up = r, i, best
+        elif r > runner_up:
+            runner_up = r
+    if best >= FUZZY_MATCH_RATIO and best - runner_up > 0.01:
+        return best_i, 0
+    return None
+
+def _reindent(lines: List[str], shift: int) -> List[str]:
+    if shift > 0:
+        return [(" " * shift + x) if x.strip() else x for x in lines]
+    if shift < 0:
+        return [x[min(-shift, len(x) - len(x.lstrip())):] for x in lines]
+    return lines
+
+def _apply_hunk(text: str, old: List[str], new: List[str], hint: int = 0) -> str:
+    lines = text.split("\n")
+    found = _find_lines(lines, old, hint)
+    if found is None:
+        first = next((x.strip() for x in old if x.strip()), "")
+        raise PatchError(f"context not found for hunk starting {first[:60]!r}")
+    i, shift = found
+    lines[i:i + len(old)] = _reindent(new, shift)
+    return "\n".join(lines)
+
+def apply_search_replace(text: str, edits: List[Dict]) -> str:
+    for e in edits:
+        search, replace = e.get("search", ""), e.get("replace", "")
+        if not search:
+            if text.strip():
+                raise PatchError("empty search block for a non-empty file")
+            text = replace
+            continue
+        idx = text.find(search)
+        if idx >= 0:
+            if text.find(search, idx + 1) >= 0:
+                raise PatchError(f"search block matches more than once: {search.strip()[:60]!r}")
+            text = text[:idx] + replace + text[idx + len(search):]
+            continue
+        text = _apply_hunk(text, search.strip("\n").split("\n"), replace.strip("\n").split("\n"))
+    return text
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+def apply_unified_diff(text: str, diff: str) -> str:
+    hunks: List[Tuple[int, List[str], List[str]]] = []
+    cur: Optional[Tuple[int, List[str], List[str]]] = None
+    for line in diff.split("\n"):
+        m = _HUNK_RE.match(line)
+        if m:
+            cur = (max(int(m.group(1)) - 1, 0), [], [])
+            hunks.append(cur)
+        elif cur is None or line.startswith(("--- ", "+++ ", "\\")):
+            continue
+        elif line.startswith("-"):
+            cur[1].append(line[1:])
+        elif line.startswith("+"):
+            cur[2].append(line[1:])
+        else:
+            ctx = line[1:] if line.startswith(" ") else line
+            cur[1].append(ctx)
+            cur[2].append(ctx)
+    if not hunks:
+        raise PatchError("no hunks in diff")
+    offset = 0
+    for start, old, new in hunks:
+        while old and old[-1] == "" and new and new[-1] == "":   # trailing blank context from the split
+            old.pop(); new.pop()
+        if not old:
+            lines = text.split("\n")
+            pos = min(start + offset, len(lines))
+            lines[pos:pos] = new
+            text = "\n".join(lines)
+        else:
+            text = _apply_hunk(text, old, new, start + offset)
+        offset += len(new) - len(old)
+    return text
+
+def is_patch(entry: Dict) -> bool:
+    return "content" not in entry and ("edits" in entry or "diff" in entry)
+
+def apply_file_change(old_text: Optional[str], entry: Dict) -> str:
+    """New content for one file entry: full "content", "edits" (search/replace) or a unified "diff"."""
+    if not is_patch(entry):
+        return entry.get("content", "")
+    if old_text is None:
+        raise PatchError("patch targets a file that does not exist")
+    if "edits" in entry:
+        edits = entry["edits"]
+        if not isinstance(edits, list):
+            raise PatchError("edits must be a list")
+        return apply_search_replace(old_text, edits)
+    return apply_unified_diff(old_text, str(entry["diff"]))
+
+# ----------------------------
+# VS Code integration (IDE handoff)
+# ----------------------------
+def vscode_available() -> bool:
+    try:
+        subprocess.run(["code", "-v"], capture_output=True, text=True)
+        return True
+    except Exception:
+        return False
+
+def open_in_vscode(root: Path):
+    if vscode_available():
+        # -r reuse window; open folder
+        subprocess.Popen(["code", "-r", str(root)])
+        print(f"{ANSI_GREEN}[+] Opened in VS Code: {root}{ANSI_RESET}")
+    else:
+        print(f"{ANSI_YELLOW}[!] VS Code 'code' CLI not found in PATH. Skipping IDE handoff.{ANSI_RESET}")
+
+def write_handoff_note(root: Path, title: str, body: str):
+    note = root / HANDOFF_NAME
+    ts = time.strftime("%Y-%m-%d %H:%M:%S")
+    content = f"# {title}\n\nTime: {ts}\n\n{body}\n"
+    try:
+        with open(note, "a", encoding="utf-8") as f:
+            f.write(content + "\n")
+    except Exception:
+        pass
+
+# ----------------------------
+# Import scanning
+# ----------------------------
+def _stdlib_modules() -> set:
+    names = set(getattr(sys, "stdlib_module_names", ())) | set(sys.builtin_module_names)
+    return names | {"__future__", "typing_extensions"} if names else set(sys.builtin_module_names)
+
+def scan_imports(text: str, top_level_only: bool = False, required_only: bool = False) -> List[str]:
+    """
+    Root module names of absolute imports in Python source (module-level
+    statements only if asked). `required_only` keeps the imports the module
+    can't load without: module-level ones outside try blocks, so optional
+    imports with a fallback and imports deferred into functions are left out.
+    """
+    import ast
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return []
+    guarded = _guarded_imports(tree) if required_only else set()
+    if top_level_only or required_only:
+        # Module-level statements, including those nested in try/if blocks.
+        nodes, stack = [], list(tree.body)
+        while stack:
+            n = stack.pop()
+            nodes.append(n)
+            if isinstance(n, (ast.Try, ast.If)):
+                stack.extend(n.body + n.orelse + getattr(n, "finalbody", []) +
+                             [x for h in getattr(n, "handlers", []) for x in h.body])
+    else:
+        nodes = list(ast.walk(tree))
+    found = []
+    for n in nodes:
+        if id(n) in guarded:
+            continue
+        if isinstance(n, ast.Import):
+            found.extend(a.name.split(".")[0] for a in n.names)
+        elif isinstance(n, ast.ImportFrom) and n.level == 0 and n.module:
+            found.append(n.module.split(".")[0])
+    return found
+
+def local_module_names(paths: List[str]) -> set:
+    """Names that resolve inside the project: every .py stem and every directory name."""
+    names = set()
+    for p in paths:
+        parts = Path(p).parts
+        names.update(parts[:-1])
+        if p.endswith(".py"):
+            names.add(Path(p).stem)
+    return names
+
+def scan_third_party_imports(root: Path, top_level_only: bool = False, required_only: bool = False) -> List[str]:
+    all_blocks = snapshot_blocks(root)
+    blocks = [b for b in all_blocks if b["path"].endswith(".py")]
+    local = local_module_names([b["path"] for b in all_blocks])
+    stdlib = _stdlib_modules()
+    mods = set()
+    for b in blocks:
+        mods.update(scan_imports(b["content"], top_level_only, required_only))
+    return sorted(m for m in mods if m not in stdlib and m not in local and not m.startswith("_"))
+
+# ----------------------------
+# Warm runner (pre-imported forkserver)
+# ----------------------------
+# Server side, run as `python -c`: pre-import the given modules, then fork a
+# child per request that runs the entrypoint as a fresh __main__ with its
+# own cwd/argv and stdout/stderr captured to temp files.
+_WARM_SERVER_SRC = r"""
+import importlib, json, os, runpy, sys, tempfile, traceback
+mods = json.loads(sys.argv[1])
+for m in mods:
+    try:
+        importlib.import_module(m)
+    except BaseException:
+        pass
+proto = os.fdopen(os.dup(1), "w")
+null = os.open(os.devnull, os.O_RDWR)
+os.dup2(null, 1)
+def reply(obj):
+    proto.write(json.dumps(obj) + "\n")
+    proto.flush()
+reply({"ready": True, "loaded": [m for m in mods if m in sys.modules]})
+for line in sys.stdin:
+    req = json.loads(line)
+    fo, fe = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.setsid()
+            os.environ.clear()
+            os.environ.update(req["env"])
+            os.chdir(req["cwd"])
+            os.dup2(null, 0)
+            os.dup2(fo.fileno(), 1)
+            os.dup2(fe.fileno(), 2)
+            sys.argv = [req["entry"]] + req.get("args", [])
+            sys.path[0] = os.path.dirname(req["entry"])
+            try:
+                runpy.run_path(req["entry"], run_name="__main__")
+                code = 0
+            except SystemExit as e:
+                if e.code is None:
+                    code = 0
+                elif isinstance(e.code, int):
+                    code = e.code
+                else:
+                    print(e.code, file=sys.stderr)
+                    code = 1
+            except BaseException as e:
+                tb = e.__traceback__
+                while tb is not None and tb.tb_frame.f_code.co_filename != req["entry"]:
+                    tb = tb.tb_next
+                traceback.print_exception(type(e), e, tb or e.__traceback__)
+                code = 1
+            try:
+                import atexit
+                atexit._run_exitfuncs()
+            except BaseException:
+                pass
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code & 0xFF)
+    reply({"pid": pid})
+    _, status = os.waitpid(pid, 0)
+    code = os.waitstatus_to_exitcode(status)
+    fo.seek(0); fe.seek(0)
+    reply({"code": code, "out": fo.read().decode("utf-8", "replace"), "err": fe.read().decode("utf-8", "replace")})
+    fo.close(); fe.close()
+"""
+
+class WarmRunnerError(RuntimeError):
+    pass
+
+class WarmRunner:
+    """Client for one long-lived forkserver with a fixed set of pre-imported modules."""
+
+    def __init__(self, modules: List[str], python: str = sys.executable):
+        self.modules = modules
+        self.python = python
+        self._lock = threading.Lock()
+        try:
+            self.proc = subprocess.Popen([python, "-c", _WARM_SERVER_SRC, json.dumps(modules)],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL, text=True)
+            ready = json.loads(self.proc.stdout.readline() or "{}")
+        except (OSError, ValueError) as e:
+            raise WarmRunnerError(str(e))
+        if not ready.get("ready"):
+            self.close()
+            raise WarmRunnerError("forkserver did not start")
+        self.loaded = ready.get("loaded", [])
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, root: Path, entry_path: Path, cancel: Optional[threading.Event] = None) -> Tuple[int, str, str]:
+        import select
+        import signal
+        with self._lock:     # one run at a time per server
+            try:
+                self.proc.stdin.write(json.dumps({"cwd": str(root), "entry": str(entry_path),
+                                                  "env": dict(os.environ)}) + "\n")
+                self.proc.stdin.flush()
+                pid = json.loads(self.proc.stdout.readline())["pid"]
+                while cancel is not None:
+                    ready, _, _ = select.select([self.proc.stdout], [], [], 0.1)
+                    if ready:
+                        break
+                    if cancel.is_set():
+                        try:
+                            os.killpg(pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+                        break
+                res = json.loads(self.proc.stdout.readline())
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.close()
+                raise WarmRunnerError(f"forkserver failed: {e}")
+        if cancel is not None and cancel.is_set() and res["code"] < 0:
+            return -9, res["out"], res["err"] + "\n<<cancelled>>"
+        return res["code"], res["out"], res["err"]
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except (OSError, AttributeError):
+            pass
+        if getattr(self, "proc", None) is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+_RUN_SETTINGS: Dict = {"warm": False, "cache": True}
+_WARM_RUNNERS: Dict[Tuple, WarmRunner] = {}
+_WARM_LOCK = threading.Lock()
+
+def configure_runner(warm: bool = False, cache: bool = True):
+    _RUN_SETTINGS["cache"] = cache
+    _RUN_SETTINGS["warm"] = bool(warm) and hasattr(os, "fork")
+    if warm and not hasattr(os, "fork"):
+        print(f"{ANSI_YELLOW}[!] --warm needs os.fork (POSIX); running cold.{ANSI_RESET}")
+
+def get_warm_runner(root: Path, python: str = sys.executable) -> WarmRunner:
+    """Forkserver for the project's third-party imports; servers are shared by identical import sets."""
+    modules = scan_third_party_imports(root, top_level_only=True)
+    key = (python, tuple(modules))
+    with _WARM_LOCK:
+        runner = _WARM_RUNNERS.get(key)
+        if runner is None or not runner.alive():
+            print(f"{ANSI_BLUE}[*] Starting warm runner (pre-importing: {', '.join(modules) or 'nothing'}){ANSI_RESET}")
+            runner = _WARM_RUNNERS[key] = WarmRunner(modules, python)
+        return runner
+
+@atexit.register
+def _close_warm_runners():
+    for runner in list(_WARM_RUNNERS.values()):
+        runner.close()
+    _WARM_RUNNERS.clear()
+
+# ----------------------------
+# Sandbox workspaces (copy-on-write clones)
+# ----------------------------
+WORKSPACE_MODES = ("auto", "reflink", "hardlink", "copy")
+WORKSPACE_SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", "node_modules", ".mypy_cache", ".pytest_cache", STATE_DIR}
+WORKSPACE_SKIP_FILES = STATE_FILES
+WORKSPACE_COPY_WARN_BYTES = 50_000_000   # warn when a clone without reflinks copies more than this
+_COPY_WARNED: set = set()                # roots already warned about, so speculative candidates warn once
+_FICLONE = 0x40049409             # Linux ioctl: share extents between two files (btrfs, xfs, ...)
+
+def _reflink(src: str, dst: str) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+
+class Workspace:
+    """
+    Disposable clone of a project tree for trial runs. Files are reflinked
+    where the filesystem supports it and copied otherwise, so in-place writes
+    by the program under test (data files, sqlite DBs) never reach the real
+    project. The explicit "hardlink" mode links only read-only files and
+    copies the rest. Directories matched by the ignore rules (see
+    discover_files) are not cloned but symlinked, so big data, build and
+    cache dirs cost nothing; writes into them do reach the project. Tool dirs
+    (WORKSPACE_SKIP_DIRS) and virtualenvs are left out. `promote()` moves
+    the workspace's changes back atomically, `discard()` drops it.
+    """
+
+    def __init__(self, root: Path, mode: str = "auto"):
+        if mode not in WORKSPACE_MODES:
+            raise ValueError(f"Unknown workspace mode: {mode}")
+        self.root = root.resolve()
+        self.python = project_python(self.root)
+        try:
+            # Same filesystem as the project so reflinks/hardlinks and renames work.
+            self.path = Path(tempfile.mkdtemp(prefix=f".{self.root.name}.ws-", dir=str(self.root.parent)))
+        except OSError:
+            self.path = Path(tempfile.mkdtemp(prefix=f"autocoder-ws-{self.root.name}-"))
+        self.mode = mode
+        self.base: Dict[str, Tuple[int, int]] = {}     # rel -> (size, mtime_ns) of the source at clone time
+        self.linked: Dict[str, int] = {}               # rel -> mtime_ns, for hardlinked files
+        self.shared: List[str] = []                    # ignored dirs symlinked to the project's
+        self.copied = 0                                # bytes copied (not reflinked or linked)
+        self._reflink_ok = mode in ("auto", "reflink")
+        self.closed = False
+        self._clone()
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *exc):
+        self.discard()
+
+    def _clone(self):
+        def walk(dirpath: str, rel_dir: str, target_dir: Path, rules: List[Tuple]):
+            target_dir.mkdir(exist_ok=True)
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+            names = {e.name for e in entries}
+            for name in IGNORE_FILES:
+                if name in names:
+                    rules = rules + _load_ignore_file(os.path.join(dirpath, name), rel_dir)
+            for e in entries:
+                rel = f"{rel_dir}/{e.name}" if rel_dir else e.name
+                if e.is_dir(follow_symlinks=False):
+                    if (e.name in WORKSPACE_SKIP_DIRS or Path(e.path) == self.path
+                            or os.path.isfile(os.path.join(e.path, "pyvenv.cfg"))):
+                        continue
+                    if is_ignored(rules, rel, True) and self._share_dir(e.path, target_dir / e.name, rel):
+                        continue
+                    walk(e.path, rel, target_dir / e.name, rules)
+                elif e.is_file() and e.name not in WORKSPACE_SKIP_FILES:
+                    st = e.stat()
+                    self.base[rel] = (st.st_size, st.st_mtime_ns)
+                    self._clone_file(e.path, str(target_dir / e.name), rel, st)
+
+        walk(str(self.root), "", self.path, list(_DEFAULT_RULES))
+        if self.copied > WORKSPACE_COPY_WARN_BYTES and str(self.root) not in _COPY_WARNED:
+            _COPY_WARNED.add(str(self.root))
+            print(f"{ANSI_YELLOW}[!] Workspace copied {self.copied / 1e6:.0f} MB of {self.root} (no reflink support "
+                  f"here). List big data dirs in .autocoderignore to share them instead of copying.{ANSI_RESET}")
+
+    def _share_dir(self, src: str, dst: Path, rel: str) -> bool:
+        try:
+            os.symlink(src, dst, target_is_directory=True)
+        except OSError:
+            return False    # no symlink support (e.g. unprivileged Windows): clone it
+        self.shared.append(rel)
+        return True
+
+    def _clone_file(self, src: str, dst: str, rel: str, st: os.stat_result):
+        if self._reflink_ok:
+            if _reflink(src, dst):
+                return
+            if self.mode == "reflink":
+                raise OSError("filesystem does not support reflinks")
+            self._reflink_ok = False    # don't retry on every file
+        if self.mode == "hardlink" and not st.st_mode & 0o222:
+            try:
+                os.link(src, dst)
+                self.linked[rel] = st.st_mtime_ns
+                return
+            except OSError:
+                pass    # cross-device or unsupported: copy instead
+        shutil.copy2(src, dst)
+        self.copied += st.st_size
+
+    def run(self, entry: str, cancel: Optional[threading.Event] = None) -> Tuple[int, str, str]:
+        # State files (the manifest) are not cloned, so resolve the interpreter from the real project.
+        return run_project(self.path, entry, cancel, python=self.python)
+
+    def changes(self) -> Tuple[List[str], List[str]]:
+        """(changed or new files, deleted files) relative to the clone-time state."""
+        changed, seen = [], set()
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            dirnames[:] = [d for d in dirnames if d not in WORKSPACE_SKIP_DIRS]
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                rel = Path(os.path.relpath(full, self.path)).as_posix()
+                if name in WORKSPACE_SKIP_FILES:
+                    continue
+                seen.add(rel)
+                if rel not in self.base:
+                    changed.append(rel)
+                    continue
+                st = os.stat(full)
+                if (st.st_size, st.st_mtime_ns) == self.base[rel]:
+                    continue
+                src = self.root / rel
+                if not src.is_file() or not filecmp.cmp(src, full, shallow=False):
+                    changed.append(rel)
+        deleted = [rel for rel in self.base if rel not in seen]
+        return sorted(changed), sorted(deleted)
+
+    def _check_links(self):
+        for rel, mtime in self.linked.items():
+            p = self.path / rel
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if st.st_nlink > 1 and st.st_mtime_ns != mtime:
+                print(f"{ANSI_YELLOW}[!] {rel} was modified in place inside the workspace; as a hardlink "
+                      f"the change also reached {self.root / rel}.{ANSI_RESET}")
+
+    def promote(self, txn: Optional["Transaction"] = None) -> Tuple[List[str], List[str]]:
+        """
+        Move changed files into the real project (stage as temp files, then
+        rename) and discard. With `txn`, the replaced and deleted files can be
+        rolled back.
+        """
+        changed, deleted = self.changes()
+        self._check_links()
+        staged: List[Tuple[str, Path]] = []
+        try:
+            for rel in changed:
+                dst = self.root / rel
+                ensure_dir(dst.parent)
+                fd, tmp = tempfile.mkstemp(prefix=f".{dst.name}.", suffix=".tmp", dir=str(dst.parent))
+                os.close(fd)
+                shutil.copy2(self.path / rel, tmp)
+                staged.append((tmp, dst))
+        except Exception:
+            for tmp, _ in staged:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+            raise
+        for tmp, dst in staged:
+            if txn is not None:
+                txn.record(dst)
+            os.replace(tmp, dst)
+        for rel in deleted:
+            dst = self.root / rel
+            if txn is not None:
+                if dst.exists() or dst.is_symlink():
+                    txn.remove(dst)
+                continue
+            try:
+                dst.unlink()
+            except FileNotFoundError:
+                pass
+        self.discard()
+        return changed, deleted
+
+    def localize(self, text: str) -> str:
+        """Rewrite workspace paths in `text` (run output, tracebacks) to the real project's."""
+        for ws, root in ((str(self.path), str(self.root)), (os.path.realpath(self.path), os.path.realpath(self.root))):
+            text = text.replace(ws, root)
+        return text
+
+    def discard(self):
+        if self.closed:
+            return
+        self._check_links()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.closed = True
+
+# ----------------------------
+# Checkpoints (content-addressed project history)
+# ----------------------------
+# .autocoder/checkpoints/objects/ab/cdef...  zlib-compressed file contents, named by sha256
+# .autocoder/checkpoints/manifests/0007.json {"id", "time", "label", "parent", "tree", "files": {path: sha256}}
+CHECKPOINT_KEEP = 100          # checkpoints kept by automatic gc (it runs once there are 20 more)
+_CKPT_LOCK = threading.Lock()
+
+def _ckpt_rel(*parts: str) -> str:
+    return "/".join((STATE_DIR, "checkpoints") + parts)
+
+def _object_rel(sha: str) -> str:
+    return _ckpt_rel("objects", sha[:2], sha[2:])
+
+def list_checkpoints(root: Path) -> List[Dict]:
+    out = []
+    for p in (root / _ckpt_rel("manifests")).glob("*.json"):
+        try:
+            c = json.loads(p.read_text(encoding="utf-8"))
+            int(c["id"])
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        out.append(c)
+    # Numeric order: ids outgrow their zero padding after 9999.
+    return sorted(out, key=lambda c: int(c["id"]))
+
+def load_checkpoint(root: Path, ref: str) -> Dict:
+    """A checkpoint by id (leading zeros optional) or "latest"."""
+    cps = list_checkpoints(root)
+    if ref == "latest" and cps:
+        return cps[-1]
+    for c in cps:
+        if c["id"] == ref or (ref.isdigit() and int(c["id"]) == int(ref)):
+            return c
+    raise ValueError(f"Unknown checkpoint: {ref}")
+
+def read_object(root: Path, sha: str) -> bytes:
+    return zlib.decompress((root / _object_rel(sha)).read_bytes())
+
+@traced("checkpoint")
+def create_checkpoint(root: Path, label: str) -> Optional[str]:
+    """
+    Record the current tree. Only contents not already in the store are
+    written; an unchanged tree reuses the latest checkpoint. Returns its id.
+    """
+    blocks = [b for b in snapshot_blocks(root) if b["sha256"] and b["path"] not in WORKSPACE_SKIP_FILES]
+    files = {b["path"]: b["sha256"] for b in blocks}
+    with _CKPT_LOCK:
+        cps = list_checkpoints(root)
+        try:
+            for rel, sha in list(files.items()):
+                if (root / _object_rel(sha)).exists():
+                    continue
+                data = (root / rel).read_bytes()
+                actual = hashlib.sha256(data).hexdigest()   # the file may have changed since it was indexed
+                files[rel] = actual
+                write_file(root, _object_rel(actual), zlib.compress(data))
+            # Hash what is actually stored, not the possibly stale index.
+            tree = tree_hash([{"path": rel, "sha256": sha} for rel, sha in files.items()])
+            if cps and cps[-1].get("tree") == tree:
+                return cps[-1]["id"]
+            cid = f"{int(cps[-1]['id']) + 1 if cps else 1:04d}"
+            manifest = {"id": cid, "time": time.time(), "label": label, "parent": cps[-1]["id"] if cps else None,
+                        "tree": tree, "files": files}
+            write_file(root, _ckpt_rel("manifests", f"{cid}.json"), json.dumps(manifest, indent=1))
+        except OSError as e:
+            print(f"{ANSI_YELLOW}[!] Could not write checkpoint: {e}{ANSI_RESET}")
+            return None
+        if len(cps) + 1 > CHECKPOINT_KEEP + 20:
+            gc_checkpoints(root, CHECKPOINT_KEEP)
+    return cid
+
+def gc_checkpoints(root: Path, keep: int = CHECKPOINT_KEEP) -> Tuple[int, int]:
+    """Drop all but the newest `keep` checkpoints and every object they don't reference."""
+    cps = list_checkpoints(root)
+    drop = cps[:max(len(cps) - keep, 0)]
+    for c in drop:
+        (root / _ckpt_rel("manifests", f"{c['id']}.json")).unlink()
+    live = {sha for c in cps[len(drop):] for sha in c["files"].values()}
+    removed = 0
+    objects = root / _ckpt_rel("objects")
+    for sub in objects.glob("*") if objects.is_dir() else []:
+        for obj in sub.iterdir():
+            if sub.name + obj.name not in live:
+                obj.unlink()
+                removed += 1
+        try:
+            sub.rmdir()
+        except OSError:
+            pass
+    return len(drop), removed
+
+def _tree_files(root: Path, ref: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    if ref is None:
+        blocks = snapshot_blocks(root)
+        return "working tree", {b["path"]: b["sha256"] for b in blocks if b["path"] not in WORKSPACE_SKIP_FILES}
+    c = load_checkpoint(root, ref)
+    return f"checkpoint {c['id']}", c["files"]
+
+def diff_checkpoints(root: Path, a: str, b: Optional[str] = None) -> str:
+    """Unified diff from checkpoint `a` to checkpoint `b` (default: the working tree)."""
+    name_a, files_a = _tree_files(root, a)
+    name_b, files_b = _tree_files(root, b)
+
+    def lines(files: Dict[str, str], rel: str, working: bool) -> Optional[List[str]]:
+        if rel not in files:
+            return []
+        data = (root / rel).read_bytes() if working else read_object(root, files[rel])
+        try:
+            return None if b"\0" in data else data.decode("utf-8").splitlines(keepends=True)
+        except UnicodeDecodeError:
+            return None
+
+    out = []
+    for rel in sorted(files_a.keys() | files_b.keys()):
+        if files_a.get(rel) == files_b.get(rel):
+            continue
+        old, new = lines(files_a, rel, False), lines(files_b, rel, b is None)
+        if old is None or new is None:
+            out.append(f"Binary file {rel} differs\n")
+            continue
+        for line in difflib.unified_diff(old, new, f"a/{rel}" if rel in files_a else "/dev/null",
+                                         f"b/{rel}" if rel in files_b else "/dev/null"):
+            out.append(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n")
+    return f"# {name_a} -> {name_b}\n" + "".join(out)
+
+def restore_checkpoint(root: Path, ref: str) -> Tuple[List[str], List[str]]:
+    """Make the working tree match a checkpoint (checkpointing the current state first)."""
+    target = load_checkpoint(root, ref)
+    create_checkpoint(root, f"before restore of {target['id']}")
+    _, current = _tree_files(root, None)
+    written = [rel for rel, sha in target["files"].items() if current.get(rel) != sha]
+    for rel in written:
+        write_file(root, rel, read_object(root, target["files"][rel]))
+    deleted = sorted(current.keys() - target["files"].keys())
+    materialize_files(root, [], deleted)
+    return sorted(written), deleted
+
+def checkpoints_command(root: Path, action: str, ref: Optional[str] = None, other: Optional[str] = None,
+                        keep: int = CHECKPOINT_KEEP):
+    if action == "list":
+        cps = list_checkpoints(root)
+        if not cps:
+            print(f"{ANSI_DIM}No checkpoints yet.{ANSI_RESET}")
+        prev: Dict[str, str] = {}
+        for c in cps:
+            changed = sum(1 for k in c["files"].keys() | prev.keys() if c["files"].get(k) != prev.get(k))
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(c["time"]))
+            print(f"{c['id']}  {ts}  {len(c['files']):>5} files  {changed:>4} changed  {c['label']}")
+            prev = c["files"]
+    elif action == "diff":
+        print(diff_checkpoints(root, ref, other), end="")
+    elif action == "restore":
+        written, deleted = restore_checkpoint(root, ref)
+        print(f"{ANSI_GREEN}[+] Restored checkpoint {load_checkpoint(root, ref)['id']}: "
+              f"{len(written)} file(s) written, {len(deleted)} deleted.{ANSI_RESET}")
+    elif action == "gc":
+        dropped, removed = gc_checkpoints(root, keep)
+        print(f"{ANSI_GREEN}[+] Removed {dropped} checkpoint(s) and {removed} unreferenced object(s).{ANSI_RESET}")
+
+# ----------------------------
+# Materialization / Run / Fix
+# ----------------------------
+class Transaction:
+    """
+    Undo log for one round of changes to a project. Before a file is
+    replaced its old inode is hardlinked (or copied) into a backup dir next
+    to the project; deleted files/dirs are moved there. `rollback()` puts
+    everything back, `commit()` drops the backups.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root.resolve()
+        self.saved: Dict[Path, Optional[Path]] = {}   # project path -> backup (None: did not exist)
+        self.backup: Optional[Path] = None
+
+    def _slot(self) -> Path:
+        if self.backup is None:
+            self.backup = Path(tempfile.mkdtemp(prefix=f".{self.root.name}.txn-", dir=str(self.root.parent)))
+        return self.backup / str(len(self.saved))
+
+    def record(self, path: Path):
+        """Remember `path`'s current content before it is overwritten."""
+        if path in self.saved:
+            return
+        if not path.is_file():
+            self.saved[path] = None
+            return
+        slot = self._slot()
+        try:
+            os.link(path, slot)
+        except OSError:
+            shutil.copy2(path, slot)
+        self.saved[path] = slot
+
+    def remove(self, path: Path):
+        """Delete a file or directory, keeping it for rollback."""
+        if path in self.saved:
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+            return
+        slot = self._slot()
+        os.replace(path, slot)
+        self.saved[path] = slot
+
+    @property
+    def paths(self) -> List[str]:
+        return sorted(p.relative_to(self.root).as_posix() for p in self.saved)
+
+    def rollback(self):
+        for path, slot in reversed(list(self.saved.items())):
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            elif path.exists() or path.is_symlink():
+                path.unlink()
+            if slot is not None:
+                ensure_dir(path.parent)
+                os.replace(slot, path)
+                continue
+            # Drop directories that only existed for files this transaction created.
+            parent = path.parent
+            while parent != self.root and self.root in parent.parents:
+                try:
+                    parent.rmdir()
+                except OSError:
+                    break
+                parent = parent.parent
+        self.commit()
+
+    def commit(self):
+        if self.backup is not None:
+            shutil.rmtree(self.backup, ignore_errors=True)
+        self.saved, self.backup = {}, None
+
+@traced("materialize")
+def materialize_files(root: Path, files: List[Dict], delete: List[str],
+                      txn: Optional[Transaction] = None) -> List[Dict]:
+    """
+    Apply deletes, then writes/patches. Writes are atomic and skipped when
+    the content is unchanged; with `txn`, everything touched can be rolled
+    back. Returns patch failures as [{"path", "error", "entry"}].
+    """
+    # Deletes first
+    for d in delete or []:
+        p = project_path(root, d)
+        if not (p.exists() or p.is_symlink()) or p == root.resolve():
+            continue
+        if txn is not None:
+            txn.remove(p)
+        elif p.is_dir() and not p.is_symlink():
+            shutil.rmtree(p)
+        else:
+            p.unlink()
+    # Resolve patches against the current content, then write
+    failures, pending = [], []
+    for f in files:
+        path = f["path"]
+        if is_patch(f):
+            try:
+                old = read_file(root, path) if (root / path).is_file() else None
+                content = apply_file_change(old, f)
+            except (PatchError, OSError, UnicodeDecodeError) as e:
+                print(f"{ANSI_YELLOW}[!] Patch for {path} did not apply: {str(e).splitlines()[0]}{ANSI_RESET}")
+                failures.append({"path": path, "error": str(e), "entry": f})
+                continue
+        else:
+            content = f.get("content", "")
+        pending.append((path, content))
+    for d in sorted({project_path(root, path).parent for path, _ in pending}):
+        ensure_dir(d)
+    unchanged = [path for path, content in pending if not write_file(root, path, content, make_dirs=False, txn=txn)]
+    trace_note(written=len(pending) - len(unchanged), unchanged=len(unchanged), deleted=len(delete or []))
+    if unchanged and len(pending) > 1:
+        print(f"{ANSI_DIM}[=] {len(unchanged)} of {len(pending)} file(s) unchanged, not rewritten.{ANSI_RESET}")
+    return failures
+
+def _request_full_files(model: str, failures: List[Dict], current: Dict[str, Optional[str]]) -> List[Dict]:
+    """Ask for whole-file content of the files whose patches failed, given their current text (None: new file)."""
+    print(f"{ANSI_BLUE}[*] Requesting full content for {len(failures)} file(s) whose patch failed{ANSI_RESET}")
+    failed_txt = "\n\n".join(
+        f"--- {f['path']} ({f['error'].splitlines()[0]})\n"
+        f"{json.dumps({k: v for k, v in f['entry'].items() if k != 'path'}, indent=1)}" for f in failures)
+    texts = "\n".join(f"\n===== {f['path']} =====\n{current[f['path']]}"
+                       for f in failures if current.get(f["path"]) is not None)
+    resp = ollama_run(model, FULL_FILE_FALLBACK_PROMPT.format(failures=failed_txt, files=texts),
+                      template="patch_fallback")
+    _, files, _ = parse_llm_files(resp)
+    wanted = {f["path"] for f in failures}
+    return [f for f in files if f.get("path") in wanted and not is_patch(f)]
+
+def _full_file_fallback(model: str, root: Path, failures: List[Dict],
+                        txn: Optional[Transaction] = None) -> List[str]:
+    """Re-request whole-file content for files whose patches failed; returns paths still failing."""
+    current = {f["path"]: read_file(root, f["path"]) if (root / f["path"]).is_file() else None for f in failures}
+    files = _request_full_files(model, failures, current)
+    materialize_files(root, files, [], txn)
+    return sorted({f["path"] for f in failures} - {f["path"] for f in files})
+
+def generate_files(model: str, prompt: str, root: Path, stream: bool = False, template: str = "",
+                   edit_format: str = "whole", txn: Optional[Transaction] = None) -> Tuple[str, List[Dict], List[str]]:
+    """
+    Ask the model for files and apply them to `root`. With `stream`, files are
+    written as soon as each one is complete in the token stream. With
+    edit_format "diff" the model may answer with search/replace edits or
+    unified diffs; patches that don't apply cleanly are retried as full files.
+    Changes are recorded in `txn` when given.
+    Returns (entrypoint, files, delete) like parse_llm_files.
+    """
+    if edit_format == "diff":
+        prompt += PATCH_FORMAT_RULES
+    if not stream:
+        entry, files, delete = parse_llm_files(ollama_run(model, prompt, template=template))
+        failures = materialize_files(root, files, delete, txn) if (files or delete) else []
+    else:
+        parser = IncrementalFileParser()
+        files, failures = [], []
+
+        def emit(batch: List[Dict]):
+            for f in batch:
+                failed = materialize_files(root, [f], [], txn)
+                failures.extend(failed)
+                files.append({"path": f["path"]})
+                if not failed:
+                    print(f"{ANSI_GREEN}[+] wrote {f['path']}{ANSI_RESET}")
+
+        for chunk in ollama_stream(model, prompt, template=template):
+            emit(parser.feed(chunk))
+        entry, rest, delete = parser.close()
+        emit(rest)
+        report_parse_recovery(parser)
+        # Deletes arrive at the end of the stream; never remove a file the same response just wrote.
+        written_paths = {f["path"] for f in files}
+        delete = [d for d in delete if d not in written_paths]
+        if delete:
+            materialize_files(root, [], delete, txn)
+    if failures:
+        still = _full_file_fallback(model, root, failures, txn)
+        if still:
+            print(f"{ANSI_RED}[!] Could not update: {', '.join(still)}{ANSI_RESET}")
+            failed = set(still)
+            files = [f for f in files if f["path"] not in failed]
+    return entry, files, delete
+
+def tree_hash(blocks: List[Dict]) -> str:
+    h = hashlib.sha256()
+    for b in sorted(blocks, key=lambda b: b["path"]):
+        h.update(f"{b['path']}\0{b['sha256']}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def environment_fingerprint(python: str = sys.executable) -> str:
+    """Interpreter identity plus the mtimes of its import path dirs (they change when packages are (un)installed)."""
+    h = hashlib.sha256(f"{python}\0{sys.version}".encode("utf-8"))
+    env = Path(python).parent.parent
+    paths = sys.path if python == sys.executable else [
+        str(p) for p in (*env.glob("lib/python*/site-packages"), env / "Lib" / "site-packages")]
+    for p in paths:
+        try:
+            h.update(f"{p}\0{os.stat(p or '.').st_mtime_ns}\n".encode("utf-8"))
+        except OSError:
+            continue
+    return h.hexdigest()
 
-# ----------------------------
-# VS Code integration (IDE handoff)
-# ----------------------------
-def vscode_available() -> bool:
+def run_cache_key(root: Path, entry: str, python: str = sys.executable) -> str:
+    # Ignored, binary and oversize files aren't in the snapshot but may be program inputs: key on their stat.
+    skipped: List[Tuple[str, int, int]] = []
+    discover_files(root, skipped)
+    parts = [tree_hash(snapshot_blocks(root)), entry, environment_fingerprint(python),
+             hashlib.sha256(repr(sorted(skipped)).encode("utf-8")).hexdigest()]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def _load_runs(root: Path) -> Dict:
     try:
-        subprocess.run(["code", "-v"], capture_output=True, text=True)
-        return True
+        return json.loads((root / RUNS_NAME).read_text(encoding="utf-8"))
     except Exception:
-        return False
-
-def open_in_vscode(root: Path):
-    if vscode_available():
-        # -r reuse window; open folder
-        subprocess.Popen(["code", "-r", str(root)])
-        print(f"{ANSI_GREEN}[+] Opened in VS Code: {root}{ANSI_RESET}")
-    else:
-        print(f"{ANSI_YELLOW}[!] VS Code 'code' CLI not found in PATH. Skipping IDE handoff.{ANSI_RESET}")
+        return {}
 
-def write_handoff_note(root: Path, title: str, body: str):
-    note = root / ".autocoder_handoff.md"
-    ts = time.strftime("%Y-%m-%d %H:%M:%S")
-    content = f"# {title}\n\nTime: {ts}\n\n{body}\n"
+def _store_run(root: Path, key: str, result: Tuple[int, str, str]):
+    runs = _load_runs(root)
+    runs.pop(key, None)
+    runs[key] = {"code": result[0], "out": result[1], "err": result[2], "time": time.time()}
+    while len(runs) > MAX_CACHED_RUNS:
+        runs.pop(next(iter(runs)))     # dicts keep insertion order: oldest first
     try:
-        with open(note, "a", encoding="utf-8") as f:
-            f.write(content + "\n")
-    except Exception:
+        write_file(root, RUNS_NAME, json.dumps(runs))
+    except OSError:
         pass
 
-# ----------------------------
-# Materialization / Run / Fix
-# ----------------------------
-def materialize_files(root: Path, files: List[Dict], delete: List[str]):
-    # Deletes first
-    for d in delete or []:
-        p = (root / d).resolve()
-        if p.exists():
-            if p.is_file():
-                p.unlink()
-            elif p.is_dir():
-                for sub in sorted(p.rglob("*"), reverse=True):
-                    if sub.is_file(): sub.unlink()
-                    else: sub.rmdir()
-                p.rmdir()
-    # Write/overwrite
-    for f in files:
-        path = f["path"]
-        content = f.get("content", "")
-        write_file(root, path, content)
-
-def run_project(root: Path, entry: str) -> Tuple[int, str, str]:
+@traced("run", lambda r: {"code": r[0]})
+def run_project(root: Path, entry: str, cancel: Optional[threading.Event] = None,
+                use_cache: bool = False, python: Optional[str] = None) -> Tuple[int, str, str]:
+    """
+    Run the entrypoint; if `cancel` is set while it runs, the process is killed.
+    With `use_cache`, a result recorded for the identical tree, entrypoint and
+    environment is returned without running (opt out with --no-run-cache or
+    "nondeterministic": true in the manifest). `python` defaults to the
+    project's interpreter (see project_python).
+    """
     entry_path = (root / entry).resolve()
     if not entry_path.exists():
         return 127, "", f"Entrypoint not found: {entry}"
-    proc = subprocess.run(
-        [sys.executable, str(entry_path)],
-        text=True,
-        capture_output=True,
-        cwd=str(root)
-    )
-    return proc.returncode, proc.stdout, proc.stderr
-
-def fix_loop(model: str, root: Path, entry: str, max_iters: int, auto_pip: bool) -> bool:
+    python = python or project_python(root)
+    if use_cache and _RUN_SETTINGS["cache"] and not load_manifest(root).get("nondeterministic"):
+        key = run_cache_key(root, entry, python)
+        hit = _load_runs(root).get(key)
+        if hit is not None:
+            print(f"{ANSI_DIM}[=] Project unchanged since last run; using recorded result.{ANSI_RESET}")
+            trace_note(cached=True)
+            return hit["code"], hit["out"], hit["err"]
+        result = _execute_entry(root, entry_path, cancel, python)
+        if result[0] != -9:
+            _store_run(root, key, result)
+        return result
+    return _execute_entry(root, entry_path, cancel, python)
+
+def _execute_entry(root: Path, entry_path: Path, cancel: Optional[threading.Event], python: str) -> Tuple[int, str, str]:
+    if _RUN_SETTINGS["warm"]:
+        try:
+            return get_warm_runner(root, python).run(root, entry_path, cancel)
+        except WarmRunnerError as e:
+            print(f"{ANSI_YELLOW}[!] Warm runner unavailable ({e}); running cold.{ANSI_RESET}")
+    if cancel is None:
+        proc = subprocess.run(
+            [python, str(entry_path)],
+            text=True,
+            capture_output=True,
+            cwd=str(root)
+        )
+        return proc.returncode, proc.stdout, proc.stderr
+    proc = subprocess.Popen([python, str(entry_path)], text=True, cwd=str(root),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    while True:
+        try:
+            out, err = proc.communicate(timeout=0.1)
+            return proc.returncode, out, err
+        except subprocess.TimeoutExpired:
+            if cancel.is_set():
+                proc.kill()
+                out, err = proc.communicate()
+                return -9, out, err + "\n<<cancelled>>"
+
+def _module_file(base: Path, dotted: str) -> Optional[Path]:
+    """The file or package dir `dotted` resolves to under `base`, if any."""
+    p = base.joinpath(*dotted.split(".")) if dotted else base
+    if (p.parent / (p.name + ".py")).is_file():
+        return p.parent / (p.name + ".py")
+    return p if p.is_dir() else None
+
+def _guarded_imports(tree) -> set:
+    """Import nodes inside try blocks (optional imports with a fallback)."""
+    import ast
+    guarded = set()
+    for n in ast.walk(tree):
+        if isinstance(n, ast.Try):
+            for stmt in n.body:
+                guarded.update(id(x) for x in ast.walk(stmt) if isinstance(x, (ast.Import, ast.ImportFrom)))
+    return guarded
+
+@traced("static_check", lambda problem: {"ok": problem is None})
+def static_check(root: Path, entry: str, paths: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Validate the project without executing it: the entrypoint exists, the
+    given .py files (all when `paths` is None) compile, and their imports of
+    project modules resolve against the files on disk. Returns a
+    traceback-style report of the problems, or None when everything passes.
+    """
+    import ast
+    import traceback
+    root_abs = root.resolve()
+    problems: List[str] = []
+    entry_path = root_abs / entry
+    if not entry_path.is_file():
+        problems.append(f"FileNotFoundError: entrypoint '{entry}' does not exist in the project")
+    base = entry_path.parent   # sys.path[0] when the entrypoint runs
+    wanted = set(paths) if paths is not None else None
+    for b in snapshot_blocks(root):
+        rel = b["path"]
+        if not rel.endswith(".py") or (wanted is not None and rel not in wanted):
+            continue
+        try:
+            tree = ast.parse(b["content"], rel)
+            compile(tree, rel, "exec", dont_inherit=True)
+        except (SyntaxError, ValueError) as e:
+            problems.append("".join(traceback.format_exception_only(type(e), e)).rstrip())
+            continue
+        lines = b["content"].splitlines()
+        guarded = _guarded_imports(tree)
+        for n in ast.walk(tree):
+            if id(n) in guarded:
+                continue
+            if isinstance(n, ast.ImportFrom) and n.level > 0:
+                pkg = (root_abs / rel).parent
+                for _ in range(n.level - 1):
+                    pkg = pkg.parent
+                targets = [n.module] if n.module else [a.name for a in n.names if not (pkg / "__init__.py").is_file()]
+                missing = [t for t in targets if _module_file(pkg, t) is None]
+            elif isinstance(n, (ast.Import, ast.ImportFrom)):
+                names = [a.name for a in n.names] if isinstance(n, ast.Import) else [n.module]
+                # Only names whose top-level module is a project file/package; anything else is third-party.
+                local = [t for t in names if t and ((base / (t.split(".")[0] + ".py")).is_file() or
+                                                    (base / t.split(".")[0] / "__init__.py").is_file())]
+                missing = [t for t in local if _module_file(base, t) is None]
+            else:
+                continue
+            for t in missing:
+                dots = "." * getattr(n, "level", 0)
+                src = lines[n.lineno - 1].strip() if 0 < n.lineno <= len(lines) else ""
+                problems.append(f'  File "{rel}", line {n.lineno}, in <module>\n    {src}\n'
+                                f"ImportError: project module '{dots}{t}' not found (no .py file or package for it)")
+    if not problems:
+        return None
+    return "Static check failed (nothing was executed):\n\n" + "\n\n".join(problems)
+
+_EXC_LINE_RE = re.compile(r"^([A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt))(?::.*)?$", re.MULTILINE)
+_PYTEST_SUMMARY_RE = re.compile(r"^=+ (.*\d+ (?:failed|errors?)\b.*) =+$", re.MULTILINE)
+_UNITTEST_SUMMARY_RE = re.compile(r"^FAILED \(((?:\w+=\d+(?:, )?)+)\)$", re.MULTILINE)
+# Failures that stop a program before any of its code ran rank worse than a runtime error.
+_EXC_STAGE = {"SyntaxError": 3, "IndentationError": 3, "TabError": 3, "ImportError": 2, "ModuleNotFoundError": 2}
+
+def run_failure(code: int, out: str, err: str) -> Dict:
+    """The last exception {"exc", "where"} of a run and its failing test count ("tests", None if no summary)."""
+    text = (out or "") + "\n" + (err or "")
+    excs = _EXC_LINE_RE.findall(text)
+    frames = _FRAME_RE.findall(text)
+    tests = None
+    pytest = _PYTEST_SUMMARY_RE.findall(text)
+    if pytest:
+        tests = sum(int(n) for n in re.findall(r"(\d+) (?:failed|errors?)\b", pytest[-1]))
+    else:
+        unittest = _UNITTEST_SUMMARY_RE.findall(text)
+        if unittest:
+            tests = sum(int(n) for k, n in re.findall(r"(\w+)=(\d+)", unittest[-1]) if k in ("failures", "errors"))
+    return {"code": code, "exc": excs[-1] if excs else None,
+            "where": f"{os.path.basename(frames[-1][0])}:{frames[-1][1]}" if frames else None, "tests": tests}
+
+def describe_failure(code: int, out: str, err: str) -> str:
+    if code == 0:
+        return "exit 0"
+    f = run_failure(code, out, err)
+    parts = [f"exit {code}"]
+    if f["tests"] is not None:
+        parts.append(f"{f['tests']} failing test(s)")
+    if f["exc"]:
+        parts.append(f["exc"] + (f" at {f['where']}" if f["where"] else ""))
+    return ", ".join(parts)
+
+def error_score(code: int, out: str, err: str) -> Tuple[int, int, int]:
+    """
+    Lower is better: (failed?, stage, failing tests). The stage ranks a
+    syntax error above an import error above anything raised while running,
+    so a fix that stops the program from starting counts as worse while one
+    that moves the failure elsewhere does not; test runs compare counts.
+    """
+    if code == 0:
+        return 0, 0, 0
+    f = run_failure(code, out, err)
+    stage = _EXC_STAGE.get((f["exc"] or "").rsplit(".", 1)[-1], 1)
+    return 1, stage, f["tests"] or 0
+
+def speculative_fix(model: str, root: Path, entry: str, prompt: str, n: int,
+                    edit_format: str = "whole", txn: Optional[Transaction] = None) -> Optional[Dict]:
+    """
+    Request `n` fixes concurrently (spread temperatures/seeds), apply each to
+    its own Workspace clone and run it there. Patches that don't apply are
+    retried as full files, like generate_files does. The first candidate
+    whose run exits 0 wins and the others are cancelled and waited for, so
+    none outlives the call; otherwise the candidate with the best
+    error_score is chosen. The winner's workspace is promoted into `root`,
+    recorded in `txn` when given.
+    Returns {"index", "files", "delete", "run": (code, out, err)} or None.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    if edit_format == "diff":
+        prompt += PATCH_FORMAT_RULES
+    cancel = threading.Event()
+    ctx = trace_context()
+
+    def attempt(i: int) -> Optional[Dict]:
+        opts = {"temperature": round(0.2 + 0.8 * i / max(n - 1, 1), 2), "seed": 1000 + i}
+        _, files, delete = parse_llm_files(ollama_run(model, prompt, options=opts, template="fix"))
+        if (not files and not delete) or cancel.is_set():
+            return None
+        ws = Workspace(root, "copy")   # concurrent candidates must never share inodes with each other or root
+        try:
+            failures = materialize_files(ws.path, files, delete)
+            if failures and not cancel.is_set():
+                failed = set(_full_file_fallback(model, ws.path, failures))
+                files = [f for f in files if f["path"] not in failed]
+            if not files and not delete:
+                ws.discard()
+                return None
+            problem = static_check(ws.path, entry, None if delete else [f["path"] for f in files])
+            run = (1, "", problem) if problem else ws.run(entry, cancel)
+        except Exception:
+            ws.discard()
+            raise
+        if cancel.is_set():
+            ws.discard()
+            return None
+        score = error_score(*run)
+        print(f"{ANSI_DIM}    candidate {i + 1}/{n}: {describe_failure(*run)}{ANSI_RESET}")
+        return {"index": i, "files": files, "delete": delete, "run": run, "score": score, "workspace": ws}
+
+    best: Optional[Dict] = None
+    futures: List = []
+    ex = ThreadPoolExecutor(max_workers=n, initializer=set_job_output, initargs=(job_output(),))
+    try:
+        futures = [ex.submit(in_trace_context, dict(ctx, candidate=i + 1), attempt, i) for i in range(n)]
+        for fut in as_completed(futures):
+            try:
+                res = fut.result()
+            except Exception as e:
+                print(f"{ANSI_YELLOW}[!] Fix candidate failed: {e}{ANSI_RESET}")
+                continue
+            if res is None:
+                continue
+            if best is None or res["score"] < best["score"]:
+                if best is not None:
+                    best["workspace"].discard()
+                best = res
+            else:
+                res["workspace"].discard()
+            if res["run"][0] == 0:
+                cancel.set()
+                break
+    finally:
+        cancel.set()
+        # Wait for the losers: they print into this job's log and own workspaces, neither may outlive the call.
+        ex.shutdown(wait=True, cancel_futures=True)
+        for fut in futures:
+            res = None if fut.cancelled() or fut.exception() else fut.result()
+            if res is not None and res is not best:
+                res["workspace"].discard()
+    if best is None:
+        return None
+    print(f"{ANSI_BLUE}[*] Committing fix candidate {best['index'] + 1}/{n}{ANSI_RESET}")
+    ws = best.pop("workspace")
+    # The run is reused as the next iteration's result; its tracebacks must point at the project, not the clone.
+    code, out, err = best["run"]
+    best["run"] = (code, ws.localize(out), ws.localize(err))
+    ws.promote(txn)
+    return best
+
+@traced("fix_loop", lambda ok: {"ok": ok})
+def fix_loop(model: str, root: Path, entry: str, max_iters: int, auto_pip: bool, stream: bool = False,
+             edit_format: str = "whole", candidates: int = 1, stats: Optional[Dict] = None) -> bool:
+    """Run, and on failure ask for fixes until the entrypoint exits 0. `stats` receives the iteration count."""
+    last: Optional[Tuple[int, str, str]] = None
+    changed: Optional[List[str]] = None     # files written by the last fix (None: check the whole tree)
+    txn: Optional[Transaction] = None       # the last fix, kept until its run shows it didn't make things worse
+    before: Tuple[int, str, str] = (0, "", "")
+    rejected = ""
+    install_missing_imports(root, auto_pip)
+    create_checkpoint(root, "before fix")
     for i in range(1, max_iters + 1):
-        code, out, err = run_project(root, entry)
+        set_trace_context(iteration=i)
+        if stats is not None:
+            stats["iterations"] = i
+        problem = static_check(root, entry, changed) if last is None else None
+        if problem:
+            print(f"{ANSI_YELLOW}[!] Static check failed (iteration {i}); not running.{ANSI_RESET}")
+            code, out, err = 1, "", problem
+        else:
+            code, out, err = last if last is not None else run_project(root, entry, use_cache=True)
+        last = None
+        may_pip = not problem      # static failures and reverted fixes aren't missing-package errors
+        if txn is not None:
+            new_score, old_score = error_score(code, out, err), error_score(*before)
+            if new_score > old_score:
+                paths = txn.paths
+                print(f"{ANSI_YELLOW}[!] Fix made things worse ({describe_failure(*before)} -> "
+                      f"{describe_failure(code, out, err)}); rolling back {', '.join(paths)}{ANSI_RESET}")
+                rejected = (f"\n\nNOTE: a previous fix attempt that changed {', '.join(paths)} was reverted "
+                            f"because it failed worse:\n{condense_error(err or out, 1_500)}")
+                txn.rollback()
+                create_checkpoint(root, f"fix iteration {i - 1} reverted")
+                code, out, err = before
+                may_pip = False
+            else:
+                txn.commit()
+            txn = None
         if code == 0:
             print(f"{ANSI_GREEN}[+] Run OK (iteration {i}){ANSI_RESET}")
             if out.strip():
@@ -367,30 +3591,56 @@ def fix_loop(model: str, root: Path, entry: str, max_iters: int, auto_pip: bool)
             return True
 
         combined = (err or "") + "\n" + (out or "")
-        installed = maybe_install_missing_from_error(combined, auto_pip)
+        installed = maybe_install_missing_from_error(combined, auto_pip, root) if may_pip else None
         if installed:
             print(f"{ANSI_BLUE}[+] Installed '{installed}', retrying...{ANSI_RESET}")
             continue
 
         print(f"{ANSI_YELLOW}[!] Failure (iteration {i}) — attempting LLM fix{ANSI_RESET}")
-        snapshot = snapshot_project(root)
-        resp = ollama_run(model, FIX_PROMPT.format(error=combined, snapshot=snapshot, entry=entry))
-        _, files, delete = parse_llm_files(resp)
+        error = condense_error(combined)
+        snapshot = build_fix_context(root, error, snapshot_budget(model))
+        prompt = FIX_PROMPT.format(error=error + rejected, snapshot=snapshot, entry=entry)
+        rejected = ""
+        before, txn = (code, out, err), Transaction(root)
+        if candidates > 1:
+            best = speculative_fix(model, root, entry, prompt, candidates, edit_format, txn)
+            if best is None:
+                txn.commit()
+                print(f"{ANSI_RED}[!] No usable fix candidates; stopping.{ANSI_RESET}")
+                return False
+            # The candidate already ran (or was statically checked) on an identical copy; reuse that result.
+            # Like a sequential fix, it is rolled back next iteration if it scores worse than `before`.
+            last = best["run"]
+            create_checkpoint(root, f"fix iteration {i} (candidate {best['index'] + 1})")
+            continue
+        _, files, delete = generate_files(model, prompt, root, stream, template="fix", edit_format=edit_format,
+                                          txn=txn)
         if not files and not delete:
+            txn.commit()
             print(f"{ANSI_RED}[!] LLM provided no changes; stopping.{ANSI_RESET}")
             return False
-        materialize_files(root, files, delete)
+        changed = None if delete else [f["path"] for f in files]
+        create_checkpoint(root, f"fix iteration {i}")
+    if txn is not None:
+        if last is not None and error_score(*last) > error_score(*before):
+            # A speculative candidate's result is already known; don't leave a worse one behind.
+            print(f"{ANSI_YELLOW}[!] Last fix made things worse; rolling back {', '.join(txn.paths)}{ANSI_RESET}")
+            txn.rollback()
+            create_checkpoint(root, f"fix iteration {max_iters} reverted")
+        else:
+            txn.commit()
     print(f"{ANSI_RED}[!] Reached max fix iterations; still failing.{ANSI_RESET}")
     return False
 
 # ----------------------------
 # Dependency preflight
 # ----------------------------
+@traced("preflight")
 def dependency_preflight(model: str, task: str, auto_pip: bool):
     if not auto_pip:
         return
     try:
-        resp = ollama_run(model, DEP_PLAN_PROMPT.format(task=task))
+        resp = ollama_run(model, DEP_PLAN_PROMPT.format(task=task), template="dep_plan")
         text = resp.strip()
         if text.startswith("```"):
             text = text.strip("`")
@@ -406,87 +3656,610 @@ def dependency_preflight(model: str, task: str, auto_pip: bool):
 # ----------------------------
 # High-level ops
 # ----------------------------
-def create_project(model: str, root: Path, task: str, entry_hint: str, auto_pip: bool, open_vscode_flag: bool) -> str:
+@traced("create")
+def create_project(model: str, root: Path, task: str, entry_hint: str, auto_pip: bool, open_vscode_flag: bool,
+                   stream: bool = False, venv: bool = False) -> str:
     ensure_dir(root)
-    dependency_preflight(model, task, auto_pip)
-    resp = ollama_run(model, CREATE_PROMPT.format(task=task))
-    entry, files, delete = parse_llm_files(resp)
+    if stream and open_vscode_flag:
+        # Open first so files can be watched landing as they stream in.
+        open_in_vscode(root)
+    if not venv:
+        # A pooled env is keyed by requirements.txt, which doesn't exist yet; the import scan covers it instead.
+        dependency_preflight(model, task, auto_pip)
+    entry, files, delete = generate_files(model, CREATE_PROMPT.format(task=task), root, stream, template="create")
     if not entry:
         entry = entry_hint or DEFAULT_ENTRY
-    materialize_files(root, files, delete)
-    if auto_pip:
-        pip_install_requirements(root / "requirements.txt")
     manifest = {"model": model, "entrypoint": entry, "task": task}
+    if venv:
+        manifest["venv"] = True
     save_manifest(root, manifest)
+    sync_requirements(root, auto_pip)
+    create_checkpoint(root, f"new: {task[:60]}")
     write_handoff_note(root, "Project Created",
                     f"Entry: `{entry}`\n\nUse the CLI (run/fix/edit/agent/fleet) as needed.")
-    if open_vscode_flag:
+    if open_vscode_flag and not stream:
         open_in_vscode(root)
     return entry
 
-def edit_project(model: str, root: Path, instruction: str, auto_pip: bool, open_vscode_flag: bool):
+@traced("edit")
+def edit_project(model: str, root: Path, instruction: str, auto_pip: bool, open_vscode_flag: bool,
+                 stream: bool = False, edit_format: str = "whole") -> bool:
     manifest = load_manifest(root)
     entry = manifest.get("entrypoint", DEFAULT_ENTRY)
-    snapshot = snapshot_project(root)
-    resp = ollama_run(model, EDIT_PROMPT.format(instruction=instruction, snapshot=snapshot))
-    _, files, delete = parse_llm_files(resp)
+    create_checkpoint(root, "before edit")
+    snapshot = snapshot_project(root, snapshot_budget(model), query=instruction)
+    _, files, delete = generate_files(model, EDIT_PROMPT.format(instruction=instruction, snapshot=snapshot),
+                                      root, stream, template="edit", edit_format=edit_format)
     if not files and not delete:
         raise RuntimeError("Edit produced no changes.")
-    materialize_files(root, files, delete)
-    if auto_pip and (root / "requirements.txt").exists():
-        pip_install_requirements(root / "requirements.txt")
+    create_checkpoint(root, f"edit: {instruction[:60]}")
+    sync_requirements(root, auto_pip)
+    install_missing_imports(root, auto_pip)
     write_handoff_note(root, "Edit Applied", f"Instruction:\n\n{instruction}\n")
     if open_vscode_flag:
         open_in_vscode(root)
-    code, out, err = run_project(root, entry)
+    code, out, err = run_project(root, entry, use_cache=True)
     if code == 0:
         print(f"{ANSI_GREEN}[+] Project runs successfully after edit.{ANSI_RESET}")
         if out.strip(): print(out)
     else:
         print(f"{ANSI_YELLOW}[!] Project failed after edit. Use 'fix' to attempt automatic repairs.{ANSI_RESET}")
         if err.strip(): print(err)
+    return code == 0
 
 # ----------------------------
 # Agents / Fleets / Delegation
 # ----------------------------
-def agent_run(model: str, root: Path, name: str, goal: str):
-    snapshot = snapshot_project(root)
-    resp = ollama_run(model, AGENT_PROMPT.format(goal=goal, snapshot=snapshot))
-    _, files, delete = parse_llm_files(resp)
+@traced("agent")
+def agent_run(model: str, root: Path, name: str, goal: str, stream: bool = False, edit_format: str = "whole"):
+    set_trace_context(agent=name)
+    create_checkpoint(root, f"before agent {name}")
+    snapshot = snapshot_project(root, snapshot_budget(model), query=goal)
+    _, files, delete = generate_files(model, AGENT_PROMPT.format(goal=goal, snapshot=snapshot), root, stream,
+                                      template="agent", edit_format=edit_format)
     if not files and not delete:
         print(f"{ANSI_YELLOW}[!] Agent '{name}' produced no changes.{ANSI_RESET}")
         return
-    materialize_files(root, files, delete)
+    create_checkpoint(root, f"agent {name}: {goal[:60]}")
     write_handoff_note(root, f"Agent {name} Change", f"Goal:\n\n{goal}\n")
     print(f"{ANSI_GREEN}[+] Agent '{name}' applied changes.{ANSI_RESET}")
 
-def fleet_run(model: str, root: Path, plan_path: Path):
+CONFLICT_STRATEGIES = ("rerun", "merge")
+MAX_AGENT_ATTEMPTS = 3     # dispatches per fleet agent before a conflicting result is applied anyway
+
+def norm_relpath(path: str) -> str:
+    rel = Path(path).as_posix().lstrip("/")
+    return rel[2:] if rel.startswith("./") else rel
+
+def file_sha256(root: Path, rel: str) -> Optional[str]:
+    p = root / rel
+    try:
+        return hashlib.sha256(p.read_bytes()).hexdigest() if p.is_file() else None
+    except OSError:
+        return None
+
+@traced("agent")
+def propose_changes(model: str, base: List[Dict], goal: str, edit_format: str = "whole") -> Dict[str, Optional[str]]:
+    """
+    Run one agent against a base snapshot without touching disk.
+    Returns {path: new content, or None for a delete}; patches are resolved
+    against the base, and those that don't apply are retried as full files.
+    Paths that climb out of the project ("..") are dropped.
+    """
+    by_path = {b["path"]: b for b in base}
+    prompt = AGENT_PROMPT.format(goal=goal, snapshot=render_snapshot(base, snapshot_budget(model), query=goal))
+    if edit_format == "diff":
+        prompt += PATCH_FORMAT_RULES
+    _, files, delete = parse_llm_files(ollama_run(model, prompt, template="agent"))
+    changes: Dict[str, Optional[str]] = {norm_relpath(d): None for d in delete or []}
+    failures, current = [], {}
+    for f in files:
+        path = norm_relpath(f["path"])
+        old = changes.get(path, by_path[path]["content"] if path in by_path else None)
+        try:
+            changes[path] = apply_file_change(old, f)
+        except PatchError as e:
+            print(f"{ANSI_YELLOW}[!] Patch for {path} did not apply: {str(e).splitlines()[0]}{ANSI_RESET}")
+            failures.append({"path": path, "error": str(e), "entry": f})
+            current[path] = old
+    if failures:
+        for f in _request_full_files(model, failures, current):
+            changes[f["path"]] = f.get("content", "")
+        still = sorted(p for p in current if p not in changes)
+        if still:
+            print(f"{ANSI_RED}[!] Could not update: {', '.join(still)}{ANSI_RESET}")
+    escaping = sorted(p for p in changes if not p or ".." in p.split("/"))
+    if escaping:
+        print(f"{ANSI_YELLOW}[!] Ignoring paths outside the project: {', '.join(escaping)}{ANSI_RESET}")
+    return {p: c for p, c in changes.items() if p not in escaping}
+
+def apply_changes(root: Path, changes: Dict[str, Optional[str]]):
+    materialize_files(root, [{"path": p, "content": c} for p, c in changes.items() if c is not None],
+                      [p for p, c in changes.items() if c is None])
+
+def merge_file(model: str, path: str, base: Optional[str], a_name: str, a: str,
+               b_name: str, b_goal: str, b: str) -> Optional[str]:
+    resp = ollama_run(model, MERGE_PROMPT.format(path=path, base=base if base is not None else "<<new file>>",
+                                                 a_name=a_name, a=a, b_name=b_name, b_goal=b_goal, b=b),
+                      template="merge")
+    _, files, _ = parse_llm_files(resp)
+    for f in files:
+        if norm_relpath(f.get("path", "")) == path and not is_patch(f):
+            return f.get("content", "")
+    return None
+
+def _changed_since_base(root: Path, changes: Dict[str, Optional[str]], base_hash: Dict[str, str]) -> List[str]:
+    """Paths whose on-disk content moved away from the agent's base and differs from what it wants to write."""
+    clash = []
+    for path, content in changes.items():
+        current = file_sha256(root, path)
+        if current == base_hash.get(path):
+            continue
+        wanted = hashlib.sha256(content.encode("utf-8")).hexdigest() if content is not None else None
+        if current != wanted:
+            clash.append(path)
+    return clash
+
+def _merge_conflicts(model: str, root: Path, name: str, goal: str, changes: Dict[str, Optional[str]],
+                     clash: List[str], base_text: Dict[str, str]) -> Optional[Dict[str, Optional[str]]]:
+    """Resolve conflicting files with the merge agent; None if any can't be merged (deletes, bad output)."""
+    merged = dict(changes)
+    for path in clash:
+        mine = changes[path]
+        current = read_file(root, path) if (root / path).is_file() else None
+        if mine is None or current is None:
+            return None
+        print(f"{ANSI_BLUE}[*] Merging {path} for agent '{name}'{ANSI_RESET}")
+        result = merge_file(model, path, base_text.get(path), "current tree", current, name, goal, mine)
+        if result is None:
+            return None
+        merged[path] = result
+    return merged
+
+def in_scope(path: str, scope: List[str]) -> bool:
+    return not scope or any(fnmatch.fnmatch(path, pat) or path.startswith(pat.rstrip("/") + "/") for pat in scope)
+
+def _scopes_overlap(a: List[str], b: List[str], files: List[str]) -> bool:
+    if not a or not b:
+        return False    # an unscoped agent may touch anything; conflicts are caught at merge time
+    if set(a) & set(b):
+        return True
+    return any(in_scope(f, a) and in_scope(f, b) for f in files) or \
+        any(fnmatch.fnmatch(x, y) or fnmatch.fnmatch(y, x) for x in a for y in b)
+
+def load_fleet_plan(data: Dict) -> List[Dict]:
+    """
+    Normalize and validate plan agents: unique names, known dependencies, no cycles.
+    Each agent becomes {"name", "goal", "depends_on", "files", "priority"}.
+    """
+    raw = data.get("agents", [])
+    if not isinstance(raw, list):
+        raise ValueError("'agents' must be a list")
+    agents, seen = [], set()
+    for i, a in enumerate(raw):
+        name = str(a.get("name") or f"agent{i + 1}")
+        if name in seen:
+            raise ValueError(f"duplicate agent name '{name}'")
+        seen.add(name)
+        deps = a.get("depends_on") or []
+        deps = [deps] if isinstance(deps, str) else list(deps)
+        scope = a.get("files") or []
+        scope = [scope] if isinstance(scope, str) else list(scope)
+        agents.append({"name": name, "goal": a.get("goal", ""), "depends_on": deps,
+                       "files": scope, "priority": int(a.get("priority", 0))})
+    for a in agents:
+        unknown = [d for d in a["depends_on"] if d not in seen]
+        if unknown:
+            raise ValueError(f"agent '{a['name']}' depends on unknown agent(s): {', '.join(unknown)}")
+    # Kahn's algorithm just to reject cycles up front.
+    indeg = {a["name"]: len(a["depends_on"]) for a in agents}
+    queue_ = [n for n, d in indeg.items() if d == 0]
+    visited = 0
+    while queue_:
+        n = queue_.pop()
+        visited += 1
+        for a in agents:
+            if n in a["depends_on"]:
+                indeg[a["name"]] -= 1
+                if indeg[a["name"]] == 0:
+                    queue_.append(a["name"])
+    if visited != len(agents):
+        raise ValueError("plan has a dependency cycle: " + ", ".join(n for n, d in indeg.items() if d > 0))
+    return agents
+
+def fleet_critical_path(agents: List[Dict], durations: Dict[str, float]) -> Tuple[float, List[str]]:
+    """Longest duration-weighted dependency chain among agents that ran."""
+    by_name = {a["name"]: a for a in agents}
+    memo: Dict[str, Tuple[float, List[str]]] = {}
+
+    def longest(n: str) -> Tuple[float, List[str]]:
+        if n not in memo:
+            best: Tuple[float, List[str]] = (0.0, [])
+            for d in by_name[n]["depends_on"]:
+                cand = longest(d)
+                if cand[0] > best[0]:
+                    best = cand
+            memo[n] = (best[0] + durations.get(n, 0.0), best[1] + [n])
+        return memo[n]
+    return max((longest(a["name"]) for a in agents if a["name"] in durations), default=(0.0, []))
+
+def _load_fleet_state(root: Path) -> Dict:
+    try:
+        return json.loads((root / FLEET_STATE_NAME).read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def _save_fleet_state(root: Path, state: Dict):
+    write_file(root, FLEET_STATE_NAME, json.dumps(state, indent=2))
+
+@traced("fleet", lambda ok: {"ok": ok})
+def fleet_run_dag(model: str, root: Path, agents: List[Dict], workers: int = 1, edit_format: str = "whole",
+                  on_conflict: str = "rerun", resume: bool = False) -> bool:
+    """
+    Ready-queue scheduler: agents whose dependencies are done run in parallel
+    (up to `workers`, highest priority / most dependents first, never two with
+    overlapping file scopes). Each agent works from a snapshot taken when it
+    is dispatched; on completion its changes are checked against that base
+    by hash and merged, re-run or sent to the merge agent on conflict.
+    Failures skip all dependents. Progress is recorded in FLEET_STATE_NAME so
+    an interrupted plan can be resumed.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    by_name = {a["name"]: a for a in agents}
+    order = {a["name"]: i for i, a in enumerate(agents)}
+    dependents: Dict[str, int] = {}
+    for a in agents:
+        for d in a["depends_on"]:
+            dependents[d] = dependents.get(d, 0) + 1
+    goal_sha = {a["name"]: hashlib.sha256(json.dumps(a, sort_keys=True).encode()).hexdigest()[:16] for a in agents}
+
+    prev = _load_fleet_state(root).get("agents", {}) if resume else {}
+    state: Dict = {"agents": {}}
+    done, failed, skipped = set(), set(), set()
+    durations: Dict[str, float] = {}
+    for n, rec in prev.items():
+        if n in by_name and rec.get("status") == "done" and rec.get("sha") == goal_sha[n]:
+            done.add(n)
+            durations[n] = rec.get("duration", 0.0)
+            state["agents"][n] = rec
+    if done:
+        print(f"{ANSI_BLUE}[*] Resuming plan: {len(done)} agent(s) already done ({', '.join(sorted(done))}){ANSI_RESET}")
+
+    def record(n: str, status: str, **extra):
+        state["agents"][n] = {"status": status, "sha": goal_sha[n], **extra}
+        _save_fleet_state(root, state)
+
+    pending = [a["name"] for a in agents if a["name"] not in done]
+    attempts: Dict[str, int] = {}
+    running: Dict = {}
+    wall_start = time.time()
+    ex = ThreadPoolExecutor(max_workers=max(1, workers), initializer=set_job_output, initargs=(job_output(),))
+    try:
+        while True:
+            for n in list(pending):
+                bad = [d for d in by_name[n]["depends_on"] if d in failed or d in skipped]
+                if bad:
+                    pending.remove(n)
+                    skipped.add(n)
+                    record(n, "skipped", reason=f"dependency failed: {', '.join(bad)}")
+                    print(f"{ANSI_YELLOW}[!] Skipping agent '{n}' (dependency failed: {', '.join(bad)}){ANSI_RESET}")
+            ready = [n for n in pending if all(d in done for d in by_name[n]["depends_on"])]
+            ready.sort(key=lambda n: (-by_name[n]["priority"], -dependents.get(n, 0), order[n]))
+            tree = discover_files(root) if any(by_name[n]["files"] for n in ready) else []
+            for n in ready:
+                if len(running) >= max(1, workers):
+                    break
+                busy = [info[0] for info in running.values()]
+                if any(_scopes_overlap(by_name[n]["files"], by_name[r]["files"], tree) for r in busy):
+                    continue
+                base = snapshot_blocks(root)
+                a = by_name[n]
+                print(f"{ANSI_BLUE}[*] Fleet running agent: {n} — {a['goal']}{ANSI_RESET}")
+                fut = ex.submit(in_trace_context, dict(trace_context(), agent=n), propose_changes, model, base,
+                                a["goal"], edit_format)
+                running[fut] = (n, base, time.time())
+                pending.remove(n)
+                attempts[n] = attempts.get(n, 0) + 1
+            if not running:
+                break
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                n, base, t0 = running.pop(fut)
+                a = by_name[n]
+                try:
+                    changes = fut.result()
+                except Exception as e:
+                    failed.add(n)
+                    record(n, "failed", error=str(e), duration=time.time() - t0)
+                    print(f"{ANSI_RED}[!] Agent '{n}' failed: {e}{ANSI_RESET}")
+                    continue
+                outside = [p for p in changes if not in_scope(p, a["files"])]
+                if outside:
+                    print(f"{ANSI_YELLOW}[!] Agent '{n}' ignored changes outside its scope: "
+                          f"{', '.join(sorted(outside))}{ANSI_RESET}")
+                    changes = {p: c for p, c in changes.items() if p not in outside}
+                clash = _changed_since_base(root, changes, {b["path"]: b["sha256"] for b in base})
+                if clash and on_conflict == "merge":
+                    merged = _merge_conflicts(model, root, n, a["goal"], changes, clash,
+                                              {b["path"]: b["content"] for b in base})
+                    if merged is not None:
+                        changes, clash = merged, []
+                if clash and attempts[n] < MAX_AGENT_ATTEMPTS:
+                    print(f"{ANSI_YELLOW}[!] Agent '{n}' conflicts on {', '.join(sorted(clash))}; "
+                          f"re-running on the current tree.{ANSI_RESET}")
+                    pending.insert(0, n)
+                    continue
+                if clash:
+                    print(f"{ANSI_YELLOW}[!] Agent '{n}' still conflicts after {attempts[n]} attempts; "
+                          f"applying its version of {', '.join(sorted(clash))}.{ANSI_RESET}")
+                if changes:
+                    try:
+                        for p in changes:
+                            project_path(root, p)    # e.g. through a symlink; refuse before writing anything
+                        apply_changes(root, changes)
+                    except (ValueError, OSError) as e:
+                        failed.add(n)
+                        record(n, "failed", error=str(e), duration=time.time() - t0)
+                        print(f"{ANSI_RED}[!] Agent '{n}' failed: {e}{ANSI_RESET}")
+                        continue
+                    create_checkpoint(root, f"fleet agent {n}: {a['goal'][:60]}")
+                    write_handoff_note(root, f"Agent {n} Change", f"Goal:\n\n{a['goal']}\n")
+                    print(f"{ANSI_GREEN}[+] Agent '{n}' applied changes ({len(changes)} file(s)).{ANSI_RESET}")
+                else:
+                    print(f"{ANSI_YELLOW}[!] Agent '{n}' produced no changes.{ANSI_RESET}")
+                durations[n] = time.time() - t0
+                done.add(n)
+                record(n, "done", duration=durations[n], files=sorted(changes))
+    finally:
+        ex.shutdown(wait=True)
+
+    wall = time.time() - wall_start
+    length, path = fleet_critical_path(agents, durations)
+    if path:
+        print(f"{ANSI_BLUE}[*] Critical path: {' → '.join(path)} ({length:.1f}s; wall time {wall:.1f}s){ANSI_RESET}")
+    if failed or skipped:
+        print(f"{ANSI_RED}[!] Fleet finished with {len(failed)} failed and {len(skipped)} skipped agent(s); "
+              f"re-run with --resume to retry them.{ANSI_RESET}")
+        return False
+    return True
+
+def fleet_run(model: str, root: Path, plan_path: Path, stream: bool = False, edit_format: str = "whole",
+              workers: int = 1, on_conflict: str = "rerun", resume: bool = False) -> bool:
     """
     plan.json schema:
     {
       "entrypoint": "main.py",
       "agents": [
         {"name": "planner", "goal": "draft design"},
-        {"name": "builder", "goal": "implement endpoints"},
-        {"name": "tester", "goal": "add tests"}
+        {"name": "builder", "goal": "implement endpoints", "depends_on": ["planner"], "files": ["src/*"]},
+        {"name": "tester", "goal": "add tests", "depends_on": ["builder"], "priority": 1},
+        {"name": "docs", "goal": "write README", "files": ["README.md"]}
       ]
     }
+    depends_on, files (scope globs) and priority are optional. A plain list
+    with --workers 1 runs the agents one after another as before; anything
+    else goes through the ready-queue scheduler (fleet_run_dag).
     """
     data = json.loads(plan_path.read_text(encoding="utf-8"))
-    agents = data.get("agents", [])
-    if not isinstance(agents, list) or not agents:
+    try:
+        agents = load_fleet_plan(data)
+    except ValueError as e:
+        print(f"{ANSI_RED}[!] Invalid fleet plan: {e}{ANSI_RESET}")
+        return False
+    if not agents:
         print(f"{ANSI_YELLOW}[!] Fleet plan has no agents.{ANSI_RESET}")
-        return
+        return False
+    dag = any(a["depends_on"] or a["files"] or a["priority"] for a in agents)
+    if workers > 1 or dag or resume:
+        ok = fleet_run_dag(model, root, agents, workers, edit_format, on_conflict, resume)
+        if ok:
+            print(f"{ANSI_GREEN}[+] Fleet completed.{ANSI_RESET}")
+        return ok
     for a in agents:
-        name = a.get("name", "agent")
-        goal = a.get("goal", "")
+        name = a["name"]
+        goal = a["goal"]
         print(f"{ANSI_BLUE}[*] Fleet running agent: {name} — {goal}{ANSI_RESET}")
-        agent_run(model, root, name, goal)
+        agent_run(model, root, name, goal, stream, edit_format)
     print(f"{ANSI_GREEN}[+] Fleet completed.{ANSI_RESET}")
+    return True
 
-def delegate_task(model: str, root: Path, src: str, dst: str, context: str):
+def delegate_task(model: str, root: Path, src: str, dst: str, context: str, stream: bool = False,
+                  edit_format: str = "whole"):
     goal = f"Delegated by {src} to {dst}: {context}"
-    agent_run(model, root, dst, goal)
+    agent_run(model, root, dst, goal, stream, edit_format)
+
+# ----------------------------
+# Batch (JSONL work queue)
+# ----------------------------
+# One job per line: {"id"?, "op": "new"|"edit"|"fix"|"run", "dir", "task" (new) /
+# "instruction" (edit), and optional "model", "entry", "max_iters",
+# "candidates", "edit_format", "auto_pip", "venv"}. Jobs on the same dir run
+# in file order; different dirs run concurrently over the shared model client.
+# Each job's output goes to <log dir>/<id>.log and one result line is appended
+# to the results file as it finishes, so a rerun with --resume skips finished jobs.
+# Spans of all jobs (tagged with "job") go to <log dir>/.autocoder/trace.jsonl,
+# so `stats --dir <log dir>` covers the batch.
+BATCH_OPS = ("new", "edit", "fix", "run")
+_JOB_OUTPUT = threading.local()   # .stream: the job log this thread's output goes to
+
+def job_output():
+    return getattr(_JOB_OUTPUT, "stream", None)
+
+def set_job_output(stream):
+    """Route this thread's output to `stream`; pools pass it as their initializer so workers log with their job."""
+    _JOB_OUTPUT.stream = stream
+
+class _ThreadRoutedStream:
+    """sys.stdout/sys.stderr stand-in that sends a thread's writes to its job log (others pass through)."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def _target(self):
+        return job_output() or self.fallback
+
+    def write(self, data: str) -> int:
+        return self._target().write(data)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self) -> bool:
+        return False if job_output() else self.fallback.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+def batch_job_id(job: Dict) -> str:
+    return str(job.get("id") or hashlib.sha256(json.dumps(job, sort_keys=True).encode("utf-8")).hexdigest()[:12])
+
+def load_batch_jobs(path: Path) -> List[Dict]:
+    """Parse and validate the jobs file; raises ValueError naming the offending line."""
+    jobs: List[Dict] = []
+    seen = set()
+    for n, line in enumerate(path.read_text(encoding="utf-8").splitlines(), 1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"{path}:{n}: invalid JSON ({e})")
+        if not isinstance(job, dict) or job.get("op") not in BATCH_OPS or not job.get("dir"):
+            raise ValueError(f"{path}:{n}: a job needs \"op\" (one of {', '.join(BATCH_OPS)}) and \"dir\"")
+        need = {"new": "task", "edit": "instruction"}.get(job["op"])
+        if need and not job.get(need):
+            raise ValueError(f"{path}:{n}: '{job['op']}' needs \"{need}\"")
+        job["id"] = batch_job_id(job)
+        if job["id"] in seen:
+            raise ValueError(f"{path}:{n}: duplicate job id '{job['id']}'")
+        seen.add(job["id"])
+        jobs.append(job)
+    return jobs
+
+def load_batch_results(path: Path) -> Dict[str, Dict]:
+    """Latest result per job id (a torn last line from an interrupted run is ignored)."""
+    results: Dict[str, Dict] = {}
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                r = json.loads(line)
+                results[r["id"]] = r
+            except (ValueError, KeyError, TypeError):
+                continue
+    return results
+
+def run_batch_job(job: Dict, defaults: Dict) -> Dict:
+    """Execute one job; returns its result record (exceptions become status "error")."""
+    root = Path(job["dir"])
+    model = job.get("model") or defaults["model"]
+    auto_pip = job.get("auto_pip", defaults["auto_pip"])
+    max_iters = int(job.get("max_iters", defaults["max_iters"]))
+    candidates = int(job.get("candidates", defaults["candidates"]))
+    edit_format = job.get("edit_format", defaults["edit_format"])
+    stats: Dict = {}
+    result = {"id": job["id"], "op": job["op"], "dir": str(root), "model": model}
+    t0 = time.time()
+    result["started"] = round(t0, 3)
+    try:
+        if job["op"] == "new":
+            entry = create_project(model, root, job["task"], job.get("entry") or DEFAULT_ENTRY, auto_pip=auto_pip,
+                                   open_vscode_flag=False, venv=bool(job.get("venv")))
+            ok = fix_loop(model, root, entry, max_iters, auto_pip=auto_pip, edit_format=edit_format,
+                          candidates=candidates, stats=stats)
+        else:
+            if not root.is_dir():
+                raise FileNotFoundError(f"project directory {root} does not exist")
+            if job.get("venv") and not load_manifest(root).get("venv"):
+                manifest = load_manifest(root)
+                manifest["venv"] = True
+                manifest.pop("requirements_hash", None)
+                save_manifest(root, manifest)
+                sync_requirements(root, auto_pip)
+            entry = job.get("entry") or load_manifest(root).get("entrypoint") or DEFAULT_ENTRY
+            if job["op"] == "edit":
+                ok = edit_project(model, root, job["instruction"], auto_pip=auto_pip, open_vscode_flag=False,
+                                  edit_format=edit_format)
+            elif job["op"] == "fix":
+                ok = fix_loop(model, root, entry, max_iters, auto_pip=auto_pip, edit_format=edit_format,
+                              candidates=candidates, stats=stats)
+            else:
+                code, _, _ = run_project(root, entry, use_cache=True)
+                result["exit_code"] = code
+                ok = code == 0
+        result.update(status="ok" if ok else "failed", entry=entry)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    if "iterations" in stats:
+        result["iterations"] = stats["iterations"]
+    result["finished"] = round(time.time(), 3)
+    result["seconds"] = round(time.time() - t0, 3)
+    return result
+
+def batch_command(jobs_path: Path, out_path: Path, workers: int, defaults: Dict, resume: bool = False,
+                  retry_failed: bool = False, log_dir: Optional[Path] = None) -> bool:
+    """Run every job in `jobs_path`; returns True when all of them succeeded."""
+    from concurrent.futures import ThreadPoolExecutor
+    jobs = load_batch_jobs(jobs_path)
+    done = load_batch_results(out_path) if resume else {}
+    if not resume and out_path.exists() and out_path.stat().st_size:
+        raise ValueError(f"{out_path} already has results; pass --resume to continue it or choose another --out")
+    finished_ok = {i for i, r in done.items() if r.get("status") == "ok" or (r.get("status") and not retry_failed)}
+    pending = [j for j in jobs if j["id"] not in finished_ok]
+    log_dir = log_dir or out_path.with_name(out_path.stem + ".logs")
+    ensure_dir(log_dir)
+    ensure_dir(out_path.parent if str(out_path.parent) else Path("."))
+    skipped = len(jobs) - len(pending)
+    print(f"{ANSI_BLUE}[*] Batch: {len(pending)} job(s) to run"
+          f"{f', {skipped} already finished' if skipped else ''}; logs in {log_dir}{ANSI_RESET}")
+    chains: Dict[str, List[Dict]] = {}
+    for j in pending:
+        chains.setdefault(str(Path(j["dir"]).resolve()), []).append(j)
+    results = {i: r for i, r in done.items() if i in finished_ok}
+    out_lock = threading.Lock()
+    counter = {"n": 0}
+    console = sys.stdout
+
+    def run_chain(chain: List[Dict]):
+        for job in chain:
+            log_path = log_dir / f"{re.sub(r'[^A-Za-z0-9._-]', '_', job['id'])}.log"
+            with open(log_path, "a", encoding="utf-8") as log:
+                set_job_output(log)
+                try:
+                    print(f"[*] {time.strftime('%Y-%m-%d %H:%M:%S')} {json.dumps(job)}")
+                    result = in_trace_context({"job": job["id"]}, run_batch_job, job, defaults)
+                finally:
+                    set_job_output(None)
+            result["log"] = str(log_path)
+            with out_lock:
+                with open(out_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+                results[job["id"]] = result
+                counter["n"] += 1
+                color = ANSI_GREEN if result["status"] == "ok" else ANSI_RED
+                iters = f" ({result['iterations']} iteration(s))" if "iterations" in result else ""
+                console.write(f"{color}[{counter['n']}/{len(pending)}] {result['status']:<6}{ANSI_RESET} "
+                              f"{job['id']}  {job['op']} {job['dir']}  {result['seconds']:.1f}s{iters}"
+                              f"{'  ' + result['error'] if result.get('error') else ''}\n")
+                console.flush()
+
+    old_streams = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _ThreadRoutedStream(old_streams[0]), _ThreadRoutedStream(old_streams[1])
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            for fut in [ex.submit(run_chain, chain) for chain in chains.values()]:
+                fut.result()
+    finally:
+        sys.stdout, sys.stderr = old_streams
+    counts: Dict[str, int] = {}
+    for j in jobs:
+        status = results.get(j["id"], {}).get("status", "not run")
+        counts[status] = counts.get(status, 0) + 1
+    summary = ", ".join(f"{n} {s}" for s, n in sorted(counts.items()))
+    ok = counts.get("ok", 0) == len(jobs)
+    print(f"{ANSI_GREEN if ok else ANSI_YELLOW}[*] Batch finished: {summary}. Results: {out_path}{ANSI_RESET}")
+    return ok
 
 # ----------------------------
 # MCP-style connectors (minimal)
@@ -500,13 +4273,21 @@ def delegate_task(model: str, root: Path, src: str, dst: str, context: str):
 #     kind: http_get
 #     base: "https://api.github.com"
 # ----------------------------
+_YAML_MEMO: Dict[str, Tuple[int, dict]] = {}   # path -> (mtime_ns, parsed); connectors stay parsed under serve
+
 def load_yaml_safe(p: Path) -> dict:
+    key, mtime = str(p.resolve()), p.stat().st_mtime_ns
+    hit = _YAML_MEMO.get(key)
+    if hit and hit[0] == mtime:
+        return hit[1]
     try:
         import yaml  # PyYAML
     except ImportError:
         pip_install_packages(["pyyaml"])
         import yaml
-    return yaml.safe_load(p.read_text(encoding="utf-8"))
+    data = yaml.safe_load(p.read_text(encoding="utf-8"))
+    _YAML_MEMO[key] = (mtime, data)
+    return data
 
 def mcp_call(root: Path, tool: str, arg: Optional[str]):
     cfg_path = root / MCP_CONFIG_FILE
@@ -570,7 +4351,13 @@ def mcp_call(root: Path, tool: str, arg: Optional[str]):
 # ----------------------------
 def stream_exec(cmd: str, cwd: Path) -> int:
     print(f"{ANSI_BLUE}[$] {cmd}{ANSI_RESET}")
-    proc = subprocess.Popen(cmd, cwd=str(cwd), shell=True,
+    env = None
+    python = project_python(cwd)
+    if python != sys.executable:
+        # Put the project's env first on PATH so `python`/`pytest` resolve to it.
+        env = dict(os.environ, VIRTUAL_ENV=str(Path(python).parent.parent))
+        env["PATH"] = str(Path(python).parent) + os.pathsep + env.get("PATH", "")
+    proc = subprocess.Popen(cmd, cwd=str(cwd), shell=True, env=env,
                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
     def pump(stream, color=None):
         for line in iter(stream.readline, ''):
@@ -585,10 +4372,550 @@ def stream_exec(cmd: str, cwd: Path) -> int:
     t1.join(); t2.join()
     return proc.returncode
 
+# ----------------------------
+# Benchmarks (offline, mock model server)
+# ----------------------------
+BENCH_SIZES = (10, 100, 1000, 10000)
+BENCH_FLEET_AGENTS = 16
+BENCH_NOISE_SECONDS = 0.002    # differences below this are never reported as regressions
+
+class MockOllamaServer:
+    """
+    Minimal stand-in for the Ollama HTTP API (/api/version, /api/generate,
+    /api/chat, streaming or not). `responder(prompt) -> text` picks the
+    reply; `latency` seconds are slept before answering.
+    """
+
+    def __init__(self, responder, latency: float = 0.0, port: int = 0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body: bytes):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send(b'{"version":"mock"}')
+
+            def do_POST(self):
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                prompt = req.get("prompt") or "".join(m.get("content", "") for m in req.get("messages", []))
+                with server.lock:
+                    server.requests += 1
+                    server.options.append(req.get("options") or {})
+                if server.latency:
+                    time.sleep(server.latency)
+                text = server.responder(prompt)
+                chat = "messages" in req
+                # Rough token counts (~4 chars/token) so usage reporting has something to show.
+                usage = {"prompt_eval_count": len(prompt) // 4, "eval_count": len(text) // 4}
+                if not req.get("stream"):
+                    out = {"message": {"role": "assistant", "content": text}} if chat else {"response": text}
+                    self._send(json.dumps(dict(out, done=True, **usage)).encode("utf-8"))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(0, len(text), 256):
+                    piece = text[i:i + 256]
+                    out = {"message": {"role": "assistant", "content": piece}} if chat else {"response": piece}
+                    self._chunk(json.dumps(dict(out, done=False)) + "\n")
+                self._chunk(json.dumps(dict(usage, done=True)) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, line: str):
+                data = line.encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        self.responder = responder
+        self.latency = latency
+        self.requests = 0
+        self.options: List[Dict] = []      # "options" of each request, in arrival order
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def canned_responder(responses: List[str]):
+    """Replay `responses` in order, cycling."""
+    state = {"i": 0}
+    lock = threading.Lock()
+
+    def respond(prompt: str) -> str:
+        with lock:
+            text = responses[state["i"] % len(responses)]
+            state["i"] += 1
+        return text
+    return respond
+
+def write_fake_ollama(bin_dir: Path, response_file: Path, latency: float = 0.0) -> Path:
+    """A fake `ollama` executable (`ollama run <model>` reads stdin, prints the canned response)."""
+    ensure_dir(bin_dir)
+    exe = bin_dir / "ollama"
+    exe.write_text(f"#!{sys.executable}\n"
+                   "import sys, time\n"
+                   "sys.stdin.read()\n"
+                   f"time.sleep({latency!r})\n"
+                   f"sys.stdout.write(open({str(response_file)!r}, encoding='utf-8').read())\n", encoding="utf-8")
+    exe.chmod(0o755)
+    return exe
+
+def make_synthetic_project(root: Path, n_files: int) -> Path:
+    """`n_files` Python files (main.py plus packages of 50 modules) that import each other and a few third-party names."""
+    ensure_dir(root)
+    files = {"main.py": "from pkg0 import mod0\n\nif __name__ == '__main__':\n    print(mod0.run(3))\n"}
+    i = 0
+    while len(files) < n_files:
+        pkg = f"pkg{i // 50}"
+        if f"{pkg}/__init__.py" not in files:
+            files[f"{pkg}/__init__.py"] = ""
+            continue
+        third = ("yaml", "requests", "numpy")[i % 3]
+        files[f"{pkg}/mod{i % 50}.py"] = (
+            f'"""Synthetic module {i} for benchmarks."""\nimport json\nimport os\n'
+            f"try:\n    import {third}\nexcept ImportError:\n    {third} = None\n\n"
+            f"class Worker{i}:\n    def __init__(self, scale: int = {i}):\n        self.scale = scale\n\n"
+            f"    def compute(self, values):\n        return [v * self.scale for v in values]\n\n"
+            f"def run(n):\n    w = Worker{i}()\n    return json.dumps(w.compute(list(range(n))))\n\n"
+            + "".join(f"def helper_{i}_{k}(x):\n    return x + {k}\n\n" for k in range(8)))
+        i += 1
+    for rel, content in files.items():
+        write_file(root, rel, content)
+    return root
+
+def _bench_time(fn, repeat: int, setup=None) -> float:
+    """Best of `repeat` runs (seconds), stdout silenced."""
+    import contextlib
+    import io
+    best = float("inf")
+    for _ in range(max(repeat, 1)):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+    return best
+
+def _drop_index(root: Path):
+    with _INDEX_LOCK:
+        _INDEX_MEMO.pop(str(root.resolve()), None)
+    _TERMS_MEMO.clear()
+    try:
+        (root / INDEX_NAME).unlink()
+    except FileNotFoundError:
+        pass
+
+def run_benchmarks(sizes: List[int], repeat: int = 3, latency: float = 0.0,
+                   workdir: Optional[Path] = None) -> Dict:
+    """Time autocoder's own overhead against a mock model. Returns {"meta", "results": {metric: seconds}}."""
+    base = Path(workdir or tempfile.mkdtemp(prefix="autocoder-bench-"))
+    ensure_dir(base)
+    results: Dict[str, float] = {}
+    fix_reply = json.dumps({"files": [{"path": "main.py", "content": "print('fixed')\n"}]})
+
+    def respond(prompt: str) -> str:
+        m = re.search(r"bench-goal-(\d+)", prompt)
+        if m:
+            return json.dumps({"files": [{"path": f"agents/agent_{m.group(1)}.py", "content": f"X = {m.group(1)}\n"}]})
+        return fix_reply
+
+    server = MockOllamaServer(respond, latency=latency)
+    old_cache_dir = os.environ.get("AUTOCODER_CACHE_DIR")
+    os.environ["AUTOCODER_CACHE_DIR"] = str(base / "cache")
+    configure_backend("http", host=server.url, timeout=60, retries=0)
+    configure_llm_cache("off")
+    configure_runner(False, cache=False)
+
+    def record(name: str, seconds: float):
+        results[name] = round(seconds, 6)
+        print(f"  {name:<28} {seconds * 1000:>10.2f} ms")
+
+    try:
+        for n in sizes:
+            print(f"{ANSI_BLUE}[*] {n} files{ANSI_RESET}")
+            proj = make_synthetic_project(base / f"proj{n}", n)
+            record(f"snapshot.cold@{n}", _bench_time(lambda: snapshot_project(proj, query="worker compute"),
+                                                     repeat, setup=lambda: _drop_index(proj)))
+            record(f"snapshot.warm@{n}", _bench_time(lambda: snapshot_project(proj, query="worker compute"), repeat))
+            blocks = snapshot_blocks(proj)
+            manifest = json.dumps({"entrypoint": "main.py",
+                                   "files": [{"path": b["path"], "content": b["content"]} for b in blocks]})
+            record(f"parse@{n}", _bench_time(lambda: parse_llm_files(manifest), repeat))
+            files = parse_llm_files(manifest)[1]
+            out = base / f"mat{n}"
+            record(f"materialize.cold@{n}", _bench_time(lambda: materialize_files(out, files, []), repeat,
+                                                        setup=lambda: shutil.rmtree(out, ignore_errors=True)))
+            record(f"materialize.unchanged@{n}", _bench_time(lambda: materialize_files(out, files, []), repeat))
+            record(f"pip_plan@{n}", _bench_time(
+                lambda: missing_modules(scan_third_party_imports(proj, required_only=True)), repeat))
+            record(f"static_check@{n}", _bench_time(lambda: static_check(proj, "main.py"), repeat))
+            work = base / f"fix{n}"
+
+            def fresh_failing():
+                shutil.rmtree(work, ignore_errors=True)
+                shutil.copytree(proj, work)
+                write_file(work, "main.py", "raise RuntimeError('bench failure')\n")
+            record(f"fix_loop@{n}", _bench_time(lambda: fix_loop("bench", work, "main.py", 3, auto_pip=False),
+                                                repeat, setup=fresh_failing))
+        print(f"{ANSI_BLUE}[*] model round trips{ANSI_RESET}")
+        record("llm.http", _bench_time(lambda: ollama_run("bench", "ping"), repeat * 10))
+        if sys.platform != "win32":
+            response_file = base / "fake_response.txt"
+            response_file.write_text(fix_reply, encoding="utf-8")
+            write_fake_ollama(base / "bin", response_file, latency)
+            old_path = os.environ.get("PATH", "")
+            os.environ["PATH"] = str(base / "bin") + os.pathsep + old_path
+            configure_backend("subprocess", timeout=60)
+            try:
+                record("llm.subprocess", _bench_time(lambda: ollama_run("bench", "ping"), repeat))
+            finally:
+                os.environ["PATH"] = old_path
+                configure_backend("http", host=server.url, timeout=60, retries=0)
+        print(f"{ANSI_BLUE}[*] fleet scheduling ({BENCH_FLEET_AGENTS} agents){ANSI_RESET}")
+        fleet_root = base / "fleet"
+        plan = {"agents": [{"name": f"a{i}", "goal": f"bench-goal-{i}",
+                            "depends_on": [f"a{i - 4}"] if i >= 4 else []} for i in range(BENCH_FLEET_AGENTS)]}
+
+        def fresh_fleet():
+            shutil.rmtree(fleet_root, ignore_errors=True)
+            make_synthetic_project(fleet_root, 10)
+        for workers in (1, 4):
+            record(f"fleet.workers{workers}", _bench_time(
+                lambda: fleet_run_dag("bench", fleet_root, load_fleet_plan(plan), workers=workers),
+                repeat, setup=fresh_fleet))
+    finally:
+        server.close()
+        if old_cache_dir is None:
+            os.environ.pop("AUTOCODER_CACHE_DIR", None)
+        else:
+            os.environ["AUTOCODER_CACHE_DIR"] = old_cache_dir
+        if workdir is None:
+            shutil.rmtree(base, ignore_errors=True)
+    meta = {"version": 1, "time": time.time(), "python": sys.version.split()[0], "platform": sys.platform,
+            "sizes": list(sizes), "repeat": repeat, "latency": latency, "requests": server.requests}
+    return {"meta": meta, "results": results}
+
+def compare_benchmarks(current: Dict, baseline: Dict, threshold: float = 0.15) -> List[str]:
+    """Print current vs baseline per metric; returns the metrics that got slower than `threshold`."""
+    regressions = []
+    print(f"{'metric':<28} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for name, now in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            print(f"{name:<28} {'-':>12} {now * 1000:>12.2f}")
+            continue
+        ratio = now / old if old else float("inf")
+        slower = ratio > 1 + threshold and now - old > BENCH_NOISE_SECONDS
+        color = ANSI_RED if slower else ANSI_GREEN if ratio < 1 - threshold else ""
+        print(f"{color}{name:<28} {old * 1000:>12.2f} {now * 1000:>12.2f} {ratio:>6.2f}x{ANSI_RESET}")
+        if slower:
+            regressions.append(name)
+    return regressions
+
+def bench_command(sizes: List[int], repeat: int, latency_ms: float, out: Optional[str], compare: Optional[str],
+                  threshold: float, serve: bool = False, port: int = 11435,
+                  responses: Optional[str] = None) -> int:
+    if serve:
+        replies = [json.dumps({"files": []})]
+        if responses:
+            text = Path(responses).read_text(encoding="utf-8")
+            try:
+                data = json.loads(text)
+                replies = [r if isinstance(r, str) else json.dumps(r) for r in data] if isinstance(data, list) else [text]
+            except ValueError:
+                replies = [text]
+        server = MockOllamaServer(canned_responder(replies), latency=latency_ms / 1000, port=port)
+        print(f"{ANSI_GREEN}[+] Mock Ollama at {server.url} ({len(replies)} canned response(s)); Ctrl-C to stop.{ANSI_RESET}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.close()
+        return 0
+    report = run_benchmarks(sizes, repeat=repeat, latency=latency_ms / 1000)
+    if out:
+        Path(out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"{ANSI_GREEN}[+] Wrote {out}{ANSI_RESET}")
+    if compare:
+        baseline = json.loads(Path(compare).read_text(encoding="utf-8"))
+        slower = compare_benchmarks(report, baseline, threshold)
+        if slower:
+            print(f"{ANSI_RED}[!] {len(slower)} metric(s) slower than baseline by >{threshold:.0%}: "
+                  f"{', '.join(slower)}{ANSI_RESET}")
+            return 1
+    return 0
+
+# ----------------------------
+# Daemon (serve): hot state shared by thin CLI clients
+# ----------------------------
+# `serve` keeps one process alive with the model client (pooled HTTP
+# connections), file indexes, term/outline memos, warm runners, the LLM cache
+# and parsed MCP configs. Other invocations send their argv, cwd and AUTOCODER_*
+# environment as one JSON line over a Unix socket and get back JSON lines
+# {"stream": "out"|"err", "data": ...} and finally {"exit": code}. Commands run
+# one at a time under the client's full environment and working directory
+# (both process-wide, like the configure_* settings). A client on a different
+# interpreter gets {"fallback": reason} and runs the command itself.
+LOCAL_ONLY_COMMANDS = {"serve", "bench"}   # never forwarded (bench measures a cold process)
+_SERVE_LOCK = threading.Lock()
+
+def daemon_socket_path() -> Path:
+    return Path(os.environ.get("AUTOCODER_SOCKET") or user_cache_dir() / "serve.sock")
+
+def _daemon_request(payload: Dict, timeout: Optional[float] = None):
+    """Connected socket with `payload` sent, or None when no daemon is listening."""
+    import socket
+    path = daemon_socket_path()
+    if not hasattr(socket, "AF_UNIX") or not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(path))
+        sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def forward_to_daemon(argv: List[str]) -> Optional[int]:
+    """Run a command in the daemon, relaying its output; None when no daemon is running or it can't serve us."""
+    sock = _daemon_request({"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ), "python": sys.executable,
+                            "prefix": sys.prefix, "tty": sys.stdout.isatty(), "pid": os.getpid()})
+    if sock is None:
+        return None
+    streams = {"out": sys.stdout, "err": sys.stderr}
+    try:
+        with sock.makefile("r", encoding="utf-8") as f:
+            for line in f:
+                msg = json.loads(line)
+                if "exit" in msg:
+                    return msg["exit"]
+                if "fallback" in msg:
+                    print(f"{ANSI_DIM}[*] Not using the autocoder daemon: {msg['fallback']}{ANSI_RESET}",
+                          file=sys.stderr)
+                    return None
+                stream = streams.get(msg.get("stream"), sys.stdout)
+                stream.write(msg.get("data", ""))
+                stream.flush()
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        sock.close()
+    print(f"{ANSI_RED}[!] Lost connection to the autocoder daemon.{ANSI_RESET}", file=sys.stderr)
+    return 1
+
+class _ClientStream:
+    """File-like stand-in for sys.stdout/sys.stderr that relays writes to the client socket."""
+
+    encoding = "utf-8"
+
+    def __init__(self, conn, name: str, tty: bool, lock: threading.Lock):
+        self.conn = conn
+        self.name = name
+        self.tty = tty
+        self.lock = lock
+        self.closed = False
+
+    def write(self, data: str) -> int:
+        if data and not self.closed:
+            msg = json.dumps({"stream": self.name, "data": data}).encode("utf-8") + b"\n"
+            with self.lock:
+                try:
+                    self.conn.sendall(msg)
+                except OSError:
+                    self.closed = True   # client went away; the command still runs to completion
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return self.tty
+
+def daemon_mismatch(req: Dict) -> Optional[str]:
+    """Why this daemon can't run the request as the client would (None if it can)."""
+    python = req.get("python") or ""
+    if os.path.realpath(python) != os.path.realpath(sys.executable) or req.get("prefix") != sys.prefix:
+        return f"it runs {sys.executable} (prefix {sys.prefix}), this command uses {python or '?'}"
+    return None
+
+def _serve_one(conn, req: Dict, parser: argparse.ArgumentParser, stats: Dict) -> int:
+    lock = threading.Lock()
+    out = _ClientStream(conn, "out", bool(req.get("tty")), lock)
+    err = _ClientStream(conn, "err", bool(req.get("tty")), lock)
+    if not _SERVE_LOCK.acquire(blocking=False):
+        err.write(f"{ANSI_DIM}[*] autocoder daemon busy; command queued.{ANSI_RESET}\n")
+        _SERVE_LOCK.acquire()
+    old_cwd = os.getcwd()
+    old_env = dict(os.environ)
+    old_streams = sys.stdout, sys.stderr
+    code: int = 0
+    try:
+        os.chdir(req.get("cwd") or old_cwd)
+        os.environ.clear()
+        os.environ.update(req.get("env") or old_env)
+        sys.stdout, sys.stderr = out, err
+        stats["busy"] = " ".join(req.get("argv", []))[:80]
+        # Per-command settings start from their CLI defaults; hot state (backend pool, memos) is kept.
+        configure_runner()
+        configure_tracing(None, enabled=False)
+        try:
+            run_command(parser.parse_args(req.get("argv", [])))
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            finish_tracing()
+    finally:
+        sys.stdout, sys.stderr = old_streams
+        os.environ.clear()
+        os.environ.update(old_env)
+        os.chdir(old_cwd)
+        stats["commands"] += 1
+        stats["busy"] = ""
+        _SERVE_LOCK.release()
+    return code
+
+def serve_command(idle_timeout: float = 0.0) -> int:
+    """Run the daemon in the foreground until `serve --stop`, Ctrl-C or `idle_timeout` seconds without commands."""
+    import socket
+    import socketserver
+    if not hasattr(socket, "AF_UNIX"):
+        print(f"{ANSI_RED}[!] serve needs Unix domain sockets, which this platform lacks.{ANSI_RESET}")
+        return 1
+    path = daemon_socket_path()
+    probe = _daemon_request({"control": "status"}, timeout=2.0)
+    if probe is not None:
+        probe.close()
+        print(f"{ANSI_YELLOW}[!] A daemon is already listening on {path}.{ANSI_RESET}")
+        return 1
+    ensure_dir(path.parent)
+    try:
+        path.unlink()   # stale socket from a daemon that didn't shut down cleanly
+    except FileNotFoundError:
+        pass
+    parser = build_parser()
+    stats = {"pid": os.getpid(), "started": time.time(), "commands": 0, "busy": "", "last": time.time()}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                req = json.loads(self.rfile.readline() or b"{}")
+            except ValueError:
+                return
+            stats["last"] = time.time()
+            if req.get("control") == "status":
+                self.wfile.write(json.dumps(dict(stats, socket=str(path))).encode("utf-8") + b"\n")
+            elif req.get("control") == "stop":
+                self.wfile.write(b'{"stopping": true}\n')
+                threading.Thread(target=server.shutdown, daemon=True).start()
+            elif "argv" in req and daemon_mismatch(req):
+                self.wfile.write(json.dumps({"fallback": daemon_mismatch(req)}).encode("utf-8") + b"\n")
+            elif "argv" in req:
+                code = _serve_one(self.connection, req, parser, stats)
+                stats["last"] = time.time()
+                try:
+                    self.wfile.write(json.dumps({"exit": code}).encode("utf-8") + b"\n")
+                except OSError:
+                    pass
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    old_umask = os.umask(0o077)   # socket is private to this user
+    try:
+        server = Server(str(path), Handler)
+    finally:
+        os.umask(old_umask)
+    if idle_timeout > 0:
+        def watch_idle():
+            while True:
+                time.sleep(min(idle_timeout, 5.0))
+                if not stats["busy"] and time.time() - stats["last"] > idle_timeout:
+                    print(f"{ANSI_DIM}[*] Idle for {idle_timeout:.0f}s; stopping.{ANSI_RESET}")
+                    server.shutdown()
+                    return
+        threading.Thread(target=watch_idle, daemon=True).start()
+    print(f"{ANSI_GREEN}[+] autocoder daemon listening on {path} (pid {os.getpid()}){ANSI_RESET}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        for runner in list(_WARM_RUNNERS.values()):
+            runner.close()
+    print(f"{ANSI_DIM}[*] autocoder daemon stopped ({stats['commands']} command(s) served).{ANSI_RESET}")
+    return 0
+
+def serve_control(action: str) -> int:
+    """`serve --status` / `serve --stop` against a running daemon."""
+    sock = _daemon_request({"control": action}, timeout=5.0)
+    if sock is None:
+        print(f"{ANSI_YELLOW}[!] No autocoder daemon is running ({daemon_socket_path()}).{ANSI_RESET}")
+        return 1
+    with sock, sock.makefile("r", encoding="utf-8") as f:
+        reply = json.loads(f.readline() or "{}")
+    if action == "stop":
+        print(f"{ANSI_GREEN}[+] Daemon stopping.{ANSI_RESET}")
+    else:
+        up = time.time() - reply.get("started", time.time())
+        busy = f"running: {reply['busy']}" if reply.get("busy") else "idle"
+        print(f"pid {reply.get('pid')}  up {up:.0f}s  {reply.get('commands', 0)} command(s) served  {busy}")
+        print(f"socket: {reply.get('socket')}")
+    return 0
+
 # ----------------------------
 # CLI
 # ----------------------------
-def main():
+def add_trace_args(p: argparse.ArgumentParser):
+    p.add_argument("--trace-chrome", default=None, metavar="FILE",
+                   help="Also write this run's spans in Chrome trace format (chrome://tracing, Perfetto).")
+    p.add_argument("--no-trace", action="store_true", help=f"Don't append spans to {STATE_DIR}/{TRACE_NAME}.")
+
+def add_llm_args(p: argparse.ArgumentParser):
+    p.add_argument("--backend", choices=BACKEND_CHOICES, default=DEFAULT_BACKEND,
+                   help="LLM backend: Ollama HTTP API, `ollama run` subprocess, or auto (HTTP with fallback).")
+    p.add_argument("--ollama-host", default=None, help="Ollama API URL (default: $OLLAMA_HOST or localhost:11434).")
+    p.add_argument("--api", choices=("generate", "chat"), default="generate", help="Ollama HTTP endpoint to use.")
+    p.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE, help="How long the server keeps the model loaded.")
+    p.add_argument("--llm-timeout", type=float, default=DEFAULT_LLM_TIMEOUT, help="Seconds per LLM request.")
+    p.add_argument("--llm-retries", type=int, default=DEFAULT_LLM_RETRIES, help="Retries on connection errors.")
+    p.add_argument("--stream", action="store_true", help="Stream generation and write each file as soon as it completes.")
+    p.add_argument("--edit-format", choices=EDIT_FORMATS, default="whole",
+                   help="How the model returns changes to existing files: whole files or search/replace/diff patches.")
+    g = p.add_mutually_exclusive_group()
+    g.add_argument("--no-cache", action="store_true", help="Bypass the on-disk LLM response cache.")
+    g.add_argument("--cache-only", action="store_true", help="Only answer from the LLM cache (offline replay).")
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Autonomous multi-file coding agent (Ollama) with VS Code, Agents, MCP, and Exec.")
     sub = parser.add_subparsers(dest="cmd", required=True)
 
@@ -599,8 +4926,15 @@ def main():
     p_new.add_argument("--model", default=DEFAULT_MODEL, help="Ollama model name.")
     p_new.add_argument("--entry", default=DEFAULT_ENTRY, help="Entrypoint hint (if not provided by model).")
     p_new.add_argument("--max-iters", type=int, default=6, help="Max fix iterations.")
+    p_new.add_argument("--candidates", type=int, default=1, help="Speculative fixes to try in parallel per iteration.")
     p_new.add_argument("--no-auto-pip", action="store_true", help="Disable automatic pip installs.")
     p_new.add_argument("--vscode", action="store_true", help="Open/focus the project in VS Code.")
+    p_new.add_argument("--warm", action="store_true", help="Run the entrypoint via a warm forkserver with dependencies pre-imported.")
+    p_new.add_argument("--no-run-cache", action="store_true", help="Always execute, even if the project is unchanged since the last run.")
+    p_new.add_argument("--venv", action="store_true",
+                       help="Run in an isolated virtualenv from the shared pool (remembered in the manifest).")
+    add_llm_args(p_new)
+    add_trace_args(p_new)
 
     # fix
     p_fix = sub.add_parser("fix", help="Run fix loop on an existing project.")
@@ -608,8 +4942,15 @@ def main():
     p_fix.add_argument("--model", default=DEFAULT_MODEL, help="Ollama model name.")
     p_fix.add_argument("--entry", default=None, help="Entrypoint override (otherwise read from manifest).")
     p_fix.add_argument("--max-iters", type=int, default=6, help="Max fix iterations.")
+    p_fix.add_argument("--candidates", type=int, default=1, help="Speculative fixes to try in parallel per iteration.")
     p_fix.add_argument("--no-auto-pip", action="store_true", help="Disable automatic pip installs.")
     p_fix.add_argument("--vscode", action="store_true", help="Open/focus the project in VS Code.")
+    p_fix.add_argument("--warm", action="store_true", help="Run the entrypoint via a warm forkserver with dependencies pre-imported.")
+    p_fix.add_argument("--no-run-cache", action="store_true", help="Always execute, even if the project is unchanged since the last run.")
+    p_fix.add_argument("--venv", action="store_true",
+                       help="Run in an isolated virtualenv from the shared pool (remembered in the manifest).")
+    add_llm_args(p_fix)
+    add_trace_args(p_fix)
 
     # edit
     p_edit = sub.add_parser("edit", help="Edit/extend an existing project with new instructions.")
@@ -618,12 +4959,25 @@ def main():
     p_edit.add_argument("--model", default=DEFAULT_MODEL, help="Ollama model name.")
     p_edit.add_argument("--no-auto-pip", action="store_true", help="Disable automatic pip installs.")
     p_edit.add_argument("--vscode", action="store_true", help="Open/focus the project in VS Code.")
+    p_edit.add_argument("--warm", action="store_true", help="Run the entrypoint via a warm forkserver with dependencies pre-imported.")
+    p_edit.add_argument("--no-run-cache", action="store_true", help="Always execute, even if the project is unchanged since the last run.")
+    p_edit.add_argument("--venv", action="store_true",
+                        help="Run in an isolated virtualenv from the shared pool (remembered in the manifest).")
+    add_llm_args(p_edit)
+    add_trace_args(p_edit)
 
     # run
     p_run = sub.add_parser("run", help="Just run the project once (no LLM).")
     p_run.add_argument("--dir", required=True, help="Project directory.")
     p_run.add_argument("--entry", default=None, help="Entrypoint override (otherwise read from manifest).")
     p_run.add_argument("--vscode", action="store_true", help="Open/focus the project in VS Code.")
+    p_run.add_argument("--warm", action="store_true", help="Run the entrypoint via a warm forkserver with dependencies pre-imported.")
+    p_run.add_argument("--no-run-cache", action="store_true", help="Always execute, even if the project is unchanged since the last run.")
+    p_run.add_argument("--venv", action="store_true",
+                       help="Run in an isolated virtualenv from the shared pool (remembered in the manifest).")
+    p_run.add_argument("--sandbox", choices=WORKSPACE_MODES, nargs="?", const="auto", default=None,
+                       help="Run inside a disposable copy-on-write clone of the project (discarded afterwards).")
+    add_trace_args(p_run)
 
     # open (just open VS Code on the project)
     p_open = sub.add_parser("open", help="Open the project in VS Code.")
@@ -642,6 +4996,8 @@ def main():
     p_agent_run.add_argument("--name", default="agent", help="Agent name.")
     p_agent_run.add_argument("--goal", required=True, help="What the agent should do.")
     p_agent_run.add_argument("--model", default=DEFAULT_MODEL, help="Ollama model name.")
+    add_llm_args(p_agent_run)
+    add_trace_args(p_agent_run)
 
     # fleet
     p_fleet = sub.add_parser("fleet", help="Run multiple agents defined in a plan.json.")
@@ -650,6 +5006,12 @@ def main():
     p_fleet_run.add_argument("--dir", required=True, help="Project directory.")
     p_fleet_run.add_argument("plan", help="Path to plan.json")
     p_fleet_run.add_argument("--model", default=DEFAULT_MODEL, help="Ollama model name.")
+    p_fleet_run.add_argument("--workers", type=int, default=1, help="Agents to run concurrently (1 = sequential).")
+    p_fleet_run.add_argument("--on-conflict", choices=CONFLICT_STRATEGIES, default="rerun",
+                             help="Resolve conflicting parallel edits by re-running the agent or with a merge agent.")
+    p_fleet_run.add_argument("--resume", action="store_true", help="Skip agents completed by a previous run of this plan.")
+    add_llm_args(p_fleet_run)
+    add_trace_args(p_fleet_run)
 
     # delegate
     p_delegate = sub.add_parser("delegate", help="Delegate a sub-task from one agent to another.")
@@ -658,6 +5020,8 @@ def main():
     p_delegate.add_argument("--to", dest="dst", required=True, help="Destination agent name.")
     p_delegate.add_argument("--context", required=True, help="Delegation context.")
     p_delegate.add_argument("--model", default=DEFAULT_MODEL, help="Ollama model name.")
+    add_llm_args(p_delegate)
+    add_trace_args(p_delegate)
 
     # MCP
     p_mcp = sub.add_parser("mcp", help="Minimal MCP-style integration calls.")
@@ -667,13 +5031,98 @@ def main():
     p_mcp_call.add_argument("--tool", required=True, help="Tool id, e.g., db.users.count")
     p_mcp_call.add_argument("--arg", default=None, help="Optional argument (e.g., path or JSON)")
 
-    args = parser.parse_args()
+    # cache
+    p_cache = sub.add_parser("cache", help="Inspect or prune the LLM response cache.")
+    p_cache.add_argument("action", choices=("stats", "list", "prune", "clear"), help="Cache operation.")
+    p_cache.add_argument("--limit", type=int, default=20, help="Entries to show for 'list'.")
+    p_cache.add_argument("--max-mb", type=float, default=None, help="Size to prune down to (default: cache limit).")
+
+    # checkpoints
+    p_ckpt = sub.add_parser("checkpoints", help="List, diff, restore or garbage-collect project checkpoints.")
+    sp_ckpt = p_ckpt.add_subparsers(dest="ckpt_cmd", required=True)
+    p_ckpt_list = sp_ckpt.add_parser("list", help="List checkpoints (oldest first).")
+    p_ckpt_list.add_argument("--dir", required=True, help="Project directory.")
+    p_ckpt_diff = sp_ckpt.add_parser("diff", help="Diff a checkpoint against another one or the working tree.")
+    p_ckpt_diff.add_argument("--dir", required=True, help="Project directory.")
+    p_ckpt_diff.add_argument("ref", help="Checkpoint id (e.g. 3 or 0003) or 'latest'.")
+    p_ckpt_diff.add_argument("other", nargs="?", default=None, help="Checkpoint to compare with (default: working tree).")
+    p_ckpt_restore = sp_ckpt.add_parser("restore", help="Restore the working tree to a checkpoint.")
+    p_ckpt_restore.add_argument("--dir", required=True, help="Project directory.")
+    p_ckpt_restore.add_argument("ref", help="Checkpoint id (e.g. 3 or 0003) or 'latest'.")
+    p_ckpt_gc = sp_ckpt.add_parser("gc", help="Drop old checkpoints and unreferenced contents.")
+    p_ckpt_gc.add_argument("--dir", required=True, help="Project directory.")
+    p_ckpt_gc.add_argument("--keep", type=int, default=CHECKPOINT_KEEP, help="Newest checkpoints to keep.")
+
+    # batch
+    p_batch = sub.add_parser("batch", help="Run a JSONL file of new/edit/fix/run jobs across projects concurrently.")
+    p_batch.add_argument("jobs", help="JSONL file, one job per line (see the Batch section of this file).")
+    p_batch.add_argument("--out", default=None, help="Results JSONL (default: <jobs>.results.jsonl).")
+    p_batch.add_argument("--workers", type=int, default=4, help="Projects processed concurrently.")
+    p_batch.add_argument("--resume", action="store_true", help="Continue an interrupted batch, skipping finished jobs.")
+    p_batch.add_argument("--retry-failed", action="store_true", help="With --resume, also rerun jobs that failed.")
+    p_batch.add_argument("--log-dir", default=None, help="Per-job logs (default: <out>.logs/).")
+    p_batch.add_argument("--model", default=DEFAULT_MODEL, help="Default model for jobs without \"model\".")
+    p_batch.add_argument("--max-iters", type=int, default=6, help="Default max fix iterations.")
+    p_batch.add_argument("--candidates", type=int, default=1, help="Default speculative fixes per iteration.")
+    p_batch.add_argument("--no-auto-pip", action="store_true", help="Default to no automatic pip installs.")
+    p_batch.add_argument("--warm", action="store_true", help="Run entrypoints via warm forkservers.")
+    p_batch.add_argument("--no-run-cache", action="store_true", help="Always execute, even for unchanged projects.")
+    add_llm_args(p_batch)
+    add_trace_args(p_batch)
+
+    # stats
+    p_stats = sub.add_parser("stats", help="Per-phase latency (p50/p95) and token usage from the project's trace log.")
+    p_stats.add_argument("--dir", required=True, help="Project directory.")
+    p_stats.add_argument("--runs", type=int, default=None, help="Only the last N runs.")
+    p_stats.add_argument("--json", action="store_true", help="Print the aggregates as JSON.")
+
+    # bench
+    p_bench = sub.add_parser("bench", help="Measure autocoder's own overhead against a mock model (offline).")
+    p_bench.add_argument("--sizes", default=",".join(map(str, BENCH_SIZES)),
+                         help="Comma-separated synthetic project sizes (files).")
+    p_bench.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is kept).")
+    p_bench.add_argument("--latency", type=float, default=0.0, help="Mock model latency per request (ms).")
+    p_bench.add_argument("--out", default=None, help="Write results as JSON to this file.")
+    p_bench.add_argument("--compare", default=None, help="Baseline JSON to compare against (exit 1 on regressions).")
+    p_bench.add_argument("--threshold", type=float, default=0.15, help="Relative slowdown counted as a regression.")
+    p_bench.add_argument("--serve", action="store_true", help="Only run the mock Ollama server (for manual runs).")
+    p_bench.add_argument("--port", type=int, default=11435, help="Port for --serve.")
+    p_bench.add_argument("--responses", default=None, help="For --serve: file with a reply, or a JSON list replayed in order.")
+
+    # serve
+    p_serve = sub.add_parser("serve", help="Keep a daemon with hot caches; other commands forward to it automatically.")
+    g_serve = p_serve.add_mutually_exclusive_group()
+    g_serve.add_argument("--stop", action="store_true", help="Stop the running daemon.")
+    g_serve.add_argument("--status", action="store_true", help="Show whether a daemon is running and what it is doing.")
+    p_serve.add_argument("--idle-timeout", type=float, default=0.0,
+                         help="Exit after this many seconds without commands (0 = never).")
+    return parser
+
+def run_command(args: argparse.Namespace):
     proj = Path(args.dir) if hasattr(args, "dir") else None
+    if hasattr(args, "no_trace"):
+        configure_tracing(proj, chrome=args.trace_chrome, enabled=not args.no_trace, command=args.cmd)
+    if hasattr(args, "warm"):
+        configure_runner(args.warm, cache=not args.no_run_cache)
+    if hasattr(args, "backend"):
+        configure_backend(args.backend, host=args.ollama_host, keep_alive=args.keep_alive,
+                          timeout=args.llm_timeout, retries=args.llm_retries, endpoint=args.api)
+        configure_llm_cache("off" if args.no_cache else "only" if args.cache_only else "on")
+
+    if getattr(args, "venv", False) and args.cmd != "new":
+        manifest = load_manifest(proj)
+        if not manifest.get("venv"):
+            manifest["venv"] = True
+            manifest.pop("requirements_hash", None)
+            save_manifest(proj, manifest)
+            sync_requirements(proj, auto_pip=not getattr(args, "no_auto_pip", False))
 
     if args.cmd == "new":
-        entry = create_project(args.model, proj, args.task, args.entry, auto_pip=(not args.no_auto_pip), open_vscode_flag=args.vscode)
+        entry = create_project(args.model, proj, args.task, args.entry, auto_pip=(not args.no_auto_pip), open_vscode_flag=args.vscode,
+                               stream=args.stream, venv=args.venv)
         print(f"{ANSI_GREEN}[+] Project created at {proj} (entry: {entry}){ANSI_RESET}")
-        ok = fix_loop(args.model, proj, entry, args.max_iters, auto_pip=(not args.no_auto_pip))
+        ok = fix_loop(args.model, proj, entry, args.max_iters, auto_pip=(not args.no_auto_pip), stream=args.stream,
+                      edit_format=args.edit_format, candidates=args.candidates)
         sys.exit(0 if ok else 1)
 
     elif args.cmd == "fix":
@@ -681,18 +5130,24 @@ def main():
         entry = args.entry or manifest.get("entrypoint") or DEFAULT_ENTRY
         if args.vscode:
             open_in_vscode(proj)
-        ok = fix_loop(args.model, proj, entry, args.max_iters, auto_pip=(not args.no_auto_pip))
+        ok = fix_loop(args.model, proj, entry, args.max_iters, auto_pip=(not args.no_auto_pip), stream=args.stream,
+                      edit_format=args.edit_format, candidates=args.candidates)
         sys.exit(0 if ok else 1)
 
     elif args.cmd == "edit":
-        edit_project(args.model, proj, args.instruction, auto_pip=(not args.no_auto_pip), open_vscode_flag=args.vscode)
+        edit_project(args.model, proj, args.instruction, auto_pip=(not args.no_auto_pip), open_vscode_flag=args.vscode,
+                     stream=args.stream, edit_format=args.edit_format)
 
     elif args.cmd == "run":
         if args.vscode:
             open_in_vscode(proj)
         manifest = load_manifest(proj)
         entry = args.entry or manifest.get("entrypoint") or DEFAULT_ENTRY
-        code, out, err = run_project(proj, entry)
+        if args.sandbox:
+            with Workspace(proj, args.sandbox) as ws:
+                code, out, err = ws.run(entry)
+        else:
+            code, out, err = run_project(proj, entry, use_cache=True)
         print(out, end="")
         if err.strip():
             print(ANSI_RED + err + ANSI_RESET, file=sys.stderr, end="")
@@ -707,18 +5162,67 @@ def main():
 
     elif args.cmd == "agent":
         if args.agent_cmd == "run":
-            agent_run(args.model, proj, args.name, args.goal)
+            agent_run(args.model, proj, args.name, args.goal, stream=args.stream, edit_format=args.edit_format)
 
     elif args.cmd == "fleet":
         if args.fleet_cmd == "run":
-            fleet_run(args.model, proj, Path(args.plan))
+            ok = fleet_run(args.model, proj, Path(args.plan), stream=args.stream, edit_format=args.edit_format,
+                           workers=args.workers, on_conflict=args.on_conflict, resume=args.resume)
+            sys.exit(0 if ok else 1)
 
     elif args.cmd == "delegate":
-        delegate_task(args.model, proj, args.src, args.dst, args.context)
+        delegate_task(args.model, proj, args.src, args.dst, args.context, stream=args.stream,
+                      edit_format=args.edit_format)
 
     elif args.cmd == "mcp":
         if args.mcp_cmd == "call":
             mcp_call(proj, args.tool, args.arg)
 
+    elif args.cmd == "cache":
+        cache_command(args.action, limit=args.limit, max_mb=args.max_mb)
+
+    elif args.cmd == "batch":
+        jobs_path = Path(args.jobs)
+        out_path = Path(args.out) if args.out else jobs_path.with_name(jobs_path.stem + ".results.jsonl")
+        log_dir = Path(args.log_dir) if args.log_dir else out_path.with_name(out_path.stem + ".logs")
+        configure_tracing(log_dir, chrome=args.trace_chrome, enabled=not args.no_trace, command=args.cmd)
+        defaults = {"model": args.model, "auto_pip": not args.no_auto_pip, "max_iters": args.max_iters,
+                    "candidates": args.candidates, "edit_format": args.edit_format}
+        try:
+            ok = batch_command(jobs_path, out_path, args.workers, defaults, resume=args.resume,
+                               retry_failed=args.retry_failed, log_dir=log_dir)
+        except (OSError, ValueError) as e:
+            print(f"{ANSI_RED}[!] {e}{ANSI_RESET}")
+            sys.exit(2)
+        sys.exit(0 if ok else 1)
+
+    elif args.cmd == "stats":
+        stats_command(proj, runs=args.runs, as_json=args.json)
+
+    elif args.cmd == "bench":
+        sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+        sys.exit(bench_command(sizes, args.repeat, args.latency, args.out, args.compare, args.threshold,
+                               serve=args.serve, port=args.port, responses=args.responses))
+
+    elif args.cmd == "checkpoints":
+        try:
+            checkpoints_command(proj, args.ckpt_cmd, getattr(args, "ref", None), getattr(args, "other", None),
+                                keep=getattr(args, "keep", CHECKPOINT_KEEP))
+        except ValueError as e:
+            print(f"{ANSI_RED}[!] {e}{ANSI_RESET}")
+            sys.exit(1)
+
+def main():
+    argv = sys.argv[1:]
+    if argv and argv[0] not in LOCAL_ONLY_COMMANDS and not os.environ.get("AUTOCODER_NO_DAEMON"):
+        code = forward_to_daemon(argv)
+        if code is not None:
+            sys.exit(code)
+    args = build_parser().parse_args(argv)
+    if args.cmd == "serve":
+        sys.exit(serve_control("stop" if args.stop else "status") if args.stop or args.status
+                 else serve_command(args.idle_timeout))
+    run_command(args)
+
 if __name__ == "__main__":
     main()
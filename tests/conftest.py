@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import autocoder as ac  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path_factory, monkeypatch):
+    monkeypatch.setenv("AUTOCODER_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+    monkeypatch.setenv("AUTOCODER_NO_DAEMON", "1")
+
+
+@pytest.fixture
+def mock_ollama():
+    """Start a MockOllamaServer for `responder(prompt) -> text` and point the HTTP backend (no LLM cache) at it."""
+    servers = []
+
+    def start(responder, **backend):
+        server = ac.MockOllamaServer(responder)
+        servers.append(server)
+        ac.configure_backend("http", host=server.url, **backend)
+        ac.configure_llm_cache("off")
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+    ac.configure_backend()
+    ac.configure_llm_cache()
@@ -0,0 +1,115 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import autocoder as ac
+
+
+class FakeFallback:
+    name = "subprocess"
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, model, prompt, options=None):
+        self.calls += 1
+        return "from fallback"
+
+    def stream(self, model, prompt, options=None):
+        self.calls += 1
+        yield "from fallback"
+
+
+def _serve(body: bytes):
+    """A server that answers every POST with `body` (not Ollama's format)."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def test_generate_and_stream_reuse_pooled_connections():
+    server = ac.MockOllamaServer(lambda prompt: "echo:" + prompt * 300)
+    try:
+        backend = ac.HttpBackend(server.url)
+        assert backend.generate("m", "x") == "echo:" + "x" * 300
+        assert "".join(backend.stream("m", "y")) == "echo:" + "y" * 300
+        assert backend._pool.qsize() == 1
+        chat = ac.HttpBackend(server.url, endpoint="chat")
+        assert chat.generate("m", "z") == "echo:" + "z" * 300
+    finally:
+        server.close()
+
+
+def test_dropped_connection_is_retried():
+    state = {"n": 0}
+
+    def flaky(prompt):
+        state["n"] += 1
+        if state["n"] == 1:
+            raise RuntimeError("simulated crash")     # the handler dies, the client sees a closed connection
+        return "ok"
+
+    server = ac.MockOllamaServer(flaky)
+    try:
+        assert ac.HttpBackend(server.url, retries=1).generate("m", "p") == "ok"
+        assert state["n"] == 2
+    finally:
+        server.close()
+
+
+def test_malformed_stream_is_a_connection_error():
+    httpd = _serve(b"<html>bad gateway</html>\n")
+    try:
+        backend = ac.HttpBackend("127.0.0.1:%d" % httpd.server_address[1], retries=0)
+        with pytest.raises(ConnectionError):
+            list(backend.stream("m", "p"))
+        fallback = FakeFallback()
+        assert list(ac.AutoBackend(backend, fallback).stream("m", "p")) == ["from fallback"]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_auto_backend_falls_back_when_server_is_down():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    port = httpd.server_address[1]
+    httpd.server_close()      # nothing listens on this port any more
+    fallback = FakeFallback()
+    auto = ac.AutoBackend(ac.HttpBackend("127.0.0.1:%d" % port, retries=0), fallback)
+    assert auto.generate("m", "p") == "from fallback"
+    assert list(auto.stream("m", "p")) == ["from fallback"]
+    assert fallback.calls == 2
+
+
+def test_auto_backend_falls_back_on_request_failure():
+    def broken(prompt):
+        raise RuntimeError("simulated crash")
+
+    server = ac.MockOllamaServer(broken)
+    try:
+        fallback = FakeFallback()
+        auto = ac.AutoBackend(ac.HttpBackend(server.url, retries=0), fallback)
+        assert auto.generate("m", "p") == "from fallback"
+        assert fallback.calls == 1
+    finally:
+        server.close()
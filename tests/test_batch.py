@@ -0,0 +1,53 @@
+import json
+import threading
+import time
+
+import autocoder as ac
+
+FIX = json.dumps({"files": [{"path": "main.py", "content": "print('fixed')\n"}]})
+
+
+def test_batch_routes_output_and_waits_for_losing_candidates(tmp_path, mock_ollama):
+    calls = []
+    slow_done = threading.Event()
+    lock = threading.Lock()
+
+    def respond(prompt):
+        with lock:
+            calls.append(prompt)
+            slow = len(calls) == 2
+        if slow:                      # the losing candidate's model call outlasts the winner's run
+            time.sleep(0.5)
+            slow_done.set()
+        return FIX
+
+    mock_ollama(respond, retries=0)
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "main.py").write_text("raise SystemExit('broken')\n")
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text(json.dumps({"id": "fix-a", "op": "fix", "dir": str(tmp_path / "a"), "candidates": 2}) + "\n" +
+                    json.dumps({"id": "run-b", "op": "run", "dir": str(tmp_path / "b")}) + "\n")
+    out = tmp_path / "results.jsonl"
+    defaults = {"model": "m", "auto_pip": False, "max_iters": 2, "candidates": 1, "edit_format": "whole"}
+    assert not ac.batch_command(jobs, out, workers=2, defaults=defaults)
+    assert slow_done.is_set()
+    results = ac.load_batch_results(out)
+    assert results["fix-a"]["status"] == "ok" and results["run-b"]["status"] == "failed"
+    log = (tmp_path / "results.logs" / "fix-a.log").read_text()
+    assert "candidate" in log and "Committing fix candidate" in log
+    assert "candidate" not in (tmp_path / "results.logs" / "run-b.log").read_text()
+    assert (tmp_path / "a" / "main.py").read_text() == "print('fixed')\n"
+    assert not [p for p in tmp_path.iterdir() if ".ws-" in p.name]
+
+
+def test_resume_skips_finished_jobs(tmp_path):
+    (tmp_path / "p").mkdir()
+    (tmp_path / "p" / "main.py").write_text("print('hi')\n")
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text(json.dumps({"op": "run", "dir": str(tmp_path / "p")}) + "\n")
+    out = tmp_path / "results.jsonl"
+    defaults = {"model": "m", "auto_pip": False, "max_iters": 1, "candidates": 1, "edit_format": "whole"}
+    assert ac.batch_command(jobs, out, workers=1, defaults=defaults)
+    assert ac.batch_command(jobs, out, workers=1, defaults=defaults, resume=True)
+    assert len(out.read_text().splitlines()) == 1
@@ -0,0 +1,22 @@
+import autocoder as ac
+
+
+def test_canned_responder_cycles():
+    respond = ac.canned_responder(["a", "b"])
+    assert [respond("p") for _ in range(3)] == ["a", "b", "a"]
+
+
+def test_bench_smoke(tmp_path, monkeypatch):
+    monkeypatch.setattr(ac, "BENCH_FLEET_AGENTS", 4)
+    try:
+        report = ac.run_benchmarks([5], repeat=1, workdir=tmp_path)
+    finally:
+        ac.configure_backend()
+        ac.configure_llm_cache()
+        ac.configure_runner()
+    results = report["results"]
+    assert {"snapshot.cold@5", "fix_loop@5", "llm.http", "fleet.workers4"} <= set(results)
+    assert report["meta"]["requests"] > 0 and all(v >= 0 for v in results.values())
+    slower = {"results": {k: v + 1 for k, v in results.items()}}
+    assert ac.compare_benchmarks(slower, report) == list(results)
+    assert ac.compare_benchmarks(report, report) == []
@@ -0,0 +1,31 @@
+import json
+
+import autocoder as ac
+
+
+def test_checkpoint_restore(tmp_path):
+    (tmp_path / "a.py").write_text("A = 1\n")
+    first = ac.create_checkpoint(tmp_path, "one")
+    (tmp_path / "a.py").write_text("A = 2\n")
+    (tmp_path / "b.py").write_text("B = 1\n")
+    second = ac.create_checkpoint(tmp_path, "two")
+    assert second != first
+    assert ac.create_checkpoint(tmp_path, "unchanged") == second
+    written, deleted = ac.restore_checkpoint(tmp_path, first)
+    assert written == ["a.py"] and deleted == ["b.py"]
+    assert (tmp_path / "a.py").read_text() == "A = 1\n"
+    assert not (tmp_path / "b.py").exists()
+
+
+def test_checkpoint_ids_sort_numerically_past_9999(tmp_path):
+    (tmp_path / "a.py").write_text("A = 1\n")
+    cid = ac.create_checkpoint(tmp_path, "one")
+    manifests = tmp_path / ac.STATE_DIR / "checkpoints" / "manifests"
+    manifest = json.loads((manifests / f"{cid}.json").read_text())
+    manifest["id"] = "9999"
+    (manifests / f"{cid}.json").unlink()
+    (manifests / "9999.json").write_text(json.dumps(manifest))
+    (tmp_path / "a.py").write_text("A = 2\n")
+    assert ac.create_checkpoint(tmp_path, "two") == "10000"
+    assert [c["id"] for c in ac.list_checkpoints(tmp_path)] == ["9999", "10000"]
+    assert ac.load_checkpoint(tmp_path, "latest")["parent"] == "9999"
@@ -0,0 +1,27 @@
+import autocoder as ac
+
+
+def test_requests_carry_the_model_window(mock_ollama):
+    server = mock_ollama(lambda prompt: "ok")
+    assert ac.ollama_run("qwen3-coder:30b", "hi") == "ok"
+    assert "".join(ac.ollama_stream("llama3", "hi", options={"seed": 1})) == "ok"
+    assert server.options == [{"num_ctx": 262_144}, {"num_ctx": 8_192, "seed": 1}]
+
+
+def test_num_ctx_is_part_of_the_cache_key():
+    a = ac.LLMCache.key("m", "t", "p", ac.llm_options("llama3"))
+    b = ac.LLMCache.key("m", "t", "p", dict(ac.llm_options("llama3"), num_ctx=4096))
+    assert a != b
+
+
+def test_subprocess_budget_is_capped_at_the_server_window(monkeypatch):
+    monkeypatch.delenv("OLLAMA_CONTEXT_LENGTH", raising=False)
+    try:
+        ac.configure_backend("http")
+        assert ac.snapshot_budget("qwen3-coder") == int(262_144 * ac.SNAPSHOT_CONTEXT_SHARE)
+        ac.configure_backend("subprocess")
+        assert ac.snapshot_budget("qwen3-coder") == int(ac.OLLAMA_DEFAULT_CONTEXT * ac.SNAPSHOT_CONTEXT_SHARE)
+        monkeypatch.setenv("OLLAMA_CONTEXT_LENGTH", "16384")
+        assert ac.snapshot_budget("qwen3-coder") == int(16_384 * ac.SNAPSHOT_CONTEXT_SHARE)
+    finally:
+        ac.configure_backend()
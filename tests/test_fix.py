@@ -0,0 +1,63 @@
+import json
+
+import autocoder as ac
+
+
+def _project(root):
+    root.mkdir()
+    (root / "main.py").write_text("import helper\nhelper.go()\n")
+    (root / "helper.py").write_text("def go():\n    raise ValueError(1)\n")
+    return root
+
+
+def test_speculative_winner_output_points_at_project(tmp_path, mock_ollama):
+    root = _project(tmp_path / "proj")
+    prompts = []
+
+    def respond(prompt):
+        prompts.append(prompt)
+        if len(prompts) <= 2:      # both first-round candidates: a different failure
+            return json.dumps({"files": [{"path": "helper.py", "content": "def go():\n    raise KeyError(2)\n"}]})
+        return json.dumps({"files": [{"path": "helper.py", "content": "def go():\n    print('ok')\n"}]})
+
+    mock_ollama(respond)
+    assert ac.fix_loop("m", root, "main.py", 3, False, candidates=2)
+    follow_up = prompts[2]
+    assert "KeyError" in follow_up
+    assert ".ws-" not in follow_up
+    assert str(root.resolve() / "helper.py") in follow_up
+    frames = ac.parse_traceback(follow_up, root)
+    assert any(f["path"] == "helper.py" for f in frames)
+
+
+def _traceback(root, *frames):
+    lines = ["Traceback (most recent call last):"]
+    lines += [f'  File "{root / path}", line {line}, in f' for path, line in frames]
+    return "\n".join(lines + ["ValueError: boom"]) + "\n"
+
+
+def test_fix_context_keeps_traceback_files_within_budget(tmp_path):
+    body = "def big(x):\n" + "".join(f"    x += {i}\n" for i in range(300)) + "    return x\n\ndef small():\n    pass\n"
+    for name in ("main", "a", "b", "c"):
+        (tmp_path / f"{name}.py").write_text(body)
+    (tmp_path / "data.json").write_text("[" + ",".join(["1"] * 1000) + "]")
+    error = _traceback(tmp_path, ("main.py", 5), ("a.py", 9), ("b.py", 13), ("c.py", 17))
+    ctx = ac.build_fix_context(tmp_path, error, 3_000)
+    assert ac.estimate_tokens(ctx) <= 3_000
+    assert ctx.index("===== c.py =====") < ctx.index("===== b.py =====")     # innermost frame first
+    assert "===== main.py (OUTLINE) =====" in ctx and "LEFT OUT" not in ctx
+    assert "NOT SHOWN (non-Python files over 1000 bytes): data.json" in ctx
+
+    tight = ac.build_fix_context(tmp_path, error, 2_000)
+    assert "===== a.py (OUTLINE) =====" in tight and "===== main.py" not in tight
+    assert "LEFT OUT to fit the context budget, although the traceback references them: main.py" in tight
+
+
+def test_error_score_ignores_error_words_in_messages():
+    before = (1, "", 'Traceback (most recent call last):\n  File "m.py", line 1, in <module>\nValueError: 1\n')
+    after = (1, "", 'Traceback (most recent call last):\n  File "m.py", line 2, in <module>\n'
+                    'ValueError: Error Exception TypeError\n')
+    assert ac.error_score(*after) == ac.error_score(*before)
+    syntax = (1, "", '  File "m.py", line 1\n    def (\n        ^\nSyntaxError: invalid syntax\n')
+    assert ac.error_score(*syntax) > ac.error_score(*before)
+    assert ac.error_score(0, "", "") < ac.error_score(*before)
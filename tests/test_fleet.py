@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import autocoder as ac
+
+
+def test_plan_validation():
+    agents = ac.load_fleet_plan({"agents": [{"name": "a", "goal": "x"},
+                                            {"name": "b", "goal": "y", "depends_on": "a", "files": "src/*"}]})
+    assert agents[1]["depends_on"] == ["a"] and agents[1]["files"] == ["src/*"]
+    with pytest.raises(ValueError, match="cycle"):
+        ac.load_fleet_plan({"agents": [{"name": "a", "depends_on": ["b"]}, {"name": "b", "depends_on": ["a"]}]})
+    with pytest.raises(ValueError, match="unknown"):
+        ac.load_fleet_plan({"agents": [{"name": "a", "depends_on": ["zzz"]}]})
+
+
+def test_dependents_see_earlier_work_and_failures_skip_them(tmp_path, mock_ollama):
+    (tmp_path / "main.py").write_text("print(1)\n")
+    prompts = {}
+
+    def respond(prompt):
+        for goal in ("GOAL-A", "GOAL-B", "GOAL-C", "GOAL-D"):
+            if goal in prompt:
+                prompts[goal] = prompt
+                if goal == "GOAL-C":
+                    raise RuntimeError("simulated failure")
+                name = goal[-1].lower()
+                return json.dumps({"files": [{"path": f"{name}.py", "content": f"# made by agent {name}\n"}]})
+        raise AssertionError("unexpected prompt")
+
+    mock_ollama(respond, retries=0)
+    agents = ac.load_fleet_plan({"agents": [
+        {"name": "a", "goal": "GOAL-A"},
+        {"name": "b", "goal": "GOAL-B", "depends_on": ["a"]},
+        {"name": "c", "goal": "GOAL-C"},
+        {"name": "d", "goal": "GOAL-D", "depends_on": ["c"]},
+    ]})
+    assert not ac.fleet_run_dag("m", tmp_path, agents, workers=2)
+    assert "# made by agent a" in prompts["GOAL-B"]       # b was dispatched after a's changes landed
+    assert (tmp_path / "b.py").exists() and "GOAL-D" not in prompts
+    state = json.loads((tmp_path / ac.FLEET_STATE_NAME).read_text())["agents"]
+    assert {n: s["status"] for n, s in state.items()} == {"a": "done", "b": "done", "c": "failed", "d": "skipped"}
+
+
+def test_escaping_paths_fail_only_their_agent(tmp_path, mock_ollama):
+    root, outside = tmp_path / "proj", tmp_path / "outside"
+    root.mkdir()
+    outside.mkdir()
+    (root / "main.py").write_text("print(1)\n")
+    (root / "link").symlink_to(outside, target_is_directory=True)
+    replies = {
+        "GOAL-A": [{"path": "../evil.py", "content": "x\n"}, {"path": "a.py", "content": "A = 1\n"}],
+        "GOAL-B": [{"path": "link/b.py", "content": "B = 1\n"}],
+        "GOAL-C": [{"path": "c.py", "content": "C = 1\n"}],
+    }
+
+    def respond(prompt):
+        goal = next(g for g in replies if g in prompt)
+        return json.dumps({"files": replies[goal]})
+
+    mock_ollama(respond, retries=0)
+    agents = ac.load_fleet_plan({"agents": [{"name": "a", "goal": "GOAL-A"}, {"name": "b", "goal": "GOAL-B"},
+                                            {"name": "c", "goal": "GOAL-C", "depends_on": ["b"]}]})
+    assert not ac.fleet_run_dag("m", root, agents, workers=2)
+    assert (root / "a.py").exists() and not (tmp_path / "evil.py").exists()
+    assert not list(outside.iterdir())
+    state = json.loads((root / ac.FLEET_STATE_NAME).read_text())["agents"]
+    assert state["a"]["files"] == ["a.py"]
+    assert [state[n]["status"] for n in "abc"] == ["done", "failed", "skipped"]
+    assert "outside project" in state["b"]["error"]
@@ -0,0 +1,34 @@
+import autocoder as ac
+
+SOURCE = """\
+import os
+import requests
+from flask import Flask
+try:
+    import ujson as json
+except ImportError:
+    import json
+if os.name == "nt":
+    import colorama
+
+def plot():
+    import matplotlib.pyplot as plt
+    return plt
+"""
+
+
+def test_required_imports_skip_guarded_and_deferred_ones():
+    assert sorted(ac.scan_imports(SOURCE)) == ["colorama", "flask", "json", "matplotlib", "os", "requests", "ujson"]
+    assert sorted(ac.scan_imports(SOURCE, required_only=True)) == ["colorama", "flask", "json", "os", "requests"]
+
+
+def test_install_missing_imports_batches_required_modules(tmp_path, monkeypatch):
+    (tmp_path / "main.py").write_text(
+        "import autocoder_no_such_mod\nfrom flask import Flask\n"
+        "try:\n    import autocoder_optional_mod\nexcept ImportError:\n    pass\n\n"
+        "def later():\n    import autocoder_deferred_mod\n")
+    (tmp_path / "flask.py").write_text("Flask = object\n")     # a project module, not a dependency
+    calls = []
+    monkeypatch.setattr(ac, "pip_install_packages", lambda dists, python=None: calls.append(dists) or True)
+    assert ac.install_missing_imports(tmp_path, auto_pip=True) == ["autocoder-no-such-mod"]
+    assert calls == [["autocoder-no-such-mod"]]
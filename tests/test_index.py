@@ -0,0 +1,35 @@
+import json
+import os
+
+import autocoder as ac
+
+
+def _age(path, seconds=5):
+    # Entries modified within the last second are "racy" and always re-read; age the files past that.
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 10**9))
+
+
+def test_unchanged_files_are_served_from_the_index(tmp_path, monkeypatch):
+    small, big = tmp_path / "small.py", tmp_path / "big.py"
+    small.write_text("S = 1\n")
+    big.write_text("B = 1\n" * 20_000)        # over INDEX_TEXT_LIMIT
+    _age(small), _age(big)
+    first = {b["path"]: b for b in ac.snapshot_blocks(tmp_path)}
+    on_disk = json.loads((tmp_path / ac.INDEX_NAME).read_text())["files"]
+    assert "text" in on_disk["small.py"] and "text" not in on_disk["big.py"]
+    assert on_disk["big.py"]["sha256"] == first["big.py"]["sha256"]
+
+    reads = []
+    real = ac._index_entry
+    monkeypatch.setattr(ac, "_index_entry", lambda p, st: (reads.append(p.name), real(p, st))[1])
+    ac._INDEX_MEMO.clear()                    # as in a new process: only the on-disk index is known
+    for _ in range(3):
+        blocks = {b["path"]: b for b in ac.snapshot_blocks(tmp_path)}
+    assert reads == ["big.py"]                # read once, then kept in memory
+    assert blocks["big.py"]["content"] == big.read_text()
+
+    small.write_text("S = 2\n")
+    _age(small, 2)
+    blocks = {b["path"]: b for b in ac.snapshot_blocks(tmp_path)}
+    assert blocks["small.py"]["content"] == "S = 2\n" and reads[-1] == "small.py"
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+import autocoder as ac
+
+
+def test_lru_eviction_by_size(tmp_path):
+    cache = ac.LLMCache(tmp_path / "c.sqlite3", max_bytes=25)
+    cache.put("a", "m", "t", "x" * 10)
+    time.sleep(0.01)
+    cache.put("b", "m", "t", "y" * 10)
+    time.sleep(0.01)
+    assert cache.get("a") == "x" * 10     # a is now the most recently used
+    time.sleep(0.01)
+    cache.put("c", "m", "t", "z" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10 and cache.get("c") == "z" * 10
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 20 and stats["misses"] == 1
+
+
+def test_cache_only_mode_raises_on_miss(tmp_path):
+    cache = ac.LLMCache(tmp_path / "c.sqlite3", cache_only=True)
+    with pytest.raises(RuntimeError):
+        cache.get("missing")
+
+
+def test_repeated_prompt_is_served_from_cache(mock_ollama):
+    server = mock_ollama(lambda prompt: "answer")
+    ac.configure_llm_cache("on")
+    assert ac.ollama_run("m", "same prompt", template="t") == "answer"
+    assert "".join(ac.ollama_stream("m", "same prompt", template="t")) == "answer"
+    assert ac.ollama_run("m", "other prompt", template="t") == "answer"
+    assert server.requests == 2
@@ -0,0 +1,46 @@
+import json
+import os
+
+import pytest
+
+import autocoder as ac
+
+
+def _crash(src, dst):
+    raise OSError("disk full")
+
+
+def test_materialize_rolls_back_with_a_transaction(tmp_path):
+    (tmp_path / "a.py").write_text("A = 1\n")
+    (tmp_path / "old.py").write_text("OLD = 1\n")
+    txn = ac.Transaction(tmp_path)
+    files = [{"path": "a.py", "content": "A = 2\n"}, {"path": "pkg/new.py", "content": "N = 1\n"}]
+    assert ac.materialize_files(tmp_path, files, ["old.py"], txn) == []
+    assert (tmp_path / "pkg" / "new.py").exists() and not (tmp_path / "old.py").exists()
+    txn.rollback()
+    assert (tmp_path / "a.py").read_text() == "A = 1\n" and (tmp_path / "old.py").exists()
+    assert not (tmp_path / "pkg" / "new.py").exists()
+    assert not ac.write_file(tmp_path, "a.py", "A = 1\n")      # identical content is not rewritten
+
+
+@pytest.mark.parametrize("save, name", [
+    (lambda root: ac.save_manifest(root, {"entrypoint": "new.py"}), ac.MANIFEST_NAME),
+    (lambda root: ac._save_fleet_state(root, {"agents": {}}), ac.FLEET_STATE_NAME),
+])
+def test_state_files_are_replaced_atomically(tmp_path, monkeypatch, save, name):
+    (tmp_path / name).write_text('{"old": true}')
+    monkeypatch.setattr(ac.os, "replace", _crash)
+    with pytest.raises(OSError):
+        save(tmp_path)
+    assert json.loads((tmp_path / name).read_text()) == {"old": True}
+    assert os.listdir(tmp_path) == [name]          # no temp file left behind
+    monkeypatch.undo()
+    save(tmp_path)
+    assert json.loads((tmp_path / name).read_text()) != {"old": True}
+
+
+def test_run_cache_write_failure_is_not_fatal(tmp_path, monkeypatch):
+    (tmp_path / ac.RUNS_NAME).write_text("{}")
+    monkeypatch.setattr(ac.os, "replace", _crash)
+    ac._store_run(tmp_path, "key", (0, "out", ""))
+    assert (tmp_path / ac.RUNS_NAME).read_text() == "{}"
@@ -0,0 +1,66 @@
+import json
+import time
+
+import autocoder as ac
+
+
+# ---- parse_llm_files ----
+
+def test_parse_json_response():
+    text = json.dumps({"entrypoint": "app.py", "files": [{"path": "app.py", "content": "print(1)\n"}],
+                       "delete": ["old.py"]})
+    entry, files, delete = ac.parse_llm_files(text)
+    assert entry == "app.py"
+    assert files == [{"path": "app.py", "content": "print(1)\n"}]
+    assert delete == ["old.py"]
+
+
+def test_parse_json_wrapped_in_chatter():
+    text = "Sure, here you go:\n" + json.dumps({"files": [{"path": "a.py", "content": "A = 1\n"}]}) + "\nDone."
+    _, files, _ = ac.parse_llm_files(text)
+    assert [f["path"] for f in files] == ["a.py"]
+
+
+def test_parse_brace_in_prose_stays_fenced():
+    # A brace in the explanation must not switch the parser into JSON mode.
+    text = ("I changed the config {see below} and the entrypoint.\n\n"
+            "```python main.py\nprint({'a': 1})\n```\n")
+    _, files, _ = ac.parse_llm_files(text)
+    assert [f["path"] for f in files] == ["main.py"]
+    assert files[0]["content"].strip() == "print({'a': 1})"
+
+
+def test_parse_truncated_json_keeps_complete_files():
+    full = json.dumps({"files": [{"path": "a.py", "content": "A = 1\n"},
+                                 {"path": "b.py", "content": "B = 2\n" * 20}]})
+    _, files, _ = ac.parse_llm_files(full[:full.index("B = 2") + 10])
+    assert [f["path"] for f in files] == ["a.py"]
+
+
+def test_incremental_parser_matches_one_shot():
+    text = json.dumps({"files": [{"path": "x/%d.py" % i, "content": "N = %d\n" % i} for i in range(5)]})
+    parser = ac.IncrementalFileParser()
+    got = []
+    for i in range(0, len(text), 7):
+        got.extend(parser.feed(text[i:i + 7]))
+    _, rest, _ = parser.close()
+    got.extend(rest)
+    assert got == ac.parse_llm_files(text)[1]
+
+
+def test_prose_prefixed_stream_is_linear_and_emits_early():
+    body = json.dumps({"entrypoint": "main.py",
+                       "files": [{"path": "f%d.py" % i, "content": "x = 1\n" * 40} for i in range(1500)]})
+    text = "Sure, here is the project:\n" + body     # ~440 KB
+    parser = ac.IncrementalFileParser()
+    first, emitted = None, 0
+    t0 = time.perf_counter()
+    for i in range(0, len(text), 16):
+        got = parser.feed(text[i:i + 16])
+        if got and first is None:
+            first = i
+        emitted += len(got)
+    parser.close()
+    assert time.perf_counter() - t0 < 5
+    assert emitted == 1500
+    assert first is not None and first < 1000
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+import autocoder as ac
+
+
+def test_search_replace_exact():
+    assert ac.apply_search_replace("a = 1\nb = 2\n", [{"search": "b = 2", "replace": "b = 3"}]) == "a = 1\nb = 3\n"
+
+
+def test_search_replace_tolerates_indent_drift():
+    text = "def f():\n    x = 1\n    return x\n"
+    out = ac.apply_search_replace(text, [{"search": "x = 1\nreturn x", "replace": "x = 2\nreturn x"}])
+    assert out == "def f():\n    x = 2\n    return x\n"
+
+
+def test_search_replace_missing_context_raises():
+    with pytest.raises(ac.PatchError):
+        ac.apply_search_replace("a = 1\n", [{"search": "nope", "replace": "x"}])
+
+
+def test_unified_diff_with_wrong_line_numbers():
+    text = "".join(f"line{i}\n" for i in range(20))
+    diff = "@@ -2,3 +2,3 @@\n line9\n-line10\n+LINE10\n line11\n"
+    assert ac.apply_unified_diff(text, diff) == text.replace("line10\n", "LINE10\n")
+
+
+def test_apply_file_change_whole_content():
+    assert ac.apply_file_change("old", {"path": "a.py", "content": "new"}) == "new"
+
+
+def test_failed_patch_is_retried_as_full_file(tmp_path, mock_ollama):
+    (tmp_path / "a.py").write_text("A = 1\n")
+
+    def respond(prompt):
+        if "could not be applied" in prompt:
+            return json.dumps({"files": [{"path": "a.py", "content": "A = 2\n"}]})
+        return json.dumps({"files": [{"path": "a.py", "edits": [{"search": "no such line", "replace": "x"}]}]})
+
+    mock_ollama(respond)
+    _, files, _ = ac.generate_files("m", "change A", tmp_path, edit_format="diff")
+    assert [f["path"] for f in files] == ["a.py"]
+    assert (tmp_path / "a.py").read_text() == "A = 2\n"
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+import autocoder as ac
+
+
+@pytest.fixture
+def warm():
+    ac.configure_runner(warm=True)
+    yield
+    ac._close_warm_runners()
+    ac.configure_runner()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="warm runner needs os.fork")
+def test_warm_runner_matches_a_cold_run(tmp_path, warm):
+    (tmp_path / "data.txt").write_text("payload")
+    (tmp_path / "main.py").write_text(
+        "import json, sys\n"
+        "print(open('data.txt').read(), __name__)\n"
+        "print('to stderr', file=sys.stderr)\n"
+        "sys.exit(3)\n")
+    code, out, err = ac.run_project(tmp_path, "main.py", python=sys.executable)
+    assert (code, out.strip()) == (3, "payload __main__") and "to stderr" in err
+    assert len(ac._WARM_RUNNERS) == 1
+    runner = next(iter(ac._WARM_RUNNERS.values()))
+    assert ac.run_project(tmp_path, "main.py", python=sys.executable)[0] == 3
+    assert next(iter(ac._WARM_RUNNERS.values())) is runner    # the forkserver is reused
+
+
+def test_run_cache_skips_an_unchanged_tree(tmp_path):
+    (tmp_path / "main.py").write_text("import random\nprint(random.random())\n")
+    first = ac.run_project(tmp_path, "main.py", use_cache=True, python=sys.executable)
+    assert ac.run_project(tmp_path, "main.py", use_cache=True, python=sys.executable) == first
+    (tmp_path / "input.bin").write_bytes(b"\0" * 10)    # non-snapshot files still invalidate
+    assert ac.run_project(tmp_path, "main.py", use_cache=True, python=sys.executable) != first
+    (tmp_path / ac.MANIFEST_NAME).write_text('{"nondeterministic": true}')
+    again = ac.run_project(tmp_path, "main.py", use_cache=True, python=sys.executable)
+    assert ac.run_project(tmp_path, "main.py", use_cache=True, python=sys.executable) != again
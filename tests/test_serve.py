@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+import autocoder as ac
+
+
+@pytest.fixture
+def daemon(monkeypatch):
+    sock_dir = tempfile.mkdtemp(prefix="ac-sock-")    # AF_UNIX paths must stay short
+    monkeypatch.setenv("AUTOCODER_SOCKET", os.path.join(sock_dir, "serve.sock"))
+    thread = threading.Thread(target=ac.serve_command, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not ac.daemon_socket_path().exists():
+        assert time.time() < deadline, "daemon did not start"
+        time.sleep(0.01)
+    yield
+    ac.serve_control("stop")
+    thread.join(10)
+    assert not ac.daemon_socket_path().exists()
+    shutil.rmtree(sock_dir, ignore_errors=True)
+
+
+def _ask(argv, **req):
+    # The raw protocol: forward_to_daemon would relay through sys.stdout, which the
+    # in-process daemon swaps while it serves.
+    payload = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ), "python": sys.executable,
+               "prefix": sys.prefix, **req}
+    with ac._daemon_request(payload, timeout=30) as sock, sock.makefile("r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="serve needs Unix domain sockets")
+def test_commands_run_in_the_daemon_under_the_client_env(tmp_path, daemon, monkeypatch):
+    (tmp_path / "main.py").write_text("import os\nprint('hello from', os.environ['GREETING'])\n")
+    monkeypatch.setenv("GREETING", "client")
+    msgs = _ask(["run", "--dir", str(tmp_path), "--no-trace"])
+    assert msgs[-1] == {"exit": 0}
+    assert "hello from client" in "".join(m.get("data", "") for m in msgs if m.get("stream") == "out")
+    assert _ask(["run", "--dir", str(tmp_path / "missing"), "--no-trace"])[-1]["exit"] != 0
+    assert "fallback" in _ask(["run", "--dir", str(tmp_path)], python="/opt/other/python")[0]
+
+
+def test_no_daemon_means_run_locally(monkeypatch, tmp_path):
+    monkeypatch.setenv("AUTOCODER_SOCKET", str(tmp_path / "none.sock"))
+    assert ac.forward_to_daemon(["run", "--dir", str(tmp_path)]) is None
+
+
+def test_daemon_refuses_other_interpreters():
+    assert ac.daemon_mismatch({"python": sys.executable, "prefix": sys.prefix}) is None
+    assert "this command uses /opt/other/python" in ac.daemon_mismatch({"python": "/opt/other/python",
+                                                                         "prefix": "/opt/other"})
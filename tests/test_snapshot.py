@@ -0,0 +1,20 @@
+import autocoder as ac
+
+
+def test_rank_blocks_prefers_matching_file():
+    blocks = [{"path": "db.py", "content": "def connect(): pass\n", "sha256": "1"},
+              {"path": "user_auth.py", "content": "def login(user, password): pass\n", "sha256": "2"},
+              {"path": "util.py", "content": "X = 1\n", "sha256": "3"}]
+    ranked = ac.rank_blocks(blocks, "fix the login password check")
+    assert ranked[0][1]["path"] == "user_auth.py"
+    assert ranked[0][0] > ranked[-1][0]
+
+
+def test_snapshot_keeps_the_relevant_file_when_over_budget():
+    filler = [{"path": "mod%d.txt" % i, "content": "lorem ipsum dolor\n" * 200, "sha256": "f%d" % i}
+              for i in range(10)]
+    target = {"path": "billing.txt", "content": "invoice total is computed here\n", "sha256": "t"}
+    snap = ac.render_snapshot(filler + [target], budget=1_500, query="wrong invoice total")
+    assert "===== billing.txt =====" in snap
+    assert "billing.txt" in snap.split("FILES:")[0]            # every path stays in the tree listing
+    assert "SNAPSHOT TRUNCATED" in snap
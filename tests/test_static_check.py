@@ -0,0 +1,24 @@
+import autocoder as ac
+
+
+def test_static_check_reports_without_running(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text("")
+    (tmp_path / "pkg" / "util.py").write_text("from . import helpers\nfrom .gone import x\n")
+    (tmp_path / "pkg" / "helpers.py").write_text("X = 1\n")
+    (tmp_path / "main.py").write_text(
+        "open('ran.txt', 'w').close()\n"
+        "import os, requests\n"
+        "import pkg.util\n"
+        "try:\n    import pkg.optional\nexcept ImportError:\n    pass\n")
+    report = ac.static_check(tmp_path, "main.py")
+    assert "'.gone' not found" in report and 'File "pkg/util.py", line 2' in report
+    assert "requests" not in report and "optional" not in report and "helpers" not in report
+    assert not (tmp_path / "ran.txt").exists()
+
+    (tmp_path / "pkg" / "gone.py").write_text("x = 1\n")
+    assert ac.static_check(tmp_path, "main.py") is None
+    (tmp_path / "pkg" / "helpers.py").write_text("def broken(:\n")
+    assert "SyntaxError" in ac.static_check(tmp_path, "main.py")
+    assert ac.static_check(tmp_path, "main.py", paths=["main.py"]) is None
+    assert "entrypoint 'app.py' does not exist" in ac.static_check(tmp_path, "app.py", paths=[])
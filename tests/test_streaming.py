@@ -0,0 +1,29 @@
+import json
+
+import autocoder as ac
+
+
+def test_files_land_while_the_response_streams(tmp_path, monkeypatch):
+    text = "Here you go:\n" + json.dumps({"entrypoint": "a.py", "files": [
+        {"path": "a.py", "content": "import b\n"}, {"path": "pkg/b.py", "content": "B = 1\n"}]})
+    cut = text.index('{"path": "pkg/b.py"')
+    seen_mid_stream = []
+
+    def fake_stream(model, prompt, options=None, template=""):
+        yield text[:cut]
+        seen_mid_stream.append((tmp_path / "a.py").exists())
+        yield text[cut:]
+
+    monkeypatch.setattr(ac, "ollama_stream", fake_stream)
+    entry, files, delete = ac.generate_files("m", "task", tmp_path, stream=True)
+    assert seen_mid_stream == [True]
+    assert entry == "a.py" and [f["path"] for f in files] == ["a.py", "pkg/b.py"]
+    assert (tmp_path / "pkg" / "b.py").read_text() == "B = 1\n"
+
+
+def test_streamed_generation_against_mock_server(tmp_path, mock_ollama):
+    files = [{"path": "f%d.py" % i, "content": "X = %d\n" % i * 50} for i in range(20)]
+    mock_ollama(lambda prompt: json.dumps({"entrypoint": "f0.py", "files": files}))
+    entry, got, _ = ac.generate_files("m", "task", tmp_path, stream=True)
+    assert entry == "f0.py" and len(got) == 20
+    assert (tmp_path / "f19.py").read_text() == "X = 19\n" * 50
@@ -0,0 +1,16 @@
+import autocoder as ac
+
+
+def test_runs_in_one_process_get_distinct_ids(tmp_path):
+    try:
+        for _ in range(3):      # what serve does per command, usually within the same second
+            ac.configure_tracing(tmp_path, command="run")
+            with ac.Span("phase-a"):
+                pass
+            ac.finish_tracing()
+    finally:
+        ac.configure_tracing(None, enabled=False)
+    stats = ac.trace_stats(tmp_path)
+    assert stats["phase-a"]["count"] == 3 and stats["phase-a"]["runs"] == 3
+    assert set(ac.trace_stats(tmp_path, runs=1)) == {"phase-a", "command:run"}
+    assert ac.trace_stats(tmp_path, runs=1)["phase-a"]["count"] == 1
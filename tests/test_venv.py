@@ -0,0 +1,24 @@
+import json
+import sys
+
+import autocoder as ac
+
+
+def test_normalize_requirements():
+    text = "Flask_Login >= 0.6  # auth\n\nrequests\nrequests\n# comment\nzope.interface\n"
+    assert ac.normalize_requirements(text) == ["flask-login>=0.6", "requests", "zope-interface"]
+
+
+def test_pool_key_is_the_normalized_requirement_set(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    for root, text in ((a, "requests\nFlask\n"), (b, "flask  # web\nRequests\n")):
+        root.mkdir()
+        (root / "requirements.txt").write_text(text)
+        (root / ac.MANIFEST_NAME).write_text(json.dumps({"venv": True}))
+    assert ac.requirements_hash(a) == ac.requirements_hash(b)
+    assert ac._env_dir(ac.requirements_hash(a)).parent == ac.venv_pool_dir()
+    (b / ac.MANIFEST_NAME).write_text(json.dumps({"venv": True, "extra_requirements": ["numpy"]}))
+    assert ac.requirements_hash(a) != ac.requirements_hash(b)
+    (b / ac.MANIFEST_NAME).write_text(json.dumps({"extra_requirements": ["numpy"]}))
+    assert ac.requirements_hash(a) == ac.requirements_hash(b)    # extras only count for pooled envs
+    assert ac.project_python(b) == sys.executable
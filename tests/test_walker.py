@@ -0,0 +1,53 @@
+import autocoder as ac
+
+
+def _rules(*lines, base=""):
+    return [r for r in (ac.compile_ignore(line, base) for line in lines) if r]
+
+
+def test_ignore_patterns():
+    rules = _rules("*.log", "build/", "/top.txt", "!keep.log", "docs/**/*.tmp")
+    assert ac.is_ignored(rules, "a/b/x.log", False)
+    assert not ac.is_ignored(rules, "keep.log", False)
+    assert ac.is_ignored(rules, "src/build", True)
+    assert not ac.is_ignored(rules, "src/build", False)
+    assert ac.is_ignored(rules, "top.txt", False)
+    assert not ac.is_ignored(rules, "sub/top.txt", False)
+    assert ac.is_ignored(rules, "docs/a/b/c.tmp", False)
+
+
+def test_ignore_rules_are_relative_to_their_dir():
+    rules = _rules("*.txt", base="pkg")
+    assert ac.is_ignored(rules, "pkg/notes.txt", False)
+    assert not ac.is_ignored(rules, "notes.txt", False)
+
+
+def test_discover_files_honours_gitignore(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\nout/\n")
+    (tmp_path / "main.py").write_text("print(1)\n")
+    (tmp_path / "debug.log").write_text("x\n")
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "gen.py").write_text("y\n")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / ".gitignore").write_text("secret.py\n")
+    (tmp_path / "pkg" / "secret.py").write_text("z\n")
+    (tmp_path / "pkg" / "mod.py").write_text("w\n")
+    (tmp_path / "venv").mkdir()
+    (tmp_path / "venv" / "pyvenv.cfg").write_text("home = /usr\n")
+    (tmp_path / "venv" / "lib.py").write_text("v\n")
+    files = ac.discover_files(tmp_path)
+    assert "main.py" in files and "pkg/mod.py" in files
+    assert not {"debug.log", "out/gen.py", "pkg/secret.py", "venv/lib.py"} & set(files)
+
+
+def test_discover_files_reports_skipped_files(tmp_path):
+    (tmp_path / ".autocoderignore").write_text("data.csv\n")
+    (tmp_path / "main.py").write_text("print(1)\n")
+    (tmp_path / "data.csv").write_text("1,2\n")
+    (tmp_path / "image.png").write_bytes(b"\x89PNG\0\0\0")
+    (tmp_path / "huge.txt").write_text("x" * (ac.MAX_FILE_BYTES + 1))
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "dep.js").write_text("1\n")
+    skipped = []
+    assert ac.discover_files(tmp_path, skipped) == [".autocoderignore", "main.py"]
+    assert sorted(s[0] for s in skipped) == ["data.csv", "huge.txt", "image.png"]   # pruned dirs aren't listed
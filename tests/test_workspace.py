@@ -0,0 +1,55 @@
+import os
+
+import autocoder as ac
+
+
+def _project(root):
+    root.mkdir()
+    (root / "main.py").write_text(
+        "print(open('datasets/big.csv').read().strip())\n"
+        "with open('app.db', 'a') as f:\n    f.write('row\\n')\n")
+    (root / "app.db").write_text("")
+    (root / ".gitignore").write_text("datasets/\n")
+    (root / "datasets").mkdir()
+    (root / "datasets" / "big.csv").write_text("1,2,3\n")
+    (root / ".git").mkdir()
+    (root / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+    (root / "env").mkdir()
+    (root / "env" / "pyvenv.cfg").write_text("home = /usr\n")
+    return root
+
+
+def test_clone_isolates_writes_and_promotes_changes(tmp_path):
+    root = _project(tmp_path / "proj")
+    with ac.Workspace(root, "copy") as ws:
+        assert ws.run("main.py")[1].strip() == "1,2,3"
+        assert (root / "app.db").read_text() == ""      # the program's write stayed in the clone
+        (ws.path / "util.py").write_text("X = 1\n")
+        (ws.path / "main.py").unlink()
+        assert ws.changes() == (["app.db", "util.py"], ["main.py"])
+        ws.promote()
+        assert not ws.path.exists()
+    assert (root / "util.py").exists() and not (root / "main.py").exists()
+    assert (root / "app.db").read_text() == "row\n"
+
+
+def test_ignored_dirs_are_shared_and_tool_dirs_skipped(tmp_path):
+    root = _project(tmp_path / "proj")
+    ws = ac.Workspace(root, "copy")
+    try:
+        assert ws.shared == ["datasets"] and os.path.islink(ws.path / "datasets")
+        assert not (ws.path / ".git").exists() and not (ws.path / "env").exists()
+        assert "datasets/big.csv" not in ws.base
+    finally:
+        ws.discard()
+    assert (root / "datasets" / "big.csv").read_text() == "1,2,3\n"    # discard only unlinks the share
+
+
+def test_copy_fallback_warns_once_per_project(tmp_path, monkeypatch, capsys):
+    root = _project(tmp_path / "proj")
+    (root / "blob.bin").write_bytes(b"\0" * 2048)
+    monkeypatch.setattr(ac, "WORKSPACE_COPY_WARN_BYTES", 1024)
+    monkeypatch.setattr(ac, "_COPY_WARNED", set())
+    for _ in range(2):
+        ac.Workspace(root, "copy").discard()
+    assert capsys.readouterr().out.count(".autocoderignore") == 1